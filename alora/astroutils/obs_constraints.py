@@ -3,7 +3,7 @@
 
 import os
 import json
-from .observing_utils import get_angle, get_centroid, get_current_sidereal_time, dateToSidereal, find_transit_time, get_sunrise_sunset, get_hour_angle, angleToTimedelta, ensureFloat, ensureAngle, wrap_around, sidereal_rate, current_dt_utc
+from .observing_utils import get_angle, get_centroid, get_current_sidereal_time, dateToSidereal, find_transit_time, get_sunrise_sunset, get_hour_angle, angleToTimedelta, ensureFloat, ensureFloatArray, ensureAngle, wrap_around, sidereal_rate, current_dt_utc
 import pytz, time
 from datetime import datetime, timedelta, timezone
 from astral import sun, LocationInfo
@@ -54,6 +54,30 @@ pos_x_y = _bbox_y[_bbox_x>=0]
 bbox_x = np.concatenate([neg_x,pos_x[::-1],[neg_x[0]]])
 bbox_y = np.concatenate([neg_x_y,pos_x_y[::-1],[neg_x_y[0]]])
 
+def first_windows(mask, counts):
+    """
+    Find the first run of True in each of several boolean series that have been concatenated into mask
+    @param mask: boolean array, the series one after the other
+    @param counts: length of each series
+    @return: (has_window, start, end): boolean array of which series have a True at all, and for each series the index into mask of its first True and of the first False after that (or of its last element, if it stays True)
+    """
+    mask = np.asarray(mask, dtype=bool)
+    counts = np.asarray(counts, dtype=int)
+    ends = np.cumsum(counts)
+    firsts = ends - counts
+    previous = np.zeros_like(mask)
+    previous[1:] = mask[:-1]
+    previous[firsts[counts > 0]] = False  # a series doesn't continue the one before it
+    rises = np.flatnonzero(mask & ~previous)
+    falls = np.flatnonzero(~mask & previous)
+    r = np.searchsorted(rises, firsts)
+    start = rises[np.minimum(r, len(rises) - 1)] if len(rises) else np.zeros(len(counts), dtype=int)
+    has_window = (r < len(rises)) & (start < ends)
+    f = np.searchsorted(falls, start)
+    fall = falls[np.minimum(f, len(falls) - 1)] if len(falls) else np.zeros(len(counts), dtype=int)
+    end = np.where((f < len(falls)) & (fall < ends), fall, ends - 1)
+    return has_window, start, end
+
 
 class ObsConstraint:
     def __init__(self, flip_box=False):
@@ -189,6 +213,57 @@ class ObsConstraint:
         sunrise, sunset = self.get_sunrise_sunset(dt)
         return sunset < dt < sunrise
 
+    def hour_angle_limits(self, decs):
+        """
+        Array version of get_hour_angle_limits.
+        @param decs: declinations: an array of degrees, an Angle array, or a sequence of anything ensureFloat takes (e.g. Angles)
+        @return: (ha_min, ha_max, in_box): arrays of the hour angle limits in degrees (nan where the dec isn't covered by the box) and a boolean mask of the decs that are covered
+        """
+        decs = ensureFloatArray(decs)
+        dec_ranges = np.array(list(self.horizon_box.keys()), dtype=float).reshape(-1, 2)
+        ha_ranges = np.array(list(self.horizon_box.values()), dtype=float).reshape(-1, 2)
+        matches = (dec_ranges[:, 0] < decs[:, None]) & (decs[:, None] <= dec_ranges[:, 1])
+        in_box = matches.any(axis=1)
+        first_match = matches.argmax(axis=1)  # like get_hour_angle_limits, the first range in the box that matches wins
+        ha_min = np.where(in_box, ha_ranges[first_match, 0], np.nan)
+        ha_max = np.where(in_box, ha_ranges[first_match, 1], np.nan)
+        return ha_min, ha_max, in_box
+
+    def hour_angles(self, dts, ras, current_sidereal_time=None):
+        """
+        Array version of get_hour_angle.
+        @param dts: sequence of datetimes
+        @param ras: RAs, in any of the forms hour_angle_limits takes decs in
+        @return: array of hour angles in degrees, wrapped to [-180, 180)
+        """
+        current_sidereal_time = current_sidereal_time if current_sidereal_time is not None else self.get_obs_lst()
+        now = current_dt_utc().timestamp()
+        seconds = np.fromiter((dt.timestamp() for dt in dts), dtype=float, count=len(dts)) - now
+        sidereal = current_sidereal_time.deg + seconds * 1.0027 / 3600 * 15  # same offset as dateToSidereal
+        return wrap_around(sidereal - ensureFloatArray(ras))
+
+    def night_mask(self, dts):
+        """ Is it night at TMO at each of the times dts? Each distinct time is only checked once"""
+        night = {dt: self.is_at_night(dt) for dt in set(dts)}
+        return np.fromiter((night[dt] for dt in dts), dtype=bool, count=len(dts))
+
+    def observation_viable_many(self, dts, ras, decs, current_sidereal_time=None, ignore_night=False):
+        """
+        Array version of observation_viable: can a target at ras[i], decs[i] be observed at time dts[i], for every i?
+        @param dts: sequence of datetimes
+        @param ras: RAs, as for hour_angles
+        @param decs: Decs, as for hour_angle_limits
+        @return: boolean array
+        """
+        ha_min, ha_max, viable = self.hour_angle_limits(decs)
+        HA = self.hour_angles(dts, ras, current_sidereal_time)
+        viable[viable] &= (ha_min[viable] <= HA[viable]) & (HA[viable] < ha_max[viable])  # same bounds as Angle.is_within_bounds
+        if not ignore_night and viable.any():
+            # the sunrise/sunset calculation is by far the slowest part, so only do it for times that pass the HA check
+            idx = np.flatnonzero(viable)
+            viable[idx] = self.night_mask([dts[i] for i in idx])
+        return viable
+
     def observability_mask(self,table:QTable,current_sidereal_time=None,ra_column="ra",dec_column="dec",dt_or_column="dt", ignore_night=False):
         """ Take a table of candidates and return a mask of which ones are observable at the given time (or times if dt_or_column is the name of a column)"""
         current_sidereal_time = current_sidereal_time if current_sidereal_time is not None else self.get_obs_lst()
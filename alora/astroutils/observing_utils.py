@@ -139,6 +139,19 @@ def ensureFloat(angle):
         return float(angle)
 
 
+def ensureFloatArray(angles):
+    """!
+    Array version of ensureFloat
+    @param angles: an array of degrees, an astropy Angle (or other angular Quantity) array, or a sequence of anything ensureFloat takes
+    @return: float array of the angles in degrees
+    """
+    if isinstance(angles, u.Quantity):
+        return np.atleast_1d(angles.to_value("degree")).astype(float)
+    if isinstance(angles, np.ndarray) and angles.dtype.kind in "fiu":
+        return angles.astype(float)
+    return np.fromiter((ensureFloat(a) for a in angles), dtype=float, count=len(angles))
+
+
 def ensureAngle(angle):
     """!
     Return angle as an astropy Angle, converting if necessary
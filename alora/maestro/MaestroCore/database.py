@@ -26,6 +26,7 @@ def main():
         from alora.maestro.scheduleLib import genUtils
         from alora.maestro.scheduleLib.genUtils import write_out
         from alora.maestro.scheduleLib.module_loader import ModuleManager
+        from alora.maestro.scheduleLib.candidateDatabase import CandidateDatabase, ArchivePolicy
 
         logger = genUtils.configure_logger("DbUpdater")
 
@@ -61,6 +62,18 @@ def main():
                     errors += 1
                 else:
                     write_out(f"DbUpdater: Result:DbUpdater successfully ran program {run}/{total} ({name}).")
+            if maestro_settings.get("do_archive_candidates", True):
+                try:
+                    db = CandidateDatabase(dbPath, "DbUpdater")
+                    archived = db.archiveStale(ArchivePolicy.from_settings(maestro_settings))
+                    db.close()
+                except Exception as e:
+                    write_out(f"DbUpdater: Error:DbUpdater failed to archive stale candidates: '{e}'.")
+                    write_crash_report(os.path.join("DbUpdater", "archive"), e)
+                    errors += 1
+                else:
+                    if archived:
+                        write_out(f"DbUpdater: Result:Archived {len(archived)} stale candidates.")
             if errors == 0:
                 write_out(f"DbUpdater: CLEAR_ERROR (clear any error status because all programs ran successfully)")
             time.sleep(0.1)
@@ -0,0 +1,378 @@
+# Sage Santomenna 2025
+# simulated annealing refinement of the greedy TMOScheduler schedule, built on the operations of ModularSchedule
+
+import math
+import random
+import re
+import time
+from bisect import bisect_right
+
+import numpy as np
+import astropy.units as u
+from astroplan import ObservingBlock, TransitionBlock
+
+from alora.maestro.schedule import ModularSchedule, AddBlock, RemoveBlock, AddObservation, RemoveObservation, \
+    ScheduleOperationError
+
+
+class _Rejected(Exception):
+    """raised when a proposed move would make the schedule invalid"""
+    pass
+
+
+class _BlockSet:
+    """set of blocks, keyed by id, with constant-time add, discard and random choice"""
+
+    def __init__(self, blocks=()):
+        self._blocks = []
+        self._positions = {}  # id(block) : index into self._blocks
+        for b in blocks:
+            self.add(b)
+
+    def add(self, block):
+        if id(block) not in self._positions:
+            self._positions[id(block)] = len(self._blocks)
+            self._blocks.append(block)
+
+    def discard(self, block):
+        pos = self._positions.pop(id(block), None)
+        if pos is None:
+            return
+        last = self._blocks.pop()
+        if pos < len(self._blocks):  # move the last block into the hole
+            self._blocks[pos] = last
+            self._positions[id(last)] = pos
+
+    def choice(self, rng, exclude=None):
+        """random block from the set, other than exclude. None if there isn't one"""
+        n = len(self._blocks) - (exclude is not None and id(exclude) in self._positions)
+        if n <= 0:
+            return None
+        i = rng.randrange(n)
+        if exclude is not None and i >= self._positions.get(id(exclude), n + 1):
+            i += 1  # skip over exclude's position
+        return self._blocks[i]
+
+    def __contains__(self, block):
+        return id(block) in self._positions
+
+    def __len__(self):
+        return len(self._blocks)
+
+
+class TypeTransitioner:
+    def __init__(self, transitioners):
+        """!
+        Pick between the per-type transitioners the way TMOScheduler does: use the transitioner of the type being
+        transitioned away from, unless that's a focus loop, in which case use the type being transitioned to
+        @param transitioners: {object type: astroplan Transitioner}
+        """
+        self.transitioners = transitioners
+
+    def __call__(self, oldblock, newblock, start_time, observer):
+        if not isinstance(oldblock, ObservingBlock) or not isinstance(newblock, ObservingBlock):
+            return None
+        objType = oldblock.configuration["type"]
+        if objType == "Focus":
+            objType = newblock.configuration["type"]
+        transitioner = self.transitioners.get(objType)
+        if transitioner is None:
+            return None
+        transition = transitioner(oldblock, newblock, start_time, observer)
+        if transition is None or transition.duration <= 0 * u.second:
+            return None
+        return transition
+
+
+class ScheduleAnnealer:
+    def __init__(self, modularSchedule: ModularSchedule, blocks: dict, scoreRows: dict, configDict, transitioner,
+                 observer, excludedTimeRanges=(), fillWeight=1.0, maxShift=15, seed=None):
+        """!
+        Improve a schedule by simulated annealing. Each move (add, remove, swap, or shift an observation) is made with
+        ModularSchedule operations and rolled back if it's invalid or rejected, and its cost is computed from only the
+        observations it touches, so an iteration costs about the same no matter how full the schedule is.
+        Focus loops are never moved, so the focus rule only has to be checked for the observations a move places.
+        @param modularSchedule: the ModularSchedule to start from. modified in place
+        @param blocks: {priority: list of ObservingBlocks}, every block that could be scheduled
+        @param scoreRows: {id(block): ScoreRow of that block's scores on the schedule's time grid}. blocks without a row are never moved
+        @param configDict: {type of candidate (block.configuration["type"]) : TypeConfiguration object}
+        @param transitioner: callable (old block, new block, start time, observer) -> TransitionBlock or None
+        @param observer: astroplan Observer
+        @param excludedTimeRanges: list[(tuple(int(startSeconds),int(endSeconds))], times no observation may be placed in
+        @param fillWeight: reward per minute of observing time, on top of the block's score. higher values favor fuller schedules
+        @param maxShift: the furthest, in time grid steps, that a shift move will move an observation
+        @param seed: optional. seed for the random number generator, so that a run can be reproduced
+        """
+        self.schedule = modularSchedule
+        self.scoreRows = scoreRows
+        self.configDict = configDict
+        self.transitioner = transitioner
+        self.observer = observer
+        self.fillWeight = fillWeight
+        self.maxShift = maxShift
+        self.rng = random.Random(seed)
+
+        self.resolution = modularSchedule.time_resolution.to(u.second).value
+        self.priorities = {id(b): p for p, blockList in blocks.items() for b in blockList}
+        self.candidates = [b for blockList in blocks.values() for b in blockList
+                           if id(b) in scoreRows and b.configuration["type"] != "Focus"]
+        self._candidateKeys = {id(b) for b in self.candidates}
+        self._nonzero = {}  # id(block) : grid indices where the block's score is nonzero, filled lazily
+
+        start = modularSchedule.start_time
+        self.excluded = np.zeros(modularSchedule.num_chunks, dtype=bool)
+        for r in excludedTimeRanges:
+            # round outward, like TMOScheduler does, so a slot that is only partly excluded is excluded
+            iStart, iEnd = max(math.floor((r[0] - start.unix) / self.resolution), 0), min(
+                math.ceil((r[1] - start.unix) / self.resolution), modularSchedule.num_chunks)
+            self.excluded[iStart:iEnd] = True
+
+        # focus loops don't move, so the time of the most recent focus before any point can be looked up by bisection
+        # (the start of the schedule counts as a focus, like it does in TMOScheduler)
+        self.focusTimes = sorted([0.0] + [(b.start_time - start).sec for b in modularSchedule.blocks.values()
+                                          if isinstance(b, ObservingBlock) and b.configuration["type"] == "Focus"])
+
+        # which observations are placed, and when, indexed every way a move needs to look them up. kept up to date by
+        # _set_placed so that no move has to scan the whole schedule
+        self.placed = {}  # id(block) : (block, start time)
+        self._placedSet = _BlockSet()
+        self._unplacedSet = _BlockSet(self.candidates)
+        self._placedByType = {}  # block type : _BlockSet of the placed blocks of that type
+        self._startsByName = {}  # target name without repeat suffix : {id(block): start, in seconds after schedule start}
+        for b in modularSchedule.blocks.values():
+            if id(b) in scoreRows:
+                self._set_placed(b, b.start_time)
+        self.energy = -sum(self.reward(b, t) for b, t in self.placed.values())
+        self.stats = {"iterations": 0, "accepted": 0, "invalid": 0, "initial_energy": float(self.energy),
+                      "best_energy": self.energy}
+
+    @classmethod
+    def from_schedule(cls, schedule, tmoScheduler, blocks: dict, excludedTimeRanges=(), **kwargs):
+        """!
+        Start an annealer from a schedule made by a TMOScheduler
+        @param schedule: the astroplan Schedule the TMOScheduler populated
+        @param tmoScheduler: the TMOScheduler, after it has been called. its score matrix and transitioners are reused
+        @param blocks: {priority: list of ObservingBlocks}, as passed to (and extended by) the TMOScheduler
+        @param excludedTimeRanges: the excluded time ranges the TMOScheduler was given
+        @param kwargs: passed to the constructor
+        @raise ScheduleOperationError: if the schedule can't be represented on the ModularSchedule's time grid
+        """
+        modularSchedule = ModularSchedule(schedule.start_time, schedule.end_time, tmoScheduler.time_resolution)
+        for b in schedule.scheduled_blocks:
+            if isinstance(b, TransitionBlock) and b.duration <= 0 * u.second:
+                continue
+            AddBlock(b, b.start_time).add_to_schedule(modularSchedule)
+        scoreRows = {k: tmoScheduler.score_matrix[row] for k, row in tmoScheduler.block_rows.items()}
+        return cls(modularSchedule, blocks, scoreRows, tmoScheduler.configDict,
+                   TypeTransitioner(tmoScheduler.transitioners), tmoScheduler.observer, excludedTimeRanges, **kwargs)
+
+    def _grid_index(self, t):
+        return int(np.floor(round((t - self.schedule.start_time).sec / self.resolution, 6)))
+
+    @staticmethod
+    def _name(block):
+        return re.sub('_\\d', '', block.target.name)
+
+    def _set_placed(self, block, t):
+        """record that block now starts at t, or isn't in the schedule if t is None"""
+        key, blockType, name = id(block), block.configuration["type"], self._name(block)
+        if t is None:
+            self.placed.pop(key, None)
+            self._placedSet.discard(block)
+            self._placedByType.get(blockType, _BlockSet()).discard(block)
+            self._startsByName.get(name, {}).pop(key, None)
+            if key in self._candidateKeys:
+                self._unplacedSet.add(block)
+            return
+        self.placed[key] = (block, t)
+        self._placedSet.add(block)
+        self._placedByType.setdefault(blockType, _BlockSet()).add(block)
+        self._startsByName.setdefault(name, {})[key] = (t - self.schedule.start_time).sec
+        self._unplacedSet.discard(block)
+
+    def reward(self, block, t):
+        """!
+        The reward for observing block at time t: minutes of observing time, weighted by the block's score at t and
+        divided by its priority tier (1 is the highest)
+        """
+        row = self.scoreRows[id(block)]
+        idx = self._grid_index(t)
+        score = row[idx]  # zero outside of the row's nonzero span, including off either end of the grid
+        return block.duration.to(u.minute).value * (self.fillWeight + score) / self.priorities.get(id(block), 1)
+
+    def _check(self, block, t, changes):
+        """raise _Rejected if block can't be observed at t, given the tentative placements in changes (see _move)"""
+        idx = self._grid_index(t)
+        # round the end up, like TMOScheduler does, so a block that ends partway through a slot still claims that slot
+        endIdx = math.ceil(round(((t - self.schedule.start_time).sec + block.duration.to(u.second).value) / self.resolution, 6))
+        row = self.scoreRows[id(block)]
+        if idx < 0 or endIdx > len(row) or row.has_zero(idx, endIdx):
+            raise _Rejected
+        if self.excluded[idx:max(endIdx, idx + 1)].any():
+            raise _Rejected
+        config = self.configDict[block.configuration["type"]]
+        # focus loops don't move, so only the observations being placed can break the focus rule
+        offset = (t - self.schedule.start_time).sec
+        lastFocus = self.focusTimes[bisect_right(self.focusTimes, offset) - 1]
+        if offset + block.duration.to(u.second).value - lastFocus >= config.maxMinutesWithoutFocus * 60:
+            raise _Rejected
+        if config.minMinutesBetweenObs:
+            name = self._name(block)
+            others = {k: o for k, o in self._startsByName.get(name, {}).items() if k not in changes}
+            others.update({k: (ct - self.schedule.start_time).sec for k, (b, ct) in changes.items()
+                           if ct is not None and self._name(b) == name})
+            for key, otherOffset in others.items():
+                if key != id(block) and abs(offset - otherOffset) < config.minMinutesBetweenObs * 60:
+                    raise _Rejected
+
+    def _insert(self, block, t):
+        """place an observation at t, replacing the transition (if any) that it now sits in front of"""
+        ms = self.schedule
+        following = ms.block_after(ms.index_of(t))
+        if isinstance(following, TransitionBlock):
+            RemoveBlock(following, following.start_time).add_to_schedule(ms)
+        AddObservation(block, t, self.observer, self.transitioner).add_to_schedule(ms)
+
+    def _extract(self, block):
+        """remove an observation and its transitions, then bridge the gap it leaves with a transition if one is needed"""
+        ms = self.schedule
+        idx = ms.index_of(block.start_time)
+        RemoveObservation(block, block.start_time, self.observer, self.transitioner).add_to_schedule(ms)
+        previous, following = ms.block_before(idx), ms.block_after(idx)
+        if previous is None or following is None:
+            return
+        transition = self.transitioner(previous, following, following.start_time, self.observer)
+        if transition is not None:
+            transition.start_time = ms.latest_start(following.start_time, transition.duration)
+            AddBlock(transition, transition.start_time).add_to_schedule(ms)
+
+    def _random_start(self, block):
+        nonzero = self._nonzero.get(id(block))
+        if nonzero is None:
+            nonzero = self._nonzero[id(block)] = self.scoreRows[id(block)].nonzero()
+        if not len(nonzero):
+            raise _Rejected
+        return self.schedule.time_of(int(nonzero[self.rng.randrange(len(nonzero))]))
+
+    def _move(self):
+        """!
+        Make one random move
+        @return: {id(block): (block, new start time or None if removed)} for every observation the move touched
+        """
+        kind = self.rng.choice(("add", "remove", "swap", "shift"))
+        if kind == "add" or not len(self._placedSet):
+            block = self._unplacedSet.choice(self.rng)
+            if block is None:
+                raise _Rejected
+            t = self._random_start(block)
+            changes = {id(block): (block, t)}
+            self._check(block, t, changes)
+            self._insert(block, t)
+        elif kind == "remove":
+            block = self._placedSet.choice(self.rng)
+            changes = {id(block): (block, None)}
+            self._extract(block)
+        elif kind == "swap":
+            block1 = self._placedSet.choice(self.rng)
+            block2 = self._placedByType[block1.configuration["type"]].choice(self.rng, exclude=block1)
+            if block2 is None:
+                raise _Rejected
+            t1, t2 = self.placed[id(block1)][1], self.placed[id(block2)][1]
+            changes = {id(block1): (block1, t2), id(block2): (block2, t1)}
+            self._check(block1, t2, changes)
+            self._check(block2, t1, changes)
+            # take both out and put them back so that the transitions around each are rebuilt for its new neighbors
+            self._extract(block1)
+            self._extract(block2)
+            self._insert(block1, t2)
+            self._insert(block2, t1)
+        else:
+            block = self._placedSet.choice(self.rng)
+            t = self.placed[id(block)][1]
+            step = self.rng.randint(1, self.maxShift) * self.rng.choice((-1, 1))
+            newT = self.schedule.time_of(self._grid_index(t) + step)
+            changes = {id(block): (block, newT)}
+            self._check(block, newT, changes)
+            self._extract(block)
+            self._insert(block, newT)
+        return changes
+
+    def _delta(self, changes):
+        delta = 0
+        for key, (block, t) in changes.items():
+            if key in self.placed:
+                delta += self.reward(*self.placed[key])
+            if t is not None:
+                delta -= self.reward(block, t)
+        return delta
+
+    def _accept(self, changes, journal):
+        """apply a move's changes to the placement indexes, recording what they replaced in journal so it can be undone"""
+        for key, (block, t) in changes.items():
+            previous = self.placed.get(key)
+            journal.append((block, previous[1] if previous is not None else None))
+            self._set_placed(block, t)
+
+    def _undo(self, checkpoint, journal):
+        """return the schedule and the placement indexes to the state they were in when checkpoint was taken and journal was empty"""
+        self.schedule.rollback(checkpoint)
+        for block, t in reversed(journal):
+            self._set_placed(block, t)
+        journal.clear()
+
+    def run(self, max_iterations=None, max_seconds=None, initial_temperature=None, cooling=0.999):
+        """!
+        Anneal until the iteration or time budget runs out, then leave the schedule in the best state found
+        @param max_iterations: optional. stop after this many moves
+        @param max_seconds: optional. stop after this much wall time. if neither budget is given, 1000 moves are made
+        @param initial_temperature: optional. defaults to a tenth of the mean reward of the observations in the starting schedule
+        @param cooling: the temperature is multiplied by this after every move
+        @return: the ModularSchedule, in its best state
+        """
+        if max_iterations is None and max_seconds is None:
+            max_iterations = 1000
+        if initial_temperature is None:
+            rewards = [self.reward(b, t) for b, t in self.placed.values()]
+            initial_temperature = 0.1 * np.mean(rewards) if rewards else 1.0
+        temperature = initial_temperature
+        deadline = time.perf_counter() + max_seconds if max_seconds else None
+        # the best state is kept as a checkpoint of the schedule plus a journal of the placements changed since, so that
+        # recording a new best is free and going back to it only undoes the moves made after it
+        bestCheckpoint, bestEnergy, journal = self.schedule.checkpoint(), self.energy, []
+
+        while (max_iterations is None or self.stats["iterations"] < max_iterations) \
+                and (deadline is None or time.perf_counter() < deadline):
+            self.stats["iterations"] += 1
+            checkpoint = self.schedule.checkpoint()
+            try:
+                changes = self._move()
+            except (_Rejected, ScheduleOperationError):
+                self.schedule.rollback(checkpoint)
+                self.stats["invalid"] += 1
+                temperature *= cooling
+                continue
+            delta = self._delta(changes)
+            if delta <= 0 or self.rng.random() < math.exp(-delta / max(temperature, 1e-12)):
+                self.stats["accepted"] += 1
+                self.energy += delta
+                self._accept(changes, journal)
+                if self.energy < bestEnergy - 1e-9:
+                    bestCheckpoint, bestEnergy = self.schedule.checkpoint(), self.energy
+                    journal.clear()
+            else:
+                self.schedule.rollback(checkpoint)
+            temperature *= cooling
+
+        if self.energy > bestEnergy:
+            self._undo(bestCheckpoint, journal)
+            self.energy = bestEnergy
+        self.stats["best_energy"] = float(self.energy)
+        return self.schedule
+
+    def to_schedule(self):
+        """!
+        Compute the astroplan Schedule for the current state
+        """
+        schedule = self.schedule.compute()
+        schedule.observer = self.observer
+        return schedule
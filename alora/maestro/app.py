@@ -48,7 +48,7 @@ def _main():
     from MaestroCore.GUI.MainWindow import Ui_MainWindow
     from MaestroCore.addCandidateDialog import AddCandidateDialog
     from alora.maestro.scheduleLib import genUtils, CANDIDATE_SCHEMA_PATH
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, validFields, has_flag, Flag, set_flag
+    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, validFields, has_flag, Flag, set_flag, active_candidate_types
     from MaestroCore.utils.processes import ProcessModel, Process
     from MaestroCore.utils.tableModel import CandidateTableModel, FlexibleTableModel
     from MaestroCore.utils.listModel import FlexibleListModel, DateTimeRangeListModel, ModuleListEntry
@@ -61,6 +61,7 @@ def _main():
 
     from alora.maestro.scheduleLib.genUtils import inputToAngle, Config
     from alora.maestro.scheduleLib.module_loader import ModuleManager
+    from alora.maestro.scheduler_client import server_available
 
     # VAL_DISPLAY_TYPES = {
     #     "float":QLineEdit,
@@ -245,6 +246,22 @@ def _main():
         def asDict(self):
             return {k: v for k, [v, _] in self.cfg.items()}
 
+    class CandidateLookup(dict):
+        """!
+        Dict of Candidate objects that makes them on first lookup with fetch(key), so that only the candidates the GUI
+        acts on are built. Raises KeyError if fetch returns None
+        """
+        def __init__(self, fetch):
+            super().__init__()
+            self.fetch = fetch
+
+        def __missing__(self, key):
+            candidate = self.fetch(key)
+            if candidate is None:
+                raise KeyError(key)
+            self[key] = candidate
+            return candidate
+
     class MainWindow(QMainWindow, Ui_MainWindow):
         def __init__(self, parent=None):
             super(MainWindow, self).__init__(parent)
@@ -313,9 +330,8 @@ def _main():
             self.indexOfNameColumn = None
             self.sunriseUTC, self.sunsetUTC = None, None
             self.set_sunrise_sunset()
-            self.candidates = None
-            self.all_candidates = None
             self.candidateDf = None
+            self.candidateQuery = ("1=1", [])  # the condition and values that self.candidateDf was queried with
             self.candidatesByID = None
             self.ephemProcess = None
             self.databaseProcess = None
@@ -1140,7 +1156,11 @@ def _main():
 
             # if debug:
             #     self.scheduleProcess.msg.connect(lambda msg: print("Scheduler: ", msg))
-            self.scheduleProcess.start(PYTHON_PATH, [PATH_TO("scheduler.py"),
+            # if a scheduler server is running, hand the request to it instead of starting the scheduler from scratch
+            schedulerScript = PATH_TO("scheduler.py")
+            if self.settings.query("useSchedulerServer") and server_available(self.settings.query("schedulerServerPort")):
+                schedulerScript = PATH_TO("scheduler_client.py")
+            self.scheduleProcess.start(PYTHON_PATH, [schedulerScript,
                                                 str(blacklistedCandidateDesigs), str(whitelistedCandidateDesigs),
                                                 excludedTimeRanges])
             self.set_scheduler_icon(STATUS_BUSY)
@@ -1372,14 +1392,20 @@ def _main():
             self.tabWidget.setCurrentWidget(self.ephemsTab)
 
         def update_whitelist_blacklist(self):
-            whitelisted = [c for c in self.all_candidates if has_flag(c.flags, Flag.WHITELIST)]
+            flagged = self.dbConnection.table_query("Candidates", "*", "flags & ? != 0",
+                                                    [Flag.WHITELIST.value | Flag.BLACKLIST.value],
+                                                    returnAsCandidates=True, skip_errors=True) or []
+            # the lists hold these objects, so the lookups have to hand back the same ones
+            for c in flagged:
+                self.candidatesByID[c.ID] = c
+            whitelisted = [c for c in flagged if has_flag(c.flags, Flag.WHITELIST)]
             self.whitelistModel.clear()
             # self.whitelistModel.deleteLater()
             # self.whitelistModel = FlexibleListModel()
             for c in whitelisted:
                 self.whitelistModel.addItem(c)
 
-            blacklisted = [c for c in self.all_candidates if has_flag(c.flags, Flag.BLACKLIST)]
+            blacklisted = [c for c in flagged if has_flag(c.flags, Flag.BLACKLIST)]
             self.blacklistModel.clear()
             # self.blacklistModel.deleteLater()
             # self.blacklistModel = FlexibleListModel()
@@ -1391,12 +1417,18 @@ def _main():
 
         def getCandidates(self):
             try:
-                self.all_candidates = self.dbConnection.table_query("Candidates", "*", "1=1", [], returnAsCandidates=True,skip_errors=True)
                 if self.settings.query("showAllCandidates"):
-                    self.candidates = self.all_candidates
+                    self.candidateQuery = ("1=1", [])
                 else:
                     logger.info("Showing select")
-                    self.candidates = self.dbConnection.candidatesForTimeRange(self.sunsetUTC, self.sunriseUTC, 0.01,skip_errors=True)
+                    self.candidateQuery = self.dbConnection.timeRangeCondition(self.sunsetUTC, self.sunriseUTC, 0.01)
+                # the table is read straight from the database, without the rows of deactivated modules. Candidate
+                # objects are only made when they're looked up
+                self.candidateDf = self.dbConnection.candidatesAsDataFrame(*self.candidateQuery)
+                if len(self.candidateDf):
+                    self.candidateDf = self.candidateDf.loc[self.candidateDf["CandidateType"].isin(active_candidate_types())].reset_index(drop=True)
+                self.candidatesByID = CandidateLookup(self.dbConnection.getCandidateByID)
+                self.candidateDict = CandidateLookup(self.candidateByName)
             except AttributeError as e:
                 logger.error(f"Couldn't get candidates: {repr(e)} (probably no database)")
                 emsg = "Couldn't find database file. To use Maestro, choose a database under Database > Target Database Location, then press 'Request Restart'"
@@ -1410,7 +1442,7 @@ def _main():
                 self.statusBar().showMessage(f"ERROR: Couldn't get candidates: {repr(e)}", 10000)
                 self.set_candidates_icon(STATUS_ERROR)
                 return self
-            if not self.candidates:
+            if not len(self.candidateDf):
                 self.resetCandidateTable()
                 if debug:
                     logger.warning("No candidates")
@@ -1428,7 +1460,6 @@ def _main():
             return self
     
         def set_candidate_derivatives(self):
-            self.candidateDf = Candidate.candidatesToDf(self.candidates)
             self.update_whitelist_blacklist()
             # order the df columns by the order of the validFields list
             numbered_fields = dict(zip(validFields,np.arange(len(validFields))))
@@ -1436,13 +1467,22 @@ def _main():
             c.sort(key = lambda x: numbered_fields[x])
             self.candidateDf = self.candidateDf.reindex(columns=c)
             
-            self.candidatesByID = {c.ID: c for c in self.all_candidates}
-            self.candidateDict = {c.CandidateName: c for c in self.all_candidates}
             print(self.candidateDf.columns)
             self.indexOfIDColumn = self.candidateDf.columns.get_loc("ID")
             self.indexOfNameColumn = self.candidateDf.columns.get_loc("CandidateName")
             return self
     
+        def candidateByName(self, name):
+            """!
+            The candidate named name: the one shown in the table if there is one, else the last in the database with that
+            name. None if there's no such candidate
+            """
+            shown = self.candidateDf.loc[self.candidateDf["CandidateName"] == name, "ID"]
+            if len(shown):
+                return self.candidatesByID[int(shown.iloc[-1])]
+            res = self.dbConnection.getCandidateByName(name)
+            return res[-1] if res else None
+
         def getEntriesAsCandidates(self, entries, handleErrorFunc=None):
             # strings is a list of strings that can be resolved in this way
             candidates = []
@@ -1526,9 +1566,9 @@ def _main():
             Load the stored candidates into the table. Fetches candidates if has None
             @return:
             """
-            if self.candidates is None and os.path.exists(self.settings.query("candidateDbPath")):
+            if self.candidateDf is None and os.path.exists(self.settings.query("candidateDbPath")):
                 self.getCandidates()
-            if self.candidates:
+            if self.candidateDf is not None and len(self.candidateDf):
                 oldModel = self.candidateTable
                 self.candidateTable = CandidateTableModel(self.candidateDf, self.candidate_schema)
                 self.candidateView.setModel(self.candidateTable)
@@ -14,11 +14,7 @@ if not os.path.exists(db_path):
 
 candidateDb = CandidateDatabase(db_path, "Target Stats Query")
 
-candidateDb.db_cursor.execute("SELECT * FROM Candidates")
-
-candidates = candidateDb.queryToCandidates(candidateDb.db_cursor.fetchall())
-
-df = Candidate.candidatesToDf(candidates)
+df = candidateDb.candidatesAsDataFrame()
 tstamp = datetime.utcnow().strftime('%Y%m%d')
 df.to_csv(f"files/db_csvs/candidates_{tstamp}.csv", index=False)
 
@@ -1,12 +1,9 @@
 # Sage Santomenna 2023
-# program to generate and characterize a schedule. not tested/used in a while, probably needs fixing
+# program to generate and characterize a schedule over a sweep of temperatures
 import os
-import re
 import sys
-import time
 import numpy as np
 import matplotlib.pyplot as plt
-from collections import Counter
 
 from datetime import datetime
 
@@ -15,7 +12,7 @@ import pytz
 from astroplan import Observer
 from astropy.coordinates import EarthLocation
 
-from scheduler import createSchedule, visualizeSchedule
+from alora.maestro.scheduler import searchSchedules, visualizeSchedule
 
 try:
     sys.path.append(
@@ -52,59 +49,36 @@ if __name__ == "__main__":
     overwrite = False
     numRepeats = 2
 
-    logDf = pd.DataFrame(columns=["Temperature", "Fullness", "Runtime", "RepeatObsSuccess"])
-    temperature = 0
-    bestSchedRep = None
-    bestSchedFull = None
-    bestSchedBoth = None
-    bestRep = 0
-    bestFull = 0
-    bestBoth = 0
-    for j in range(10):
-        times = []
-        temperature += 0.1
-        print("Starting loop with temperature {}".format(str(temperature)))
-        for i in range(numRepeats):
-            start = time.time()
-            scheduleDf, blocks, schedule, candidateDict, configDict = createSchedule(TMO, sunsetUTC, sunriseUTC,
-                                                                                     blacklist, whitelist,
-                                                                                     excludedTimeRanges,
-                                                                                     candidateDbPath,
-                                                                                     temperature=temperature)
-            duration = time.time() - start
-            times.append(duration)
-            unused = scheduleDf.loc[scheduleDf["Target"] == "Unused Time"]["Duration (Minutes)"].sum()
-            total = scheduleDf["Duration (Minutes)"].sum()
-            fullness = round(1 - (unused / total), 3)
-            usedDesigsR = [re.sub('_\\d', '', t) for t in scheduleDf["Target"].tolist() if
-                           t != "Unused Time" and t != "Focus" and t != "TransitionBlock"]
-            counts = Counter(usedDesigsR)
-            reqRepeatObs = 0
-            sucRepeatObs = 0
-            for desig in list(counts):
-                reqObs = configDict[candidateDict[desig].CandidateType].numObs
-                if reqObs > 1:
-                    sucObs = counts[desig]
-                    if sucObs < reqObs:
-                        print("{} only got {} out of its {} required observations.".format(desig, str(sucObs), str(reqObs)))
-                    reqRepeatObs += reqObs
-                    sucRepeatObs += sucObs
-            repeatObsSuccess = round(sucRepeatObs / reqRepeatObs, 5) if reqRepeatObs else -1
-            logDf.loc[len(logDf.index)] = [temperature, fullness, duration, repeatObsSuccess]
-            print(repr(schedule) + ",", str(round(fullness * 100)) + "% full, with {}% repeat obs success.".format(
-                str(repeatObsSuccess * 100)))
-            if repeatObsSuccess > bestRep:
-                bestRep = repeatObsSuccess
-                bestSchedRep = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestRepeatSchedule")
-            if fullness > bestFull:
-                bestFull = fullness
-                bestSchedFull = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestFullSchedule")
-            if fullness * repeatObsSuccess > bestBoth:
-                bestBoth = fullness * repeatObsSuccess
-                bestSchedBoth = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestBothSchedule")
-        print("Average runtime, {} loops:".format(str(numRepeats)), np.average(times))
-
-    for sched in [bestSchedRep, bestSchedFull, bestSchedBoth]:
+    budgetSeconds = None  # optional wall-clock limit for the whole sweep
+
+    temperatures = [round(0.1 * (j + 1), 1) for j in range(10)]
+    print("Making {} schedules at temperatures {}".format(str(numRepeats * len(temperatures)), temperatures))
+    results = searchSchedules(TMO, sunsetUTC, sunriseUTC, blacklist, whitelist, excludedTimeRanges, candidateDbPath,
+                              temperatures, numRepeats * len(temperatures), budgetSeconds=budgetSeconds)
+    if not results:
+        sys.exit("No schedules were made.")
+
+    logDf = pd.DataFrame(columns=["Temperature", "Fullness", "Runtime", "RepeatObsSuccess", "Errors", "Score"])
+    for r in results:
+        logDf.loc[len(logDf.index)] = [r["temperature"], r["fullness"], r["runtime"], r["repeatObsSuccess"],
+                                       r["errors"], r["score"]]
+        print("Seed {} (temperature {}): {}% full, with {}% repeat obs success.".format(
+            r["seed"], r["temperature"], str(round(r["fullness"] * 100)), str(r["repeatObsSuccess"] * 100)))
+    for temperature, group in logDf.groupby("Temperature"):
+        print("Average runtime at temperature {}, {} loops:".format(str(temperature), str(len(group))), np.average(group["Runtime"]))
+
+    def best(key, name):
+        r = max(results, key=key)
+        return r["scheduleDf"], r["repeatObsSuccess"], r["fullness"], name
+
+    bestSchedRep = best(lambda r: r["repeatObsSuccess"], "bestRepeatSchedule")
+    bestSchedFull = best(lambda r: r["fullness"], "bestFullSchedule")
+    bestSchedBoth = best(lambda r: r["fullness"] * r["repeatObsSuccess"], "bestBothSchedule")
+    # results come back ranked by the checker errors and schedule score
+    bestSchedRanked = results[0]["scheduleDf"], results[0]["repeatObsSuccess"], results[0]["fullness"], "bestRankedSchedule"
+
+    os.makedirs(savepath, exist_ok=True)
+    for sched in [bestSchedRep, bestSchedFull, bestSchedBoth, bestSchedRanked]:
         visualizeSchedule(sched[0], os.sep.join([savepath, sched[3] + ".png"]),
                           os.sep.join([savepath, sched[3] + ".csv"]), sunsetUTC, sunriseUTC,
                           addTitleText="{}% full, with {}% repeat obs success.".format(str(round(sched[2] * 100, 3)),
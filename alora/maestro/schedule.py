@@ -189,7 +189,9 @@ class AddBlock(Operation):
         if np.any(modularSchedule.chunk_mask[start_chunk_idx:end_chunk_idx] != -1):
             raise ScheduleOperationError("Block overlaps with another block")
         # now that we know the block is legal, add it to the schedule
-        self.slot_index = len(modularSchedule.operations)
+        # slot indices come from a counter - len(operations) can repeat once operations start cancelling each other out
+        self.slot_index = modularSchedule._next_slot
+        modularSchedule._next_slot += 1
 
         # NOTE: this may cause astroplan issues - should probably reset the block's start time right before computation or smthn
         self.block.start_time = self.start_time
@@ -247,8 +249,9 @@ class RemoveBlock(Operation):
         except KeyError as e:
             raise ScheduleOperationError("Block is not in the schedule") from e
         # now that we know the block is legal, add it to the schedule
-        self.slot_index = len(modularSchedule.operations)
+        self.slot_index = modularSchedule.chunk_mask[start_chunk_idx]
         modularSchedule.chunk_mask[start_chunk_idx:end_chunk_idx] = -1
+        del modularSchedule.blocks[self.slot_index]
         modularSchedule.add_operation(self)
 
         modularSchedule._meta_operations.append(self)
@@ -314,20 +317,25 @@ class AddObservation(Operation):
         #    one transition, if necessary, before the observation
         #    the observation
         #    one transition, if necessary, after the observation
+        # transitions end right as the block they lead into starts
         previous_block = modularSchedule.previous_block(self.start_time)
         next_block = modularSchedule.next_block(self.start_time)
         if previous_block is not None:
             self.pre_transition = self.transitioner(previous_block, self.observation, self.start_time, self.observer)
-            op = AddBlock(self.pre_transition, self.pre_transition.start_time)
-            op.add_to_schedule(modularSchedule)
+            if self.pre_transition is not None:
+                self.pre_transition.start_time = modularSchedule.latest_start(self.start_time, self.pre_transition.duration)
+                op = AddBlock(self.pre_transition, self.pre_transition.start_time)
+                op.add_to_schedule(modularSchedule)
 
         op = AddBlock(self.observation, self.start_time)
         op.add_to_schedule(modularSchedule)
 
         if next_block is not None:
             self.post_transition = self.transitioner(self.observation, next_block, next_block.start_time, self.observer)
-            op = AddBlock(self.post_transition, self.post_transition.start_time)
-            op.add_to_schedule(modularSchedule)
+            if self.post_transition is not None:
+                self.post_transition.start_time = modularSchedule.latest_start(next_block.start_time, self.post_transition.duration)
+                op = AddBlock(self.post_transition, self.post_transition.start_time)
+                op.add_to_schedule(modularSchedule)
 
         modularSchedule._meta_operations.append(self)
 
@@ -363,9 +371,10 @@ class RemoveObservation(Operation):
 
         # first, check if the observation is actually in the schedule
         start_chunk_idx = modularSchedule.index_of(self.start_time)
-        assert modularSchedule.blocks[modularSchedule.chunk_mask[start_chunk_idx]] == self.observation, "Tried to remove an observation that wasn't in the schedule"
-        previous_block = modularSchedule.previous_block(self.start_time)
-        next_block = modularSchedule.next_block(self.start_time)
+        if start_chunk_idx is None or modularSchedule.blocks.get(modularSchedule.chunk_mask[start_chunk_idx]) is not self.observation:
+            raise ScheduleOperationError("Tried to remove an observation that wasn't in the schedule")
+        previous_block = modularSchedule.block_before(start_chunk_idx)
+        next_block = modularSchedule.block_after(modularSchedule.index_of(self.end_time))
         if previous_block is not None:
             if isinstance(previous_block, TransitionBlock):
                 self.pre_transition = previous_block
@@ -405,6 +414,7 @@ class ModularSchedule:
         self.blocks = {}
         self.operations = []
         self._meta_operations = []
+        self._next_slot = 0
         self.oldoperations = []
         self.start_time = start_time
         self.end_time = end_time
@@ -418,11 +428,19 @@ class ModularSchedule:
         if time < self.start_time or time > self.end_time:
             return None
         # floor or ceil?
-        return int(np.ceil((time-self.start_time).sec/(self.time_resolution.to(u.second).value)))
+        # (rounded first so that float noise in the time difference can't push a whole-chunk time up to the next chunk)
+        return int(np.ceil(round((time-self.start_time).sec/(self.time_resolution.to(u.second).value), 6)))
     
     def time_of(self, index):
         return self.start_time + index*self.time_resolution
 
+    def latest_start(self, end_time, duration):
+        """
+        return the latest chunk boundary at which a block of the given duration can start and still be over by end_time
+        """
+        idx = int(np.floor(round(((end_time - duration) - self.start_time).sec/(self.time_resolution.to(u.second).value), 6)))
+        return self.time_of(idx)
+
     def previous_block(self, time):
         # return the block that comes before the given time, if there is one
         # loop over chunk_mask, find the first slot that is not -1 and is before the given time
@@ -444,13 +462,50 @@ class ModularSchedule:
                 return self.blocks[self.chunk_mask[i]]
         return None
 
+    def block_before(self, index):
+        """
+        return the last block that occupies a chunk before the given chunk index, if there is one
+        """
+        if index is None:
+            return None
+        occupied = np.flatnonzero(self.chunk_mask[:max(index, 0)] != -1)
+        return self.blocks[self.chunk_mask[occupied[-1]]] if len(occupied) else None
+
+    def block_after(self, index):
+        """
+        return the first block that occupies the given chunk index or any chunk after it, if there is one
+        """
+        if index is None:
+            return None
+        occupied = np.flatnonzero(self.chunk_mask[index:] != -1)
+        return self.blocks[self.chunk_mask[index + occupied[0]]] if len(occupied) else None
+
     def add_operation(self, operation):
+        # the operations list is always kept reduced, so the new operation is the only one that could cancel another
+        for i, op in enumerate(self.operations):
+            if operation.cancels(op):
+                del self.operations[i]
+                return
         self.operations.append(operation)
-        self.reduce_operations()
 
     def undo_last_operation(self):
         self.operations.pop()
 
+    def checkpoint(self):
+        """
+        mark the current state of the schedule so that it can be returned to with rollback()
+        """
+        return len(self._meta_operations)
+
+    def rollback(self, checkpoint):
+        """
+        undo every block-level operation made since the given checkpoint, newest first
+        """
+        primitives = [op for op in self._meta_operations[checkpoint:] if isinstance(op, (AddBlock, RemoveBlock))]
+        for op in reversed(primitives):
+            op.opposite.add_to_schedule(self)
+        del self._meta_operations[checkpoint:]
+
     def compute(self):
         # apply all operations to the schedule
         sched = Schedule(self.start_time, self.end_time)
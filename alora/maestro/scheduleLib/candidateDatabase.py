@@ -4,6 +4,9 @@
 # CandidateDatabase - interface between the user and an existing candidate database, allowing Candidate storage, management, and queries
 
 import os, json
+import copy
+import functools
+import threading
 from os.path import join
 import logging
 import logging.config
@@ -11,8 +14,10 @@ import pandas as pd
 import pytz
 import sqlite3
 from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from string import Template
+from urllib.request import pathname2url
 from astropy.coordinates import SkyCoord, Angle
 from astropy import units as u
 from enum import Enum
@@ -27,11 +32,15 @@ try:
     from . import genUtils
     from .module_loader import ModuleManager
     from .sql_database import SQLDatabase
+    from .connection_pool import ConnectionPool, enable_wal
+    from .lru import LRUCache
 except ImportError as e:
     print(e)
     import genUtils
     from module_loader import ModuleManager
     from sql_database import SQLDatabase
+    from connection_pool import ConnectionPool, enable_wal
+    from lru import LRUCache
 
 validFields = ["CandidateName", "CandidateType", "Author", "DateAdded", "DateLastEdited", "RemovedDt",
                "RemovedReason", "RejectedReason", 'Night',
@@ -39,7 +48,7 @@ validFields = ["CandidateName", "CandidateType", "Author", "DateAdded", "DateLas
                'Magnitude', 'RMSE_RA',
                'RMSE_Dec', "Score", "nObs", 'ApproachColor', 'NumExposures', 'ExposureTime', 'Scheduled', 'Observed',
                'Processed', 'Submitted', 'Notes', 'Priority', 'Filter', 'Guide', "ID",
-               'CVal1', 'CVal2', 'CVal3', 'CVal4', 'CVal5', 'CVal6', 'CVal7', 'CVal8', 'CVal9', 'CVal10', 'flags']
+               'CVal1', 'CVal2', 'CVal3', 'CVal4', 'CVal5', 'CVal6', 'CVal7', 'CVal8', 'CVal9', 'CVal10', 'flags', 'ChangeSeq']
 
 
 class Flag(Enum):
@@ -60,6 +69,55 @@ def remove_flag(flags: int, flag: Flag):
     return int(np.bitwise_and(flags, ~flag.value))
 
 logger = logging.getLogger(__name__)
+
+
+class ArchivePolicy:
+    def __init__(self, removedAfterDays=30, rejectedAfterDays=30, expiredAfterDays=90):
+        """!
+        Which candidates CandidateDatabase.archiveStale moves out of the live Candidates table. Each rule can be turned
+        off by setting it to None. Whitelisted candidates are never archived
+        @param removedAfterDays: archive removed candidates this many days after they were removed
+        @param rejectedAfterDays: archive rejected candidates that haven't been edited for this many days
+        @param expiredAfterDays: archive candidates whose observability window ended, and that haven't been edited, this
+        many days ago
+        """
+        self.removedAfterDays = removedAfterDays
+        self.rejectedAfterDays = rejectedAfterDays
+        self.expiredAfterDays = expiredAfterDays
+
+    @classmethod
+    def from_settings(cls, settings):
+        """!
+        Policy from the archive*AfterDays maestro settings. A negative number turns that rule off
+        """
+        days = [settings.get(key, default) for key, default in
+                (("archiveRemovedAfterDays", 30), ("archiveRejectedAfterDays", 30), ("archiveExpiredAfterDays", 90))]
+        return cls(*[None if d is None or d < 0 else d for d in days])
+
+    def condition(self, now):
+        """!
+        @param now: naive UTC datetime
+        @return: sql condition on Candidates matching the rows to archive (or None if every rule is off), and its values
+        """
+        def cutoff(days):
+            return genUtils.timeToString(now - timedelta(days=days))
+
+        lastEdited = "julianday(coalesce(nullif(trim(DateLastEdited), ''), DateAdded))"
+        rules, values = [], {}
+        if self.removedAfterDays is not None:
+            rules.append("(RemovedReason IS NOT NULL AND julianday(coalesce(nullif(trim(RemovedDt), ''), DateLastEdited, "
+                         "DateAdded)) < julianday(:removedBefore))")
+            values["removedBefore"] = cutoff(self.removedAfterDays)
+        if self.rejectedAfterDays is not None:
+            rules.append(f"(RejectedReason IS NOT NULL AND {lastEdited} < julianday(:rejectedBefore))")
+            values["rejectedBefore"] = cutoff(self.rejectedAfterDays)
+        if self.expiredAfterDays is not None:
+            rules.append(f"(julianday(EndObservability) < julianday(:expiredBefore) AND {lastEdited} < julianday(:expiredBefore))")
+            values["expiredBefore"] = cutoff(self.expiredAfterDays)
+        if not rules:
+            return None, values
+        return f"NOT (flags & {Flag.WHITELIST.value}) AND ({' OR '.join(rules)})", values
+
 # MPC target's Name	Processed	Submitted	approx. transit time (@TMO)	RA	Dec	RA Vel ("/min)	Dec Vel ("/min)	Vmag	~Error (arcsec)	Error Color
 # CandidateName, Processed, Submitted, TransitTime, RA, Dec, dRA, dDec, Magnitude, RMSE
 def generateID(candidateName, candidateType, author):
@@ -112,6 +170,56 @@ with open(os.path.join(MODULE_PATH, "candidate_schema.json"), "r") as f:
 _modules = None
 mod_manager = ModuleManager()
 
+
+def compile_constructor(constructor, schema):
+    """!
+    Bind a field constructor to its schema, so that it only takes the stored value. The general datetime and quantity
+    constructors are replaced with equivalents that resolve the timezone or unit once, up front, and try the much faster
+    datetime.fromisoformat before the usual formats
+    """
+    if constructor is construct_datetime:
+        tz = pytz.timezone(schema["tz"])
+
+        def construct(tstring):
+            if not tstring or tstring == " ":
+                return None
+            try:
+                dt = datetime.fromisoformat(tstring)
+            except (TypeError, ValueError):
+                dt = genUtils.stringToTime(tstring)
+            return dt.replace(tzinfo=tz)
+        return construct
+    if constructor is construct_quantity:
+        unit = u.Unit(schema["unit"])
+
+        def construct(value):
+            if isinstance(value, u.Quantity):
+                return value.to(unit)
+            if value:
+                return u.Quantity(value, unit=unit)
+            return None
+        return construct
+    return functools.partial(constructor, **schema)
+
+
+class HydrationPlan:
+    __slots__ = ("candidateType", "config", "configKeys", "constructors")
+
+    def __init__(self, candidateType, config, configKeys, constructors):
+        """!
+        Everything needed to turn a database row into a candidate of one class, worked out once per class instead of
+        once per row. Made by BaseCandidate.compile_hydration_plan
+        @param candidateType: the type that every candidate of the class has, or None to take it from the row
+        @param config: the module's config_schema, config_constructors, and config_serializers attributes, by name
+        @param configKeys: the fields in the module's schema, in the order the module's constructor sets them
+        @param constructors: {field: constructor that takes just the stored value, or None to store it as is}
+        """
+        self.candidateType = candidateType
+        self.config = config
+        self.configKeys = configKeys
+        self.constructors = constructors
+
+
 # _modules = genUtils.import_maestro_modules()
 # noinspection PyUnresolvedReferences
 class BaseCandidate:
@@ -222,6 +330,54 @@ class BaseCandidate:
     def blacklisted(self):
         return has_flag(self.flags, Flag.BLACKLIST)
 
+    @classmethod
+    def compile_hydration_plan(cls, candidateType=None, config_constructors=None, config_serializers=None,
+                               config_schema=None):
+        """!
+        Work out, once, how hydrate() should build each field of a candidate of this class
+        @param candidateType: the module name, for a module's candidate class. None for BaseCandidate
+        """
+        constructors = {}
+        for key in validFields:
+            schema = gen_construction_schema.get(key)
+            constructors[key] = compile_constructor(gen_construction_dict[schema["valtype"]], schema) if schema else None
+        config = {}
+        if candidateType is not None:
+            config = {"config_schema": config_schema, "config_constructors": config_constructors,
+                      "config_serializers": config_serializers}
+            for key, schema in config_schema.items():
+                constructors[key] = compile_constructor(config_constructors[schema["valtype"]], schema)
+        return HydrationPlan(candidateType, config, tuple((config_schema or {}).keys()), constructors)
+
+    @classmethod
+    def hydrate(cls, entry: dict):
+        """!
+        Fast path for making a candidate of this class from a database row. Builds the same candidate as the
+        constructor, but fills in its fields directly from the class's HydrationPlan rather than going through
+        __setattr__, because values read from the database don't need to be checked against their serializers again
+        @param entry: a dictionary returned (inside a list) from a database query
+        """
+        plan = cls._hydration_plan
+        cand = cls.__new__(cls)
+        fields = cand.__dict__
+        fields["CandidateName"] = entry["CandidateName"]
+        fields["CandidateType"] = plan.candidateType or entry["CandidateType"]
+        fields.update(plan.config)
+        constructors = plan.constructors
+        for key in plan.configKeys:
+            if key in entry:
+                fields[key] = constructors[key](entry[key])
+        for key, value in entry.items():
+            if key in fields:
+                continue
+            if key not in constructors:
+                raise ValueError(
+                    "Bad argument: " + key + " is not a valid argument for candidate construction. Valid arguments are " + str(
+                        validFields))
+            construct = constructors[key]
+            fields[key] = value if construct is None else construct(value)
+        return cand
+
     @classmethod
     def fromDictionary(cls, entry: dict):
         """!
@@ -349,36 +505,99 @@ class BaseCandidate:
             return False
 
 
+BaseCandidate._hydration_plan = BaseCandidate.compile_hydration_plan()
+
+
+def candidate_class(CandidateType):
+    """!
+    The class that candidates of type CandidateType are made as: the module's CandidateClass, or BaseCandidate for
+    modules without their own candidate class (e.g. UserFixed), which only use the general fields
+    """
+    global _modules
+    if _modules is None:
+        _modules = mod_manager.load_active_modules()
+        # _modules = genUtils.import_maestro_modules()
+
+    if CandidateType not in _modules.keys():
+        raise ValueError(f"{CandidateType} is not a known candidate module. Did you spell it correctly?")
+    return getattr(_modules[CandidateType], "CandidateClass", BaseCandidate)
+
+
+def active_candidate_types():
+    """!
+    The set of CandidateTypes whose modules are active
+    """
+    global _modules
+    if _modules is None:
+        _modules = mod_manager.load_active_modules()
+    return set(_modules)
+
+
 # this is a dumb way to do this
 class Candidate(BaseCandidate):
     def __init__(self, CandidateName: str, CandidateType: str, **kwargs):
         # do a switchboard-type thing 
         # print(CandidateName, CandidateType, kwargs)
         # print(CandidateName, "in CandidateConstructor")
-        global _modules
-        if _modules is None:
-            _modules = mod_manager.load_active_modules()
-            # _modules = genUtils.import_maestro_modules()
-        
-        if CandidateType not in _modules.keys():
-        # if CandidateType not in self.modules.keys():
-            raise ValueError(f"{CandidateType} is not a known candidate module. Did you spell it correctly?")
-        associated_module = _modules[CandidateType]
-        # associated_module = self.modules[CandidateType]
-
-        cand = associated_module.CandidateClass(CandidateName, **kwargs)
+        cls = candidate_class(CandidateType)
+        if cls is BaseCandidate:
+            cand = BaseCandidate(CandidateName, CandidateType, **kwargs)
+        else:
+            cand = cls(CandidateName, **kwargs)
         # print("cand:", cand)
         # print(type(cand))
         self.__dict__.update(cand.__dict__)
-        self.__class__ = associated_module.CandidateClass
+        self.__class__ = type(cand)
+
+    @staticmethod
+    def fromRow(entry: dict):
+        """!
+        Make a candidate of the right class from a database row, using that class's hydrate() fast path
+        @param entry: a dictionary returned (inside a list) from a database query
+        @return: Candidate object
+        """
+        return candidate_class(entry["CandidateType"]).hydrate(entry)
+
+
+_query_caches = {}  # absolute database path : QueryCache
+_query_caches_lock = threading.Lock()
+
+
+class QueryCache(LRUCache):
+    def __init__(self, maxEntries=64):
+        """!
+        Results of candidate queries, shared by every CandidateDatabase for the same file in the process. Results are
+        cached under the database version they were read at, so a write makes all of them unreachable (they're then
+        evicted as the cache fills)
+        """
+        super().__init__(maxEntries)
+        self.writeVersion = 0  # bumped by every write made through a CandidateDatabase in this process
+
+    @classmethod
+    def shared(cls, path, maxEntries=64):
+        key = os.path.abspath(path)
+        with _query_caches_lock:
+            cache = _query_caches.get(key)
+            if cache is None:
+                cache = _query_caches[key] = cls(maxEntries)
+            return cache
+
+    def bump(self):
+        with self._lock:
+            self.writeVersion += 1
 
 
 class CandidateDatabase(SQLDatabase):
+    usesReadPool = True
+    usesQueryCache = True
+
     def __init__(self, dbPath, author):
         super().__init__()
         self.logger = logger
         self.db_path = dbPath
         self.__author = author
+        self.read_pool = None
+        self.query_cache = None
         self.logger.info("Connecting to candidate database at " + dbPath)
         self.open(dbPath)
         if self.isConnected:
@@ -386,6 +605,14 @@ class CandidateDatabase(SQLDatabase):
             self._setup_schema()
         else:
             raise sqlite3.DatabaseError("Connection to candidate database failed")
+        # queries run on a pool of read-only connections shared by every CandidateDatabase for this file in the process,
+        # while this object's own connection is left for writes
+        poolSize = genUtils.maestro_settings.get("candidateDbReadPoolSize", 4)
+        if poolSize and self.usesReadPool:
+            self.read_pool = ConnectionPool.shared(dbPath, poolSize)
+        cacheSize = genUtils.maestro_settings.get("candidateDbQueryCacheSize", 64)
+        if cacheSize and self.usesQueryCache:
+            self.query_cache = QueryCache.shared(dbPath, cacheSize)
         self.__existingIDs = []  # get and store a list of existing IDs. risk of collision low, so I'm not too worried about not calling this before making ids
 
     def __del__(self):
@@ -395,6 +622,48 @@ class CandidateDatabase(SQLDatabase):
             pass
         self.close()
         
+    @contextmanager
+    def _reading(self):
+        """!
+        Cursor on a connection from the read pool, or on this object's own connection if there's no pool or it stayed
+        exhausted. Reads on pooled connections only see committed data, which is all there is: every write method here
+        commits before returning
+        """
+        if self.read_pool is None:
+            yield self.db_cursor
+            return
+        with self.read_pool.reader() as cursor:
+            yield cursor if cursor is not None else self.db_cursor
+
+    def commit(self):
+        super().commit()
+        self._wrote()
+
+    def _wrote(self):
+        """!
+        Note that the database has been written to, so that no cached query result from before the write is used again
+        """
+        if self.query_cache is not None:
+            self.query_cache.bump()
+
+    def _cachedQuery(self, key, query):
+        """!
+        The result of query(), from the query cache if nothing has been written to the database since it was cached. The
+        database version is this process's write counter plus the change sequence, which also counts other processes'
+        writes. Candidates are copied on the way out, so callers are free to change them
+        @param key: hashable key identifying the query and its parameters
+        @param query: function that runs the query and returns a list of candidates or None
+        """
+        if self.query_cache is None:
+            return query()
+        key = (self.query_cache.writeVersion, self.changeSequence, key)
+        cached = self.query_cache.get(key)
+        if cached is None:
+            cached = (query(),)
+            self.query_cache.put(key, cached)
+        res = cached[0]
+        return [copy.copy(c) for c in res] if res is not None else None
+
     @property
     def version(self):
         self.db_cursor.execute('pragma user_version')
@@ -404,7 +673,8 @@ class CandidateDatabase(SQLDatabase):
         schema_dir = join(MAESTRO_PATH, "scheduleLib", "schema")
         sql_files = [f for f in os.listdir(schema_dir) if f.endswith(".sql")]
         sql_files.sort()
-        sql_files = [f for f in sql_files if int(f.split("_")[0]) > self.version]
+        # script N upgrades the database to version N + 1, so it's needed by anything still at version N or below
+        sql_files = [f for f in sql_files if int(f.split("_")[0]) >= self.version]
         for sql_file in sql_files:
             next_version = int(sql_file.split("_")[0]) + 1
             self.logger.info(f"Upgrading candidate database to version {next_version} using {sql_file}")
@@ -440,7 +710,7 @@ class CandidateDatabase(SQLDatabase):
         # try:
         dicts = CandidateDatabase.query_result_to_dict(queryResults)
         dicts = [self.removeInvalidFields(d, allowProtected=True) for d in dicts]
-        return [Candidate.fromDictionary(d) for d in dicts]
+        return [Candidate.fromRow(d) for d in dicts]
 
     def open(self, db_file, timeout=5, check_same_thread=False):
         """!
@@ -463,6 +733,13 @@ class CandidateDatabase(SQLDatabase):
         else:
             self._db_name = os.path.splitext(db_file)[0]
             self.db_cursor.execute('pragma busy_timeout=2000')  # try write commands with a 2-second busy timeout
+            if genUtils.maestro_settings.get("candidateDbWAL", True):
+                # with write-ahead logging, readers (in this process or any other) don't wait for writers or vice versa
+                try:
+                    if not enable_wal(self.db_connection):
+                        self.logger.warning("Candidate database could not be switched to WAL mode (is it on a network drive?)")
+                except sqlite3.OperationalError as e:
+                    self.logger.warning(f"Couldn't switch candidate database to WAL mode right now: {e}")
             self.logger.info("Connected to candidate database")
         return
 
@@ -490,12 +767,12 @@ class CandidateDatabase(SQLDatabase):
             self.logger.debug("Query: Retrieved " + str(len(result)) + " record(s) for candidates in response to query")
             if returnAsCandidates:
                 if not skip_errors:
-                    results = [Candidate.fromDictionary(row) for row in result]
+                    results = [Candidate.fromRow(row) for row in result]
                 else:
                     results = []
                     for row in result:
                         try:
-                            results.append(Candidate.fromDictionary(row))
+                            results.append(Candidate.fromRow(row))
                         except Exception as e:
                             # skip errors where we don't recognize the module, it's probably just deactivated
                             if "not a known candidate module" in str(e):  
@@ -524,11 +801,50 @@ class CandidateDatabase(SQLDatabase):
             candidate["Author"])
         return id
 
+    def _executeGrouped(self, statement, rows):
+        """!
+        Run statement once per group of rows that have the same columns, with executemany, in a single transaction: either
+        every row is written or, if anything goes wrong, none are
+        @param statement: function that takes a tuple of column names and returns the sql statement for rows with them
+        @param rows: list of (column names tuple, values list)
+        """
+        groups = {}
+        for columns, values in rows:
+            groups.setdefault(columns, []).append(values)
+        with self.db_connection:  # commits on success, rolls back on an exception
+            for columns, valueList in groups.items():
+                self.db_cursor.executemany(statement(columns), valueList)
+        self._wrote()
+
+    def insertCandidates(self, candidates):
+        """!
+        Insert many candidates at once, committing them together instead of one at a time
+        @param candidates: list of Candidates
+        @return: list of the IDs of the inserted candidates, in the same order
+        """
+        timestamp = CandidateDatabase.timestamp()
+        IDs, rows = [], []
+        for candidate in candidates:
+            candidate = candidate.asDict()
+            candidate["Author"] = self.__author
+            candidate["DateAdded"] = timestamp
+            candidate["ID"] = generateID(candidate["CandidateName"], candidate["CandidateType"], self.__author)
+            IDs.append(candidate["ID"])
+            rows.append((tuple(candidate.keys()), list(candidate.values())))
+        try:
+            self._executeGrouped(lambda columns: f"INSERT INTO Candidates ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})", rows)
+        except Exception as e:
+            self.logger.error(f"Can't insert batch of {len(rows)} candidates. None were inserted.")
+            self.logger.error(repr(e))
+            raise e
+        self.logger.info(f"Inserted {len(IDs)} candidates from {self.__author}")
+        return IDs
+
     def fetchIDs(self):
         self.__existingIDs = [row["ID"] for row in self.table_query("Candidates", "ID", '', []) if row]
 
     def isFieldProtected(self, field):
-        return field in ["Author", "DateAdded", "ID"]
+        return field in ["Author", "DateAdded", "ID", "ChangeSeq"]  # ChangeSeq is set by the database's triggers
 
     def removeInvalidFields(self, dictionary, allowProtected=False):
         badKeys = []
@@ -539,27 +855,101 @@ class CandidateDatabase(SQLDatabase):
             dictionary.pop(key)
         return dictionary
 
+    @staticmethod
+    def observableBetweenCondition(obsStart, obsEnd, duration):
+        """!
+        SQL version of BaseCandidate.isObservableBetween, so that candidates that can't be observed are never loaded
+        @param obsStart: datetime. like isObservableBetween, any timezone is replaced with UTC rather than converted
+        @param obsEnd: datetime
+        @param duration: hours, float
+        @return: condition string and dictionary of the named values it uses
+        """
+        start, end = obsStart.replace(tzinfo=None), obsEnd.replace(tzinfo=None)
+        values = {"start": start.isoformat(sep=" "), "end": end.isoformat(sep=" "),
+                  # the times are compared in julian days, a few hundredths of a millisecond off at worst
+                  "seconds": duration * 3600 - 1e-3,
+                  # bounds for a plain string comparison that the observability indices can answer. they are padded to
+                  # whole seconds because stored times with fractional seconds sort after the same time without them
+                  "lo": genUtils.timeToString(start.replace(microsecond=0)),
+                  "hi": genUtils.timeToString(end.replace(microsecond=0) + timedelta(seconds=1))}
+        condition = """EndObservability >= :lo AND StartObservability < :hi AND (
+            (((julianday(:start) < julianday(EndObservability) AND julianday(EndObservability) <= julianday(:end))
+              OR (julianday(:start) < julianday(StartObservability) AND julianday(StartObservability) <= julianday(:end)))
+             AND (min(julianday(:end), julianday(EndObservability)) - max(julianday(:start), julianday(StartObservability))) * 86400 >= :seconds)
+            OR (julianday(StartObservability) < julianday(:start) AND julianday(EndObservability) >= julianday(:end)
+             AND (julianday(:end) - julianday(:start)) * 86400 >= :seconds))"""
+        return condition, values
+
+    @staticmethod
+    def latestByNameCondition(condition):
+        """!
+        Narrow a condition on the Candidates table to the most recently updated of the rows it matches for each
+        CandidateName (the lowest ID wins a tie, and a row without an Updated time only wins if it's the only one)
+        @param condition: sql condition on Candidates. its values are used as they are
+        @return: condition string
+        """
+        return f"""ID IN (SELECT ID FROM (SELECT ID, ROW_NUMBER() OVER (
+            PARTITION BY CandidateName ORDER BY julianday(Updated) DESC, ID) AS newness
+            FROM Candidates WHERE {condition}) WHERE newness = 1)"""
+
+    def timeRangeCondition(self, obsStart, obsEnd, duration, candidate_type=None):
+        """!
+        The condition that candidatesForTimeRange queries with
+        @return: condition string and dictionary of the named values it uses
+        """
+        condition, values = self.observableBetweenCondition(obsStart, obsEnd, duration)
+        condition = "RemovedReason IS NULL AND ((RejectedReason IS NULL) or (flags & 1)) AND NOT (flags & 2) AND " + condition
+        if candidate_type is not None:
+            condition += " AND CandidateType = :type"
+            values["type"] = candidate_type
+        # if a candidate has more than one viable row, only the newest is returned
+        return self.latestByNameCondition(condition), values
+
     def candidatesForTimeRange(self, obsStart, obsEnd, duration, candidate_type=None, skip_errors=False):
-        if candidate_type is None:
-            candidates = self.table_query("Candidates", "*",
-                                      "RemovedReason IS NULL AND ((RejectedReason IS NULL) or (flags & 1)) AND NOT (flags & 2)", [], returnAsCandidates=True,skip_errors=skip_errors)
-        else:
-            candidates = self.table_query("Candidates", "*",
-                                      "RemovedReason IS NULL AND ((RejectedReason IS NULL) or (flags & 1)) AND NOT (flags & 2) AND CandidateType IS ?", [candidate_type], returnAsCandidates=True,skip_errors=skip_errors)
+        condition, values = self.timeRangeCondition(obsStart, obsEnd, duration, candidate_type)
+        res = self._cachedQuery(("candidatesForTimeRange", obsStart, obsEnd, duration, candidate_type, skip_errors),
+                                lambda: self.table_query("Candidates", "*", condition, values, returnAsCandidates=True,
+                                                         skip_errors=skip_errors))
+        return res or []
 
-        if candidates is None:
-            return []
-        res = [candidate for candidate in candidates if candidate.isObservableBetween(obsStart, obsEnd, duration)]
-        candidateDict = {}
-        for c in res:
-            if c.CandidateName not in candidateDict.keys():
-                candidateDict[c.CandidateName] = c
+    def candidatesAsDataFrame(self, condition="1=1", values=(), columns="*"):
+        """!
+        Read candidates straight into a DataFrame, one typed column at a time, without making Candidate objects. Columns
+        with a general schema entry are converted by valtype: datetimes to (timezone-naive, in the schema's timezone)
+        datetime64, with blanks as NaT, and quantities to floats in the schema's unit. Module fields (CVals) are left as
+        they're stored. Columns that are empty for every row are dropped, like in BaseCandidate.candidatesToDf
+        @param condition: sql condition on the Candidates table, e.g. from timeRangeCondition
+        @param values: values for the condition
+        @param columns: columns to select
+        @return: DataFrame, with no rows if nothing matched
+        """
+        with self._reading() as cursor:
+            cursor.execute(f"SELECT {columns} FROM Candidates WHERE {condition}", values)
+            names = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        data = {}
+        for name, col in zip(names, zip(*rows) if rows else [()] * len(names)):
+            schema = gen_construction_schema.get(name)
+            col = pd.Series(col, dtype=object)
+            if schema is None:
+                data[name] = col.infer_objects()
+            elif schema["valtype"] == "datetime":
+                data[name] = pd.to_datetime(col.replace(r"^\s*$", None, regex=True), errors="coerce", format="ISO8601")
+            elif schema["valtype"] == "quantity":
+                data[name] = pd.to_numeric(col, errors="coerce").astype(float)
             else:
-                duplicate = candidateDict[c.CandidateName]
-                if genUtils.stringToTime(duplicate.Updated) < genUtils.stringToTime(c.Updated):
-                    candidateDict[c.CandidateName] = c
-        res = list(candidateDict.values())
-        return res
+                data[name] = col
+        df = pd.DataFrame(data, columns=names)
+        if len(df):
+            df = df.dropna(axis=1, how="all")
+        return df
+
+    def candidatesAsArrow(self, condition="1=1", values=(), columns="*"):
+        """!
+        candidatesAsDataFrame, as a pyarrow Table. Requires pyarrow
+        """
+        import pyarrow
+        return pyarrow.Table.from_pandas(self.candidatesAsDataFrame(condition, values, columns), preserve_index=False)
 
     # def candidates
 
@@ -579,17 +969,98 @@ class CandidateDatabase(SQLDatabase):
             self.logger.warning("Received empty query result for candidates added since " + when)
             return None
 
+    @property
+    def changeSequence(self):
+        """!
+        The current change sequence number. Every insert into or update of the Candidates table (edits, flag changes,
+        removals, rejections, ...) takes the next number and stamps it on the row's ChangeSeq, no matter who makes it.
+        Every row deleted from it (archived) takes the next number too, and leaves a tombstone with it in
+        CandidateTombstones
+        """
+        with self._reading() as cursor:
+            cursor.execute("SELECT seq FROM change_sequence")
+            return cursor.fetchone()[0]
+
+    def changesSince(self, seq, returnAsCandidates=True):
+        """!
+        The candidates that have been added or changed in any way since the change sequence was at seq, and the IDs of the
+        ones that have left the Candidates table (been archived) since then, so that a table can be brought up to date
+        without reloading everything. Removed and rejected candidates are among the changed ones, since being removed or
+        rejected is a change
+        @param seq: the sequence number returned by the previous call, or 0 for every candidate
+        @return: (list of candidates (or dicts) in the order they last changed, list of IDs of the candidates that are
+        gone, the sequence number to pass next time)
+        """
+        # read first: a change that lands between the two reads is then reported again next time instead of missed
+        current = self.changeSequence
+        res = self.table_query("Candidates", "*", "ChangeSeq > ? ORDER BY ChangeSeq", [seq],
+                               returnAsCandidates=returnAsCandidates, skip_errors=True)
+        with self._reading() as cursor:
+            # a candidate that has been put back since it was deleted isn't gone
+            cursor.execute('SELECT DISTINCT "ID" FROM "CandidateTombstones" WHERE "ChangeSeq" > ? AND "ID" NOT IN '
+                           '(SELECT "ID" FROM Candidates) ORDER BY "ID"', [seq])
+            gone = [row[0] for row in cursor.fetchall()]
+        return res or [], gone, current
+
     def getCandidateByID(self, ID: int):
         """
-        Get a candidate by its ID. Returns a Candidate object or None
+        Get a candidate by its ID. Returns a Candidate object or None. Looks in the archive if the candidate isn't in the
+        live table
         @param ID: the candidate ID
         @type ID: int
         @return: list of Candidate objects, or None
         @rtype: list[Candidate]|None
         """
         res = self.table_query("Candidates", "*", "ID = ?", [ID], returnAsCandidates=True)
+        if not res:
+            res = self._archiveQuery("ID = ?", [ID])
         return res[0] if res else None
 
+    def _tableColumns(self, table_name):
+        self.db_cursor.execute(f'pragma table_info("{table_name}")')
+        return [row["name"] for row in self.db_cursor.fetchall()]
+
+    def _archiveQuery(self, condition, values):
+        """!
+        Query the archive for Candidates, selecting only the columns that the live table has
+        """
+        columns = [f'"{c}"' for c in self._tableColumns("Candidates") if c in set(self._tableColumns("CandidatesArchive"))]
+        return self.table_query("CandidatesArchive", columns, condition, values, returnAsCandidates=True)
+
+    def archiveStale(self, policy=None, now=None):
+        """!
+        Move the candidates that policy says are stale out of the live Candidates table and into CandidatesArchive, so that
+        every scan of the live table stays fast as the database ages. Archived candidates can still be looked up by ID
+        (getCandidateByID and getCandidatesByIDs), but no longer show up in any other query, and edits don't reach them.
+        changesSince reports them as gone
+        @param policy: ArchivePolicy. defaults to the one in the maestro settings
+        @param now: naive UTC datetime to measure ages from. defaults to now
+        @return: list of the IDs that were archived
+        """
+        policy = policy or ArchivePolicy.from_settings(genUtils.maestro_settings)
+        now = now or datetime.utcnow()
+        condition, values = policy.condition(now)
+        if condition is None:
+            return []
+        # the archive gets any column that has been added to the live table since it was made
+        archiveColumns = set(self._tableColumns("CandidatesArchive"))
+        self.db_cursor.execute('pragma table_info("Candidates")')
+        for row in self.db_cursor.fetchall():
+            if row["name"] not in archiveColumns:
+                self.db_cursor.execute(f'ALTER TABLE "CandidatesArchive" ADD COLUMN "{row["name"]}" {row["type"]}')
+        columns = ", ".join(f'"{c}"' for c in self._tableColumns("Candidates"))
+        with self.db_connection:  # all or nothing
+            self.db_cursor.execute(f"SELECT ID FROM Candidates WHERE {condition}", values)
+            IDs = [row["ID"] for row in self.db_cursor.fetchall()]
+            archivedDt = CandidateDatabase.timestamp()
+            self.db_cursor.executemany(f"INSERT INTO CandidatesArchive ({columns}, ArchivedDt) SELECT {columns}, ? FROM Candidates WHERE ID = ?",
+                                       [(archivedDt, ID) for ID in IDs])
+            # each delete advances the change sequence and leaves a tombstone for changesSince
+            self.db_cursor.executemany("DELETE FROM Candidates WHERE ID = ?", [(ID,) for ID in IDs])
+        self._wrote()
+        self.logger.info(f"Archived {len(IDs)} stale candidates")
+        return IDs
+
     def getCandidatesByIDs(self, IDList):
         """
         Get a list of candidates by their IDs. Returns a list of Candidate objects or None
@@ -598,7 +1069,11 @@ class CandidateDatabase(SQLDatabase):
         @return: list of Candidate objects or None
         @rtype: list[Candidate] | None
         """
-        return self.table_query("Candidates", "*", "ID IN (" + ",".join(["?" for _ in IDList]) + ")",IDList,returnAsCandidates=True)
+        res = self.table_query("Candidates", "*", "ID IN (" + ",".join(["?" for _ in IDList]) + ")",IDList,returnAsCandidates=True) or []
+        missing = [ID for ID in IDList if ID not in {c.ID for c in res}]
+        if missing:
+            res += self._archiveQuery("ID IN (" + ",".join(["?" for _ in missing]) + ")", missing) or []
+        return res or None
 
     def getCandidateByName(self, name):
         """
@@ -608,7 +1083,8 @@ class CandidateDatabase(SQLDatabase):
         @return: list of Candidate objects or None
         @rtype: list[Candidate]|None
         """
-        return self.table_query("Candidates", "*", "CandidateName = ?", [name], returnAsCandidates=True)
+        return self._cachedQuery(("getCandidateByName", name),
+                                 lambda: self.table_query("Candidates", "*", "CandidateName = ?", [name], returnAsCandidates=True))
 
     def getCandidatesByNames(self, nameList):
         """
@@ -618,7 +1094,7 @@ class CandidateDatabase(SQLDatabase):
         @return: list of Candidate objects or None
         @rtype: list[Candidate]|None
         """
-        return self.table_query("Candidates", "*", "CandidateName IN (" + ",".join(["?" for _ in nameList]) + ")",nameList + ")", returnAsCandidates=True)
+        return self.table_query("Candidates", "*", "CandidateName IN (" + ",".join(["?" for _ in nameList]) + ")", list(nameList), returnAsCandidates=True)
     
     def getCandidatesByType(self, candidateType):
         """
@@ -628,7 +1104,8 @@ class CandidateDatabase(SQLDatabase):
         @return: list of Candidate objects or None
         @rtype: list[Candidate]|None
         """
-        return self.table_query("Candidates", "*", "CandidateType = ?", [candidateType], returnAsCandidates=True)
+        return self._cachedQuery(("getCandidatesByType", candidateType),
+                                 lambda: self.table_query("Candidates", "*", "CandidateType = ?", [candidateType], returnAsCandidates=True))
 
     def editCandidateByID(self, ID, updateDict):
         """
@@ -639,6 +1116,25 @@ class CandidateDatabase(SQLDatabase):
             updateDict["DateLastEdited"] = CandidateDatabase.timestamp()
             self.table_update("Candidates", list(updateDict.keys()), list(updateDict.values()), "ID = " + str(ID))
 
+    def updateCandidates(self, updates):
+        """!
+        Like editCandidateByID, for many candidates at once, committing the edits together instead of one at a time
+        @param updates: list of (ID, updateDict) pairs
+        @return: list of the IDs that were updated
+        """
+        timestamp = CandidateDatabase.timestamp()
+        IDs, rows = [], []
+        for ID, updateDict in updates:
+            updateDict = self.removeInvalidFields(dict(updateDict))
+            if not len(updateDict):
+                continue
+            updateDict["DateLastEdited"] = timestamp
+            IDs.append(ID)
+            rows.append((tuple(updateDict.keys()), list(updateDict.values()) + [ID]))
+        self._executeGrouped(lambda columns: f"UPDATE Candidates SET {', '.join([f'{col} = ?' for col in columns])} WHERE ID = ?", rows)
+        self.logger.info(f"Updated {len(IDs)} candidates")
+        return IDs
+
     def _releaseDatabase(self):
         self.db_connection.commit()
 
@@ -649,7 +1145,7 @@ class CandidateDatabase(SQLDatabase):
         sql_template = Template('UPDATE Candidates SET $column_name = ? WHERE \"ID\" = $id')
         sql_statement = sql_template.substitute({'column_name': colName, 'id': str(ID)})
         self.db_cursor.execute(sql_statement, [None])
-        self.db_connection.commit()
+        self.commit()
 
     def clear_invalid_status(self,ID):
         self.setFieldNullByID(ID, "RemovedReason")
@@ -733,6 +1229,77 @@ class CandidateDatabase(SQLDatabase):
         new_flags = remove_flag(candidate.flags, flag=Flag.BLACKLIST)
         self.editCandidateByID(ID, {"flags":new_flags})
 
+class CandidateSnapshot(CandidateDatabase):
+    usesReadPool = False
+    usesQueryCache = False
+
+    def __init__(self, dbPath, author, obsStart=None):
+        """!
+        Read-only, in-memory copy of the candidates in the database at dbPath, taken all at once. Everything that reads
+        from the snapshot sees the database exactly as it was when the snapshot was made, no matter what the updaters
+        write to the file in the meantime, and no query touches the disk. Any attempt to write to it raises
+        sqlite3.OperationalError. Only the Candidates table is copied, so archived candidates aren't in the snapshot
+        @param obsStart: optional. naive UTC datetime. if provided, removed candidates and candidates whose observability
+        windows ended before obsStart are left out of the snapshot, because nothing would schedule them
+        """
+        self.obsStart = obsStart
+        super().__init__(dbPath, author)
+        self.db_cursor.execute("pragma query_only = ON")
+
+    def open(self, db_file, timeout=5, check_same_thread=False):
+        """!
+        Copy the Candidates table of the database at db_file into memory, leaving out the rows obsStart rules out. The
+        rows are selected by sqlite straight into the copy, in one read transaction on the file, so the copy is
+        consistent and the rows that are left out are never read into python
+        """
+        if not os.path.isfile(db_file):
+            raise FileNotFoundError(f"Can't snapshot candidate database {db_file}: file not found")
+        SQLDatabase.open(self, ":memory:", check_same_thread=check_same_thread, uri=True, timeout=timeout,
+                         detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        cursor = self.db_cursor
+        cursor.execute("ATTACH DATABASE ? AS source", (f"file:{pathname2url(os.path.abspath(db_file))}?mode=ro",))
+        try:
+            cursor.execute("BEGIN")
+            cursor.execute("SELECT type, name, sql FROM source.sqlite_master WHERE tbl_name IN ('Candidates', 'change_sequence') "
+                           "AND sql IS NOT NULL")
+            schema = cursor.fetchall()
+            cursor.execute("pragma source.user_version")
+            version = cursor.fetchone()[0]
+            for row in schema:
+                if row["type"] == "table":
+                    cursor.execute(row["sql"])
+            condition, values = "1=1", []
+            if self.obsStart is not None:
+                condition = "RemovedReason IS NULL AND (julianday(EndObservability) < julianday(?)) IS NOT 1"
+                values = [genUtils.timeToString(self.obsStart)]
+            cursor.execute(f"INSERT INTO main.Candidates SELECT * FROM source.Candidates WHERE {condition}", values)
+            if any(row["name"] == "change_sequence" for row in schema):
+                cursor.execute("INSERT INTO main.change_sequence SELECT * FROM source.change_sequence")
+            # indexes after the rows, so they're built once. the change feed's triggers aren't needed, nothing writes here
+            for row in schema:
+                if row["type"] == "index":
+                    cursor.execute(row["sql"])
+            # the schema is the file's, so only the upgrades the file hasn't had are applied to the copy
+            cursor.execute(f"pragma main.user_version = {int(version)}")
+            self.db_connection.commit()
+        finally:
+            if self.db_connection.in_transaction:
+                self.db_connection.rollback()
+            cursor.execute("DETACH DATABASE source")
+        self._db_name = os.path.splitext(db_file)[0]
+        self.logger.info(f"Took in-memory snapshot of candidate database {db_file}")
+
+
+def open_candidate_database(db, author):
+    """!
+    @param db: path to the candidate database, or a CandidateDatabase (e.g. a CandidateSnapshot)
+    @return: db itself if it's already a CandidateDatabase, otherwise a new CandidateDatabase connected to the file at db
+    """
+    if isinstance(db, CandidateDatabase):
+        return db
+    return CandidateDatabase(db, author)
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s %(levelname)s: %(message)s', filename='libFiles/candidateDb.log',
                         encoding='utf-8', datefmt='%m/%d/%Y %H:%M:%S', level=logging.DEBUG)
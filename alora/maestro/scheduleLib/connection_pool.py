@@ -0,0 +1,123 @@
+# Sage Santomenna 2025
+# bounded pool of read-only sqlite connections, shared by every database object in the process that reads the same file
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+_pools = {}  # absolute database path : ConnectionPool
+_pools_lock = threading.Lock()
+
+
+def enable_wal(connection):
+    """!
+    Switch the database behind connection to write-ahead logging. The journal mode is stored in the database file, so
+    this only needs to succeed once, but it's cheap to repeat
+    @return: whether the database is now in WAL mode
+    """
+    mode = connection.execute("pragma journal_mode=wal").fetchone()[0]
+    return str(mode).lower() == "wal"
+
+
+class ConnectionPool:
+    def __init__(self, path, size=4, timeout=5, busy_timeout_ms=2000):
+        """!
+        Up to size read-only connections to the database at path, opened when they're first needed and then reused.
+        With the database in WAL mode, a reader sees the last committed state of the database and doesn't wait on a
+        writer, so running queries on these connections keeps them from queueing behind an update that is being written
+        through the database object's own connection
+        @param timeout: seconds to wait for a connection when all of them are in use
+        """
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.closed = False
+        self._idle = queue.LifoQueue()  # most recently used first, so that a few connections do most of the work
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, path, size=4):
+        """!
+        The process-wide pool for the database at path, made if there isn't one yet
+        """
+        key = os.path.abspath(path)
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None or pool.closed:
+                pool = _pools[key] = cls(key, size)
+            return pool
+
+    def _open(self):
+        connection = sqlite3.connect(f"file:{pathname2url(self.path)}?mode=ro", uri=True, check_same_thread=False,
+                                     detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        connection.row_factory = sqlite3.Row
+        connection.execute(f"pragma busy_timeout={int(self.busy_timeout_ms)}")
+        return connection
+
+    def acquire(self):
+        """!
+        @return: an idle connection, or None if all of them stayed in use for longer than timeout
+        """
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            canOpen = self._opened < self.size
+            if canOpen:
+                self._opened += 1
+        if canOpen:
+            try:
+                return self._open()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, connection):
+        if self.closed:
+            connection.close()
+            return
+        self._idle.put(connection)
+
+    @contextmanager
+    def reader(self):
+        """!
+        Cursor on a pooled connection, for the body of the with statement:
+            with pool.reader() as cursor:
+                if cursor is not None:
+                    rows = cursor.execute(...).fetchall()
+        yields None if the pool stayed exhausted for longer than timeout
+        """
+        connection = self.acquire()
+        if connection is None:
+            yield None
+            return
+        try:
+            yield connection.cursor()
+        finally:
+            self.release(connection)
+
+    @property
+    def stats(self):
+        return {"opened": self._opened, "idle": self._idle.qsize(), "size": self.size}
+
+    def close(self):
+        """!
+        Close the idle connections. Connections that are in use are closed when they're released
+        """
+        self.closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
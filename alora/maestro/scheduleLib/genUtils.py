@@ -53,6 +53,9 @@ def generate_candidate_class(config_name,config_constructors,config_serializers,
             self.config_serializers = config_serializers
             super().__init__(self.CandidateName, self.CandidateType, **kwargs)
 
+    # worked out once here so that candidates loaded from the database can skip the constructor (see BaseCandidate.hydrate)
+    ModuleCandidate._hydration_plan = base_candidate_class.compile_hydration_plan(config_name, config_constructors,
+                                                                                 config_serializers, config_schema)
     return ModuleCandidate
 
 def configure_logger(name):
@@ -82,6 +85,8 @@ class TypeConfiguration(metaclass=ABCMeta):
     The TypeConfiguration class is a class subclassed by each Config module. Must be constructed and returned by the
     getConfig() function in the TypeConfiguration's schedule_[config_name].py file.
     """
+    # whether selectCandidates can be handed an already-open CandidateDatabase in place of the path to the database
+    acceptsCandidateSnapshot = False
 
     @abstractmethod
     def __init__(self, scorer: astroplan.Scorer, maxMinutesWithoutFocus=60, numObs=1,
@@ -111,6 +116,7 @@ class TypeConfiguration(metaclass=ABCMeta):
     def selectCandidates(self, startTimeUTC: datetime, endTimeUTC: datetime, dbPath):
         """!
         Provided a start time, end time, and the path to the database, retrieve and return a collection of Candidates that the scheduler should attempt to schedule
+        If the config sets acceptsCandidateSnapshot, the scheduler may pass a CandidateSnapshot shared by all of the modules in place of the path. Such a config should read the database with candidateDatabase.open_candidate_database(dbPath, ...), which takes either, rather than CandidateDatabase(dbPath, ...)
         """
         pass
 
@@ -407,6 +413,7 @@ static_observability_window = tmo.static_observability_window
 #     # HA = ST - RA -> ST = HA + RA
 
 observation_viable = tmo.observation_viable
+observation_viable_many = tmo.observation_viable_many
 
 # def observationViable(RA, Dec, dt, locationInfo):
 #     """!
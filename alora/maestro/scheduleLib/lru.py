@@ -0,0 +1,78 @@
+# Sage Santomenna 2025
+# small thread-safe least-recently-used cache, bounded by number of entries and/or total size, that counts its hits and misses
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxEntries=128, maxBytes=None, sizeof=None):
+        """!
+        @param maxEntries: evict the least recently used entries when there are more than this many. None for no limit
+        @param maxBytes: evict the least recently used entries when their total size is more than this. None for no limit
+        @param sizeof: function giving the size in bytes of a value. required if maxBytes is set
+        """
+        if maxBytes is not None and sizeof is None:
+            raise ValueError("LRUCache needs a sizeof function to be bounded by bytes")
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()  # key : (value, size), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value) if self.sizeof is not None else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= old[1]
+            if self.maxBytes is not None and size > self.maxBytes:
+                return  # would evict everything else and still not fit
+            self._entries[key] = (value, size)
+            self.nbytes += size
+            while (self.maxEntries is not None and len(self._entries) > self.maxEntries) or \
+                    (self.maxBytes is not None and self.nbytes > self.maxBytes):
+                _, (_, evictedSize) = self._entries.popitem(last=False)
+                self.nbytes -= evictedSize
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            self.nbytes -= entry[1]
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"entries": len(self._entries), "bytes": self.nbytes, "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,65 @@
+# Sage Santomenna 2025
+# index of which time slots of the schedule are taken, for constant-time conflict checks while placing blocks
+
+import numpy as np
+
+
+def zero_prefix(rows):
+    """!
+    Prefix counts of zero entries along the last axis, with a leading 0 column so that the number of zeros in [a, b) is
+    prefix[..., b] - prefix[..., a]
+    @param rows: 1D or 2D array of scores
+    @return: integer array with one more column than rows
+    """
+    rows = np.atleast_2d(rows)
+    prefix = np.zeros((rows.shape[0], rows.shape[1] + 1), dtype=np.int32)
+    np.cumsum(rows == 0, axis=1, out=prefix[:, 1:])
+    return prefix
+
+
+class SlotOccupancy:
+    def __init__(self, numSlots):
+        """!
+        Occupancy of the schedule's time grid. Keeps the value of each slot (0 = free, -1 = excluded, n = taken by an
+        object of priority tier n) alongside a prefix sum of the occupied-slot bitmap, so that asking whether a span of
+        slots is free is O(1). The prefix sum is rebuilt (in numpy) only when slots are marked, which happens once per
+        placement rather than once per check
+        @param numSlots: number of slots in the time grid
+        """
+        self.values = np.zeros(numSlots)
+        self._prefix = np.zeros(numSlots + 1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, idx):
+        return self.values[idx]
+
+    def _clip(self, start, end):
+        n = len(self.values)
+        return min(max(start, 0), n), min(max(end, 0), n)
+
+    def mark(self, start, end, value):
+        """!
+        Set the value of the slots in [start, end)
+        """
+        start, end = self._clip(start, end)
+        if end <= start:
+            return
+        self.values[start:end] = value
+        np.cumsum(self.values != 0, out=self._prefix[1:])
+
+    def num_occupied(self, start, end):
+        """!
+        Number of occupied (nonzero) slots in [start, end). Out of range indices are clipped like a slice would be
+        """
+        start, end = self._clip(start, end)
+        if end <= start:
+            return 0
+        return int(self._prefix[end] - self._prefix[start])
+
+    def is_free(self, start, end):
+        """!
+        Whether every slot in [start, end) is free
+        """
+        return self.num_occupied(start, end) == 0
@@ -0,0 +1,136 @@
+# Sage Santomenna 2025
+# per-stage wall time, cpu time and peak memory for scheduler runs, written out as a json report next to the schedule
+
+import functools
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_active = None  # the StageTimer that stage() reports to, if any
+
+
+class StageTimer:
+    def __init__(self, trace_memory=False):
+        """!
+        Records how long each named stage of a run takes. Stages can nest; a nested stage is reported under its parent's
+        name joined with "/", and a stage entered more than once (e.g. once per priority) is accumulated
+        @param trace_memory: whether to record the peak (python-allocated, including numpy) memory of each stage with
+        tracemalloc. costs some speed while the timer is active, so it is off unless asked for
+        """
+        self.trace_memory = trace_memory
+        self.stages = {}  # full stage name : {"calls", "wall_s", "cpu_s", "peak_mb", "start_mb"}
+        self._stack = []  # [full name, peak bytes seen so far] for each open stage
+        self._started_tracing = False
+        self._previous = None
+        self.start_time = None
+        self.meta = {}
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+    def start(self):
+        """!
+        Make this the timer that stage() reports to
+        """
+        global _active
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._previous, _active = _active, self
+        self.start_time = datetime.now()
+
+    def stop(self):
+        global _active
+        _active = self._previous
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        """!
+        Time the body of the with statement as stage name
+        """
+        fullName = "/".join([s[0] for s in self._stack[-1:]] + [name])
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        startMem = 0
+        if tracing:
+            # the peak counter is shared, so bank the enclosing stage's peak before resetting it for this one
+            startMem, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        # created on entry so that the report lists stages in the order they were first entered
+        record = self.stages.setdefault(fullName, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_mb": None,
+                                                   "start_mb": None})
+        frame = [fullName, 0]
+        self._stack.append(frame)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            self._stack.pop()
+            if tracing:
+                frame[1] = max(frame[1], tracemalloc.get_traced_memory()[1])
+                if self._stack:
+                    self._stack[-1][1] = max(self._stack[-1][1], frame[1])
+                tracemalloc.reset_peak()
+            record["calls"] += 1
+            record["wall_s"] += wall
+            record["cpu_s"] += cpu
+            if tracing:
+                record["peak_mb"] = max(record["peak_mb"] or 0, frame[1] / 1e6)
+                if record["start_mb"] is None:
+                    record["start_mb"] = startMem / 1e6
+
+    def report(self):
+        """!
+        @return: dictionary of the run's metadata and its stages, in the order they were first entered
+        """
+        return {"started": self.start_time.isoformat() if self.start_time else None, "meta": self.meta,
+                "stages": self.stages}
+
+    def write(self, path):
+        """!
+        Write the report as json
+        """
+        with open(path, "w") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+
+
+def stage(name):
+    """!
+    Time a stage with the active StageTimer, if there is one. Otherwise, does nothing, so that library code can mark its
+    stages without knowing whether anyone is profiling it:
+        with stage("scoring"):
+            ...
+    """
+    if _active is None:
+        return _null_stage()
+    return _active.stage(name)
+
+
+def staged(name):
+    """!
+    Decorator version of stage(): time every call of the decorated function as stage name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def _null_stage():
+    yield
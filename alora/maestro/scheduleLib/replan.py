@@ -0,0 +1,123 @@
+# Sage Santomenna 2025
+# mid-night re-planning: split the previous text schedule into the part that has already run (or is running) and the
+# part that can be replaced, and diff the new text schedule against the previous one
+
+import difflib
+import math
+from datetime import timedelta
+
+from pytz import UTC
+
+from alora.maestro.scheduleLib.genUtils import stringToTime
+from alora.maestro.scheduleLib.schedule import AutoFocus
+
+
+class ScheduledTask:
+    def __init__(self, start, end, candidateID, isFocus, lineIndex):
+        """!
+        One line of a text schedule
+        @param lineIndex: index of the line in the schedule file
+        """
+        self.start, self.end, self.candidateID, self.isFocus, self.lineIndex = start, end, candidateID, isFocus, lineIndex
+
+    def __repr__(self):
+        return f"ScheduledTask({'Focus' if self.isFocus else self.candidateID}, {self.start} - {self.end})"
+
+
+class FrozenSchedule:
+    def __init__(self, lines, replanTime):
+        """!
+        A previous text schedule, split at replanTime. Tasks that start before replanTime have already been executed or
+        are in progress, so they're frozen: they're copied into the new schedule unchanged, and the new schedule only
+        fills the time after them
+        @param lines: the lines of the previous schedule, as written by scheduleToTextFile
+        @param replanTime: timezone-aware datetime. usually now
+        """
+        self.lines = list(lines)
+        self.replanTime = replanTime
+        header = self.lines[0].strip().split("|")
+        self.tasks = []
+        for i, line in enumerate(self.lines[1:], start=1):
+            if not line.strip():
+                continue
+            if "Refocusing" in line:
+                focus = AutoFocus.fromLine(line)
+                self.tasks.append(ScheduledTask(focus.startTime, focus.endTime, None, True, i))
+                continue
+            d = dict(zip(header, line.strip().split("|", len(header) - 1)))
+            start = stringToTime(d["DateTime"], scheduler=True).replace(tzinfo=UTC)
+            duration = float(d["ExposureTime"]) * float(d["#Exposure"])
+            candidateID = d.get("CandidateID")
+            candidateID = int(candidateID) if candidateID not in (None, "None", "-1") else None
+            self.tasks.append(ScheduledTask(start, start + timedelta(seconds=duration), candidateID, False, i))
+        self.frozen = [t for t in self.tasks if t.start < replanTime]
+
+    @classmethod
+    def read(cls, path, replanTime):
+        with open(path, "r") as f:
+            return cls(f.readlines(), replanTime)
+
+    @property
+    def end_time(self):
+        """!
+        When the last frozen task finishes, or replanTime if that's later
+        """
+        return max([t.end for t in self.frozen] + [self.replanTime])
+
+    def resume_time(self, nightStart, resolution=timedelta(minutes=1)):
+        """!
+        The first time after the frozen tasks that falls on the time grid of a schedule starting at nightStart, so that
+        score rows computed for the original schedule line up with the re-planned one
+        """
+        steps = math.ceil((self.end_time - nightStart) / resolution - 1e-9)
+        return nightStart + max(steps, 0) * resolution
+
+    @property
+    def last_focus_time(self):
+        """!
+        Start of the last frozen focus loop, or None if none of the frozen tasks are focus loops
+        """
+        focuses = [t.start for t in self.frozen if t.isFocus]
+        return focuses[-1] if focuses else None
+
+    @property
+    def last_observation(self):
+        """!
+        The last frozen task, if it's an observation of a candidate. None otherwise
+        """
+        if self.frozen and not self.frozen[-1].isFocus and self.frozen[-1].candidateID is not None:
+            return self.frozen[-1]
+        return None
+
+    def observations(self):
+        """!
+        @return: {candidate ID: [frozen tasks observing that candidate, in order]}
+        """
+        obs = {}
+        for t in self.frozen:
+            if t.candidateID is not None:
+                obs.setdefault(t.candidateID, []).append(t)
+        return obs
+
+    def frozen_lines(self):
+        """!
+        @return: the lines of the frozen part of the schedule, without the header, exactly as they were written
+        """
+        if not self.frozen:
+            return []
+        last = self.frozen[-1].lineIndex
+        # scheduleToTextFile writes the header with a blank line after it and puts a blank line after each focus loop
+        first = 2 if len(self.lines) > 1 and not self.lines[1].strip() else 1
+        lines = self.lines[first:last + 1]
+        if self.frozen[-1].isFocus and last + 1 < len(self.lines) and not self.lines[last + 1].strip():
+            lines.append(self.lines[last + 1])
+        return lines
+
+    def diff(self, newLines, fromfile="previous schedule", tofile="re-planned schedule"):
+        """!
+        Unified diff of the previous schedule against newLines
+        @param newLines: lines as returned by scheduleToTextFile. entries may hold more than one line
+        @return: list of diff lines
+        """
+        newLines = "".join(newLines).splitlines(keepends=True)
+        return list(difflib.unified_diff(self.lines, newLines, fromfile=fromfile, tofile=tofile))
@@ -657,6 +657,8 @@ def calculateDowntime(schedule):
             downtime = downtime if downtime.total_seconds() > 0 else timedelta(minutes=0)
             downtimes.append(downtime)
             totalDowntime += downtime
+    if not downtimes:
+        return totalDowntime, timedelta(), timedelta()
     return totalDowntime, max(downtimes), totalDowntime / len(downtimes)
 
 
@@ -686,20 +688,28 @@ def countZTobservations(schedule):
     return numZTF
 
 
-def calculateScore(schedule):
+def calculateScore(schedule, errors=None):
+    """!
+    Score a schedule. higher is better
+    @param schedule: Schedule object, as read from a schedule file
+    @param errors: optional. the number of errors from runTestingSuite, if it has already been run on this schedule
+    @return: the score, float
+    """
     # dictionary of value names to values
     c = {}
 
     c["zt"] = countZTobservations(schedule)
-    c["errors"] = numSchedErrors(schedule)
+    c["errors"] = numSchedErrors(schedule) if errors is None else errors
     c["downtime"] = calculateDowntime(schedule)[0].total_seconds() / 60
     c["meridian"] = observationsNearMeridian(schedule)
     c["numTargets"] = len(schedule.targets)
     c["numObs"] = len(schedule.tasks)
 
-    score = (c["meridian"]) / (c["errors"] * c["downtime"]) * (
+    # errors and downtime can both be zero for a good schedule, so offset them instead of dividing by zero
+    score = (c["meridian"]) / ((c["errors"] + 1) * (c["downtime"] + 1)) * (
             2 * c["numTargets"] + c["numObs"]) * 80  # this needs tuning
     print("Score:", int(score))
+    return score
 
 
 # What makes a good schedule?
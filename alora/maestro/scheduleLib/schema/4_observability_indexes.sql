@@ -0,0 +1,4 @@
+CREATE INDEX IF NOT EXISTS "Candidates_StartObservability" ON "Candidates" ("StartObservability");
+CREATE INDEX IF NOT EXISTS "Candidates_EndObservability" ON "Candidates" ("EndObservability");
+CREATE INDEX IF NOT EXISTS "Candidates_CandidateType" ON "Candidates" ("CandidateType", "EndObservability");
+CREATE INDEX IF NOT EXISTS "Candidates_flags" ON "Candidates" ("flags");
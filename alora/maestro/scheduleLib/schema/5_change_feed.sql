@@ -0,0 +1,18 @@
+ALTER TABLE "Candidates" ADD COLUMN "ChangeSeq" INTEGER DEFAULT 0;
+CREATE TABLE IF NOT EXISTS change_sequence (
+    seq INTEGER NOT NULL
+);
+INSERT INTO change_sequence (seq) SELECT 1 WHERE NOT EXISTS (SELECT 1 FROM change_sequence);
+UPDATE "Candidates" SET "ChangeSeq" = 1;
+CREATE INDEX IF NOT EXISTS "Candidates_ChangeSeq" ON "Candidates" ("ChangeSeq");
+CREATE TRIGGER IF NOT EXISTS candidates_change_on_insert AFTER INSERT ON "Candidates"
+BEGIN
+    UPDATE change_sequence SET seq = seq + 1;
+    UPDATE "Candidates" SET "ChangeSeq" = (SELECT seq FROM change_sequence) WHERE rowid = NEW.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS candidates_change_on_update AFTER UPDATE ON "Candidates"
+WHEN NEW."ChangeSeq" IS OLD."ChangeSeq"
+BEGIN
+    UPDATE change_sequence SET seq = seq + 1;
+    UPDATE "Candidates" SET "ChangeSeq" = (SELECT seq FROM change_sequence) WHERE rowid = NEW.rowid;
+END;
@@ -0,0 +1,3 @@
+CREATE TABLE IF NOT EXISTS "CandidatesArchive" AS SELECT * FROM "Candidates" WHERE 0;
+ALTER TABLE "CandidatesArchive" ADD COLUMN "ArchivedDt" TEXT;
+CREATE INDEX IF NOT EXISTS "CandidatesArchive_ID" ON "CandidatesArchive" ("ID");
@@ -0,0 +1,10 @@
+CREATE TABLE IF NOT EXISTS "CandidateTombstones" (
+    "ID" INTEGER NOT NULL,
+    "ChangeSeq" INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS "CandidateTombstones_ChangeSeq" ON "CandidateTombstones" ("ChangeSeq");
+CREATE TRIGGER IF NOT EXISTS candidates_change_on_delete AFTER DELETE ON "Candidates"
+BEGIN
+    UPDATE change_sequence SET seq = seq + 1;
+    INSERT INTO "CandidateTombstones" ("ID", "ChangeSeq") SELECT OLD."ID", seq FROM change_sequence;
+END;
@@ -0,0 +1,362 @@
+# Sage Santomenna 2025
+# vectorized helpers for building (targets x times) score arrays in one pass instead of block-by-block
+
+import glob
+import hashlib
+import json
+import os
+import sys
+import warnings
+import numpy as np
+import pandas as pd
+from astropy.time import Time
+from astroplan import TimeConstraint
+
+from alora.maestro.scheduleLib.genUtils import stringToTime
+from alora.maestro.scheduleLib.occupancy import zero_prefix
+
+# the same sentinels astroplan's TimeConstraint uses for open-ended windows
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')  # erfa warns about the 'dubious' far-future year
+    _EARLIEST = Time("1950-01-01T00:00:00")
+    _LATEST = Time("2120-01-01T00:00:00")
+
+
+def time_constraint_grid(constraints, times):
+    """!
+    Evaluate many TimeConstraints against a time grid at once
+    @param constraints: list of astroplan TimeConstraint objects, one per row
+    @param times: astropy Time array, the columns of the output
+    @return: boolean array of shape (len(constraints), len(times)), equivalent to stacking each constraint's compute_constraint
+    """
+    lo = Time([_EARLIEST if c.min is None else c.min for c in constraints])
+    hi = Time([_LATEST if c.max is None else c.max for c in constraints])
+    grid = times[np.newaxis, :]
+    return np.logical_and(grid > lo[:, np.newaxis], grid < hi[:, np.newaxis])
+
+
+def block_constraint_scores(observer, blocks, times):
+    """!
+    Multiply together the per-block constraints of all blocks over a time grid. Gives the same result as calling each
+    constraint on each block individually, but evaluates TimeConstraints as one broadcast comparison and evaluates any
+    constraint object shared between blocks once, over all of the blocks that share it
+    @param observer: astroplan Observer
+    @param blocks: list of ObservingBlocks
+    @param times: astropy Time array
+    @return: float array of shape (len(blocks), len(times)). rows of blocks without constraints are all ones
+    """
+    scoreArray = np.ones((len(blocks), len(times)))
+    depth = max([len(b.constraints) if b.constraints else 0 for b in blocks], default=0)
+    # go constraint-by-constraint in the order they were given so that the products come out the same as the serial version
+    for j in range(depth):
+        timeRows, timeConstraints = [], []
+        shared = {}  # id(constraint) : (constraint, [row indices])
+        for i, block in enumerate(blocks):
+            if not block.constraints or len(block.constraints) <= j:
+                continue
+            constraint = block.constraints[j]
+            if type(constraint) is TimeConstraint:
+                timeRows.append(i)
+                timeConstraints.append(constraint)
+            else:
+                shared.setdefault(id(constraint), (constraint, []))[1].append(i)
+        if timeRows:
+            scoreArray[timeRows] *= time_constraint_grid(timeConstraints, times)
+        for constraint, rows in shared.values():
+            scoreArray[rows] *= constraint(observer, [blocks[i].target for i in rows], times=times,
+                                           grid_times_targets=True)
+    return scoreArray
+
+
+def observability_indices(candidates, start, time_resolution):
+    """!
+    Find the schedule time-grid indices of the start and end of each candidate's observability window
+    @param candidates: list of Candidate objects with StartObservability and EndObservability
+    @param start: astropy Time, the start of the schedule
+    @param time_resolution: astropy Quantity, the resolution of the time grid
+    @return: tuple of integer arrays (startIdx, endIdx), truncated toward zero like int()
+    """
+    if not len(candidates):
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    starts = Time([stringToTime(c.StartObservability) for c in candidates])
+    ends = Time([stringToTime(c.EndObservability) for c in candidates])
+    startIdx = np.trunc(((starts - start) / time_resolution).decompose().value).astype(int)
+    endIdx = np.trunc(((ends - start) / time_resolution).decompose().value).astype(int)
+    return startIdx, endIdx
+
+
+class ScoreRow:
+    __slots__ = ("start", "values", "numTimes", "_zeros")
+
+    def __init__(self, start, values, numTimes):
+        """!
+        One block's scores on the schedule's time grid, stored as just the span from its first to its last nonzero score.
+        Every score outside the span is zero. Scores are mostly zero outside of a target's observability window, so on a
+        long night this is a small fraction of the dense row
+        @param start: grid index of the first stored score
+        @param values: the scores from start up to and including the last nonzero score. zeros inside the span are kept
+        @param numTimes: number of columns in the full time grid
+        """
+        self.start = int(start)
+        self.values = np.asarray(values, dtype=float)
+        self.numTimes = int(numTimes)
+        self._zeros = zero_prefix(self.values)[0]  # prefix counts of zero scores inside the span
+
+    @classmethod
+    def from_dense(cls, row):
+        row = np.asarray(row, dtype=float)
+        nonzero = np.flatnonzero(row)
+        if not len(nonzero):
+            return cls(0, np.zeros(0), len(row))
+        return cls(nonzero[0], row[nonzero[0]:nonzero[-1] + 1].copy(), len(row))
+
+    @property
+    def end(self):
+        return self.start + len(self.values)
+
+    def __len__(self):
+        return self.numTimes
+
+    def __getitem__(self, idx):
+        """!
+        The score at grid index idx (an int - use dense() or max() for spans)
+        """
+        if self.start <= idx < self.end:
+            return self.values[idx - self.start]
+        return 0.0
+
+    def _clip(self, start, end):
+        return min(max(start, 0), self.numTimes), min(max(end, 0), self.numTimes)
+
+    def max(self, start, end):
+        """!
+        Highest score in [start, end), like max(dense[start:end]). 0 if the range is empty
+        """
+        start, end = self._clip(start, end)
+        if end <= start:
+            return 0.0
+        lo, hi = max(start, self.start), min(end, self.end)
+        inside = self.values[lo - self.start:hi - self.start].max() if hi > lo else None
+        if inside is None:
+            return 0.0
+        # any part of the range outside the span contributes a zero
+        return inside if (lo == start and hi == end) else max(inside, 0.0)
+
+    def has_zero(self, start, end):
+        """!
+        Whether there is a zero score anywhere in [start, end), in O(1). Indices are clipped like a slice
+        """
+        start, end = self._clip(start, end)
+        if end <= start:
+            return False
+        if start < self.start or end > self.end:
+            return True
+        return self._zeros[end - self.start] - self._zeros[start - self.start] > 0
+
+    def nonzero(self):
+        """!
+        @return: grid indices of the nonzero scores
+        """
+        return self.start + np.flatnonzero(self.values)
+
+    def dense(self, start=0, end=None):
+        """!
+        @return: the scores in [start, end) as an ordinary array, zeros included
+        """
+        end = self.numTimes if end is None else end
+        out = np.zeros(max(end - start, 0))
+        lo, hi = max(start, self.start), min(end, self.end)
+        if hi > lo:
+            out[lo - start:hi - start] = self.values[lo - self.start:hi - self.start]
+        return out
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self._zeros.nbytes
+
+
+class ScoreMatrix:
+    def __init__(self, numTimes):
+        """!
+        Score rows for every block the scheduler considers, each stored as a ScoreRow (only its nonzero span). Adding a
+        row for a repeat observation appends to the store without touching the other rows
+        @param numTimes: number of columns (time slots) in the schedule's time grid
+        """
+        self.numTimes = numTimes
+        self.rows = []
+        self._groups = {}  # group key (priority) : [row indices, in the order they were added]
+
+    @property
+    def size(self):
+        return len(self.rows)
+
+    def add_rows(self, rows, group=None):
+        """!
+        Store a block of dense score rows
+        @param rows: 2D array with one row per block
+        @param group: key to file the rows under, used to order the record
+        @return: list of the row indices the rows were written to
+        """
+        rows = np.atleast_2d(rows)
+        indices = list(range(len(self.rows), len(self.rows) + rows.shape[0]))
+        self.rows.extend(ScoreRow.from_dense(row) for row in rows)
+        self._groups.setdefault(group, []).extend(indices)
+        return indices
+
+    def add_row(self, row, group=None):
+        """!
+        Store a single dense score row (e.g. from scoreRepeatObs)
+        @return: the index of the new row
+        """
+        return self.add_rows(np.asarray(row)[np.newaxis, :], group)[0]
+
+    def __getitem__(self, idx):
+        return self.rows[idx]
+
+    def has_zero(self, row, start, end):
+        """!
+        Whether the given row has a zero score anywhere in [start, end), in O(1). Indices are clipped like a slice
+        """
+        return self.rows[row].has_zero(start, end)
+
+    def ordered_rows(self):
+        """!
+        All rows, grouped in the order the groups were first added to and in insertion order within each group
+        """
+        return [self.rows[i] for indices in self._groups.values() for i in indices]
+
+    def record(self):
+        """!
+        Dense array of ordered_rows(). Built on demand, so nothing is expanded unless the record is actually used
+        """
+        record = np.zeros((self.size, self.numTimes))
+        for i, row in enumerate(self.ordered_rows()):
+            record[i, row.start:row.end] = row.values
+        return record
+
+    def to_dataframe(self, index=None, columns=None):
+        """!
+        DataFrame of the record, for debugging output
+        """
+        return pd.DataFrame(self.record(), index=index, columns=columns)
+
+    @property
+    def nbytes(self):
+        return sum(row.nbytes for row in self.rows)
+
+
+def module_config_fingerprint(typeConfig):
+    """!
+    Digest of the config files (*.toml and *.json) in the directory of the module that a scheduling config comes from,
+    so that score rows computed before the module's config changed aren't reused
+    @param typeConfig: the module's TypeConfiguration object
+    @return: string. empty if the module's directory can't be found
+    """
+    module = sys.modules.get(type(typeConfig).__module__)
+    path = getattr(module, "__file__", None)
+    if path is None:
+        return ""
+    digest = hashlib.sha1()
+    moduleDir = os.path.dirname(os.path.abspath(path))
+    for fname in sorted(glob.glob(os.path.join(moduleDir, "*.toml")) + glob.glob(os.path.join(moduleDir, "*.json"))):
+        digest.update(os.path.basename(fname).encode())
+        with open(fname, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def candidate_fingerprint(candidate, moduleFingerprint=""):
+    """!
+    Key for a candidate's score row: changes whenever anything stored about the candidate changes
+    @param moduleFingerprint: optional. module_config_fingerprint of the candidate's module, so that the key also changes
+    when the module's config does
+    @return: string
+    """
+    d = candidate.asDict()
+    digest = hashlib.sha1(json.dumps(d, sort_keys=True, default=str).encode())
+    digest.update(moduleFingerprint.encode())
+    return f"{candidate.CandidateName}:{digest.hexdigest()}"
+
+
+class ScoreCache:
+    def __init__(self):
+        """!
+        Score rows kept between scheduler runs, keyed by candidate_fingerprint, so that a re-plan only has to score the
+        candidates that are new or have changed since the last run. Each row is stored with the start of the time grid
+        it was computed over, and can be reused for any later grid with the same resolution that starts on one of its
+        columns. Rows are stored before any temperature is applied to them
+        """
+        self.rows = {}  # key : (grid start in unix seconds, ScoreRow)
+        self.resolution = None  # seconds
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def clear(self):
+        self.rows = {}
+
+    def validate(self, resolution):
+        """!
+        Drop every row if they were computed with a different time resolution than the upcoming run
+        @param resolution: astropy Quantity, the resolution of the time grid
+        """
+        resolution = float(resolution.to_value("second"))
+        if resolution != self.resolution:
+            self.clear()
+        self.resolution = resolution
+
+    def get(self, key, start, numTimes):
+        """!
+        @param start: astropy Time, the start of the time grid the row is wanted on
+        @param numTimes: number of columns in that grid
+        @return: the cached row, cut to the grid, or None if there isn't one that covers it
+        """
+        entry = self.rows.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        rowStart, row = entry
+        offset = (start.unix - rowStart) / self.resolution
+        if abs(offset - round(offset)) > 1e-6 or round(offset) < 0 or round(offset) + numTimes > len(row):
+            self.misses += 1
+            return None
+        self.hits += 1
+        offset = int(round(offset))
+        return row.dense(offset, offset + numTimes)
+
+    def put(self, key, start, row):
+        self.rows[key] = (start.unix, ScoreRow.from_dense(row))
+
+    def retain(self, keys):
+        """!
+        Forget every row whose key isn't in keys, so that the cache doesn't grow from night to night
+        """
+        keys = set(keys)
+        self.rows = {k: v for k, v in self.rows.items() if k in keys}
+
+    def save(self, path):
+        keys = list(self.rows.keys())
+        rows = [self.rows[k][1] for k in keys]
+        arrays = {f"row{i}": row.values for i, row in enumerate(rows)}
+        np.savez_compressed(path, keys=np.array(keys, dtype=str),
+                            starts=np.array([self.rows[k][0] for k in keys], dtype=float),
+                            spans=np.array([(row.start, row.numTimes) for row in rows], dtype=np.int64).reshape(-1, 2),
+                            meta=np.array([np.nan if self.resolution is None else self.resolution]), **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """!
+        Load a cache written by save
+        @raise ValueError: if the file isn't in the format save writes
+        """
+        cache = cls()
+        with np.load(path, allow_pickle=False) as f:
+            if not {"keys", "starts", "spans", "meta"} <= set(f.files) or len(f["meta"]) != 1:
+                raise ValueError(f"{path} isn't a score cache written by ScoreCache.save")
+            resolution = f["meta"][0]
+            cache.resolution = None if np.isnan(resolution) else float(resolution)
+            for i, (key, start, (spanStart, numTimes)) in enumerate(zip(f["keys"], f["starts"], f["spans"])):
+                cache.rows[str(key)] = (float(start), ScoreRow(spanStart, f[f"row{i}"], numTimes))
+        return cache
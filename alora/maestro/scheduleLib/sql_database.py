@@ -1,6 +1,7 @@
 import os
 import sqlite3
 from collections.abc import Iterable
+from contextlib import contextmanager
 
 class SQLDatabase:
     def __init__(self):
@@ -53,6 +54,13 @@ class SQLDatabase:
         dud.close() # close it
         self.open(path,check_same_thread,**kwargs)  # reopen according to self.open
 
+    @contextmanager
+    def _reading(self):
+        """!
+        Cursor for a read-only query. Subclasses can hand reads to other connections than the one used for writing
+        """
+        yield self.db_cursor
+
     def table_query(self, table_name, colnames, condition=None, vals=None):
         if isinstance(colnames,str):
             colnames = [colnames]
@@ -60,11 +68,13 @@ class SQLDatabase:
             if not isinstance(vals, Iterable):
                 raise ValueError(f"SQL query vals must be an iterable, not {vals} ({type(vals)})")
             colnames = ','.join(colnames)
-            self.db_cursor.execute(f"SELECT {colnames} FROM {table_name} WHERE {condition}", vals)
-            return self.db_cursor.fetchall()
+            with self._reading() as cursor:
+                cursor.execute(f"SELECT {colnames} FROM {table_name} WHERE {condition}", vals)
+                return cursor.fetchall()
         if condition is None:
-            self.db_cursor.execute(f"SELECT {colnames} FROM {table_name}")
-            return self.db_cursor.fetchall()
+            with self._reading() as cursor:
+                cursor.execute(f"SELECT {colnames} FROM {table_name}")
+                return cursor.fetchall()
         return None
 
     def table_update(self, table_name, colnames, vals, condition):
@@ -7,8 +7,7 @@ from datetime import datetime, timedelta
 from pytz import timezone
 from astropy.time import Time
 import pytz
-# this import might need to be fixed:
-from genUtils import stringToTime, timeToString, get_sunrise_sunset, localize
+from alora.maestro.scheduleLib.genUtils import stringToTime, timeToString, get_sunrise_sunset, localize
 import random
 from datetime import datetime, timedelta
 import time
@@ -1,130 +1,150 @@
 # Sage Santomenna 2023
 from alora.maestro.scheduleLib.crash_reports import run_with_crash_writing
 
-def main():
-
-    import os, sys, time, re
-
-    # dirname = dirname(PyQt6.__file__)
-    # plugin_path = join(Path(__file__).parent, 'PyQt6', 'Qt6', 'plugins')
-    # os.environ['QT_PLUGIN_PATH'] = plugin_path
-    # os.environ['QT_DEBUG_PLUGINS']="1"
-    import copy
-    import json
-    import queue
-    import random
-    import shutil
-    from collections import Counter
-    from datetime import datetime, timedelta
-    from importlib import import_module
-    # import PyQt6
-
-    import astroplan.utils
-    import astropy.units as u
-    import numpy as np
-    import pandas as pd
-    import pytz
-    import seaborn as sns
-    from astroplan import Observer, TimeConstraint, FixedTarget, ObservingBlock, Transitioner
-    from astroplan.scheduling import Schedule
-    from astroplan.target import get_skycoord
-    from astropy.coordinates import EarthLocation
-    from astropy.coordinates import SkyCoord
-    from astropy.time import Time, TimeDelta
-    import matplotlib
-    # matplotlib.use('TKAgg')  # very important
-    from matplotlib import pyplot as plt
-    from matplotlib.colors import ListedColormap
-
-    from alora.maestro.scheduleLib.schedule import scheduleHeader, friendlyString, AutoFocus, Schedule as ScheduleCls
-    from alora.config.utils import Config
-    from alora.config import obs_cfg
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate
-
-    # for packaging reasons, i promise
-
-    from os.path import pardir, join, abspath, dirname, isdir
-    MODULE_PATH = abspath(join(dirname(__file__)))
-    def PATH_TO(fname:str): return join(MODULE_PATH,fname)
-
-    try:
-        sys.path.append(MODULE_PATH)
-
-        from alora.maestro.scheduleLib import genUtils
-        from alora.maestro.scheduleLib.genUtils import stringToTime, roundToTenMinutes, configure_logger
-        from alora.maestro.scheduleLib.module_loader import ModuleManager
-
-        genConfig = genUtils.Config(join(dirname(__file__), "files", "configs", "config.toml"))
-
-    except ImportError:
-        from alora.maestro.scheduleLib import genUtils
-        from alora.maestro.scheduleLib.genUtils import stringToTime, roundToTenMinutes, configure_logger
-        from alora.maestro.scheduleLib.module_loader import ModuleManager
-
-        genConfig = genUtils.Config(join("files", "configs", "config.toml"))
-
-    
-    utc = pytz.UTC
-
-    # and the flags are all dead at the tops of their poles
-
-    BLACK = [0, 0, 0]
-    RED = [255, 0, 0]
-    GREEN = [0, 255, 0]
-    BLUE = [0, 0, 255]
-    ORANGE = [255, 191, 0]
-    PURPLE = [221, 160, 221]
-
-    import logging
-    logger = configure_logger("Scheduler")
-    logging.getLogger('matplotlib').setLevel(logging.WARNING)
-    logging.getLogger('matplotlib.font_manager').disabled = True
-
-    focusLoopLenSeconds = genConfig["focus_loop_duration"]
-
-
-    def generateRandomRow(temperature):
+import os, sys, time, re
+
+# dirname = dirname(PyQt6.__file__)
+# plugin_path = join(Path(__file__).parent, 'PyQt6', 'Qt6', 'plugins')
+# os.environ['QT_PLUGIN_PATH'] = plugin_path
+# os.environ['QT_DEBUG_PLUGINS']="1"
+import copy
+import json
+import math
+import multiprocessing
+import queue
+import random
+import shutil
+import tempfile
+from collections import Counter
+from datetime import datetime, timedelta
+from importlib import import_module
+# import PyQt6
+
+import astroplan.utils
+import astropy.units as u
+import numpy as np
+import pandas as pd
+import pytz
+import seaborn as sns
+from astroplan import Observer, TimeConstraint, FixedTarget, ObservingBlock, Transitioner
+from astroplan.scheduling import Schedule
+from astroplan.target import get_skycoord
+from astropy.coordinates import EarthLocation
+from astropy.coordinates import SkyCoord
+from astropy.time import Time, TimeDelta
+import matplotlib
+# matplotlib.use('TKAgg')  # very important
+from matplotlib import pyplot as plt
+from matplotlib.colors import ListedColormap
+
+from alora.maestro.scheduleLib.schedule import scheduleHeader, friendlyString, AutoFocus, Schedule as ScheduleCls, runTestingSuite, calculateScore
+from alora.config.utils import Config
+from alora.config import obs_cfg
+from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, CandidateSnapshot
+
+# for packaging reasons, i promise
+
+from os.path import pardir, join, abspath, dirname, isdir
+MODULE_PATH = abspath(join(dirname(__file__)))
+def PATH_TO(fname:str): return join(MODULE_PATH,fname)
+
+try:
+    sys.path.append(MODULE_PATH)
+
+    from alora.maestro.scheduleLib import genUtils
+    from alora.maestro.scheduleLib.genUtils import stringToTime, roundToTenMinutes, configure_logger
+    from alora.maestro.scheduleLib.module_loader import ModuleManager
+    from alora.maestro.scheduleLib.scoring import block_constraint_scores, ScoreMatrix, ScoreCache, candidate_fingerprint, \
+        module_config_fingerprint
+    from alora.maestro.scheduleLib.replan import FrozenSchedule
+    from alora.maestro.scheduleLib.occupancy import SlotOccupancy
+    from alora.maestro.schedule import ScheduleOperationError
+    from alora.maestro.annealer import ScheduleAnnealer
+    from alora.maestro.scheduleLib.profiling import StageTimer, stage, staged
+
+    genConfig = genUtils.Config(join(dirname(__file__), "files", "configs", "config.toml"))
+
+except ImportError:
+    from alora.maestro.scheduleLib import genUtils
+    from alora.maestro.scheduleLib.genUtils import stringToTime, roundToTenMinutes, configure_logger
+    from alora.maestro.scheduleLib.module_loader import ModuleManager
+    from alora.maestro.scheduleLib.scoring import block_constraint_scores, ScoreMatrix, ScoreCache, candidate_fingerprint, \
+        module_config_fingerprint
+    from alora.maestro.scheduleLib.replan import FrozenSchedule
+    from alora.maestro.scheduleLib.occupancy import SlotOccupancy
+    from alora.maestro.schedule import ScheduleOperationError
+    from alora.maestro.annealer import ScheduleAnnealer
+    from alora.maestro.scheduleLib.profiling import StageTimer, stage, staged
+
+    genConfig = genUtils.Config(join("files", "configs", "config.toml"))
+
+
+utc = pytz.UTC
+
+# and the flags are all dead at the tops of their poles
+
+BLACK = [0, 0, 0]
+RED = [255, 0, 0]
+GREEN = [0, 255, 0]
+BLUE = [0, 0, 255]
+ORANGE = [255, 191, 0]
+PURPLE = [221, 160, 221]
+
+import logging
+logger = configure_logger("Scheduler")
+logging.getLogger('matplotlib').setLevel(logging.WARNING)
+logging.getLogger('matplotlib.font_manager').disabled = True
+
+focusLoopLenSeconds = genConfig["focus_loop_duration"]
+
+
+def generateRandomRow(temperature):
+    """!
+    Random number generator for temperature and repeat obs stuff
+    @return float? this function is probably incorrectly named
+    """
+
+    return round(random.uniform(1 - temperature, 1 + temperature), 3)
+
+
+class ScorerSwitchboard(astroplan.Scorer):
+    def __init__(self, candidateDict, configDict, temperature, *args, **kwargs):
         """!
-        Random number generator for temperature and repeat obs stuff
-        @return float? this function is probably incorrectly named
+        A scorer that compiles a score array for the schedule to use.
+        @param temperature: randomness applied to the scores. None leaves the scores as they are without drawing any random numbers
         """
+        self.candidateDict = candidateDict  # desig : candidate
+        self.configDict = configDict  # candidate type : config for that type\
+        self.temperature = temperature
+        super(ScorerSwitchboard, self).__init__(*args, **kwargs)
 
-        return round(random.uniform(1 - temperature, 1 + temperature), 3)
-
-
-    class ScorerSwitchboard(astroplan.Scorer):
-        def __init__(self, candidateDict, configDict, temperature, *args, **kwargs):
-            """!
-            A scorer that compiles a score array for the schedule to use.
-            """
-            self.candidateDict = candidateDict  # desig : candidate
-            self.configDict = configDict  # candidate type : config for that type\
-            self.temperature = temperature
-            super(ScorerSwitchboard, self).__init__(*args, **kwargs)
-
-        def create_score_array(self, time_resolution=1 * u.minute, times=None):
-            """!
-            Make the score array for all the targets. calls each config's respective function
-            @param time_resolution:
-            @param times:
-            @return
-            """
-            start = self.schedule.start_time
-            end = self.schedule.end_time
-            if times is None:
-                times = astroplan.time_grid_from_range((start, end), time_resolution)
-            scoreArray = np.zeros(shape=(len(self.blocks), len(times)))  # default is zero
-
-            for candType in self.configDict.keys():  # process groups of blocks with the same type
-                indices = np.where(np.array([block.configuration["type"] == candType for block in self.blocks]))
-                blocksOfType = np.array(self.blocks)[indices]
-                if blocksOfType.size == 0:
-                    continue
+    def create_score_array(self, time_resolution=1 * u.minute, times=None):
+        """!
+        Make the score array for all the targets. calls each config's respective function
+        @param time_resolution:
+        @param times:
+        @return
+        """
+        start = self.schedule.start_time
+        end = self.schedule.end_time
+        if times is None:
+            times = astroplan.time_grid_from_range((start, end), time_resolution)
+        scoreArray = np.zeros(shape=(len(self.blocks), len(times)))  # default is zero
+
+        for candType in self.configDict.keys():  # process groups of blocks with the same type
+            indices = np.where(np.array([block.configuration["type"] == candType for block in self.blocks]))
+            blocksOfType = np.array(self.blocks)[indices]
+            if blocksOfType.size == 0:
+                continue
+            with stage(candType):
                 try:
                     scorer = self.configDict[candType].scorer(self.candidateDict, blocksOfType, self.observer,
                                                             self.schedule,
                                                             global_constraints=self.global_constraints)
                     scoreArr = scorer.create_score_array(time_resolution)
+                    if self.temperature is None:
+                        scoreArray[indices] = scoreArr
+                        continue
                     modifiedArray = np.array([generateRandomRow(self.temperature) for _ in range(scoreArr.shape[0])])
                     modifiedArray = np.tile(modifiedArray, (scoreArr.shape[1], 1)).T
                     scoreArray[indices] = scoreArr * modifiedArray
@@ -132,287 +152,359 @@ def main():
                     # raise e
                     # sys.stderr.write("Error when scoring targets of type {}, using generic scorer instead.".format(candType))
                     # sys.stderr.flush()
-                    scoreArray[indices] = self.genericScoreArray(blocksOfType, time_resolution) * round(
-                        random.uniform(1 - self.temperature, 1 + self.temperature), 3)
-            return scoreArray
-
-        def genericScoreArray(self, blocks, time_resolution):
-            """!
-            Generate a generic array of scores for targets that we couldn't get custom scores for
-            """
-            start = self.schedule.start_time
-            end = self.schedule.end_time
-            times = astroplan.time_grid_from_range((start, end), time_resolution)
-            scoreArray = np.ones((len(blocks), len(times)))
-            for i, block in enumerate(blocks):
-                if block.constraints:
-                    for constraint in block.constraints:
-                        appliedScore = constraint(self.observer, block.target,
-                                                times=times)
-                        scoreArray[i] *= appliedScore
-            for constraint in self.global_constraints:
-                scoreArray *= constraint(self.observer, get_skycoord([block.target for block in blocks]), times,
-                                        grid_times_targets=True)
-            return scoreArray
-
-
-    # this will need to be written to determine when the last focus was so the schedule knows when its first one needs to be
-    def getLastFocusTime(currentTime, schedule):
+                    scoreArray[indices] = self.genericScoreArray(blocksOfType, time_resolution)
+                    if self.temperature is not None:
+                        scoreArray[indices] *= round(random.uniform(1 - self.temperature, 1 + self.temperature), 3)
+        return scoreArray
+
+    def genericScoreArray(self, blocks, time_resolution):
         """!
-        To be implemented: return the time of the most recent focus loop so we know when the next time we have to focus is
+        Generate a generic array of scores for targets that we couldn't get custom scores for
         """
-        return currentTime
+        start = self.schedule.start_time
+        end = self.schedule.end_time
+        times = astroplan.time_grid_from_range((start, end), time_resolution)
+        scoreArray = block_constraint_scores(self.observer, list(blocks), times)
+        for constraint in self.global_constraints:
+            scoreArray *= constraint(self.observer, get_skycoord([block.target for block in blocks]), times,
+                                    grid_times_targets=True)
+        return scoreArray
+
+
+# this will need to be written to determine when the last focus was so the schedule knows when its first one needs to be
+def getLastFocusTime(currentTime, schedule):
+    """!
+    To be implemented: return the time of the most recent focus loop so we know when the next time we have to focus is
+    """
+    return currentTime
+
+
+# @profile
+def makeFocusBlock():
+    """!
+    Make and return a scheduler block for a focus loop
+    """
+    dummyTarget = FixedTarget(coord=SkyCoord(ra=0 * u.deg, dec=0 * u.deg), name="Focus")
+    return ObservingBlock(dummyTarget, focusLoopLenSeconds * u.second, 0,
+                        configuration={"object": "Focus", "type": "Focus",
+                                        "duration": focusLoopLenSeconds},
+                        constraints=None)
+
+
+@staged("plotting/scores")
+def plotScores(scoreMatrix, targetNames, times, title, savepath):
+    """!
+    Plot the scores of all targets over time
+    @param scoreMatrix: ScoreMatrix, the scheduler's score_matrix
+    @param targetNames: list of names of targets, in order of rows, for graph labels.
+    @param times: list of friendly-formatted strings, corresponding to columns of array, for labeling times
+    """
+    targetNames = [t for t in targetNames if t != "Focus"]
+    rows = scoreMatrix.ordered_rows()
+    colors = plt.get_cmap('tab20', len(rows))  # generate a colormap with enough colors
+
+    plt.figure()
+
+    # Plot each row as a line with a different color. only the nonzero span is drawn, with a zero on either side of it
+    for i in range(len(targetNames)):
+        row = rows[i]
+        lo, hi = max(row.start - 1, 0), min(row.end + 1, row.numTimes)
+        plt.plot(np.arange(lo, hi), row.dense(lo, hi), color=colors(i % 20), label=targetNames[i])
+
+    # Determine a reasonable number of datetime labels to display
+    numLabels = min(10, len(times))
+    indices = np.linspace(0, len(times) - 1, numLabels, dtype=int)
+
+    # Generate x-axis labels based on sampled times
+    xLabels = [times[i] for i in indices]
+    plt.xticks(indices, xLabels, rotation=45)
+
+    plt.xlabel('Timestamp')
+    plt.ylabel('Score')
+
+    plt.title(title)
+    # add a legend with the target names
+    plt.legend()
+
+    plt.tight_layout()
+    plt.savefig(os.sep.join([savepath, "scorePlot.png"]))
+    plt.close()
+
+
+BLACK = [0, 0, 0]
+RED = [255, 0, 0]
+GREEN = [0, 255, 0]
+BLUE = [0, 0, 255]
+ORANGE = [255, 191, 0]
+PURPLE = [221, 160, 221]
+
+
+@staged("plotting/observability")
+def visualizeObservability(candidates: list, beginDt, endDt, savepath, title, schedule=None):
+    """!
+    Visualize the observability windows of candidates as a stacked timeline.
+
+    @param candidates: list of Candidate objects
+    @param beginDt: time of beginning of observability window, datetime
+    @param endDt: time of end of observability windows, datetime
+    @param schedule: WIP: dataframe output by a scheduler. if passed, will be overlaid over the graphics. (not functional)
+    @type schedule: DataFrame
+    """
+
+    # Filter for candidates with observability windows
+    observabilityCandidates = [c for c in candidates if
+                            c.hasField("StartObservability") and c.hasField("EndObservability")]
+
+    # Sort candidates by their start times (earliest to latest)
+    observabilityCandidates.sort(key=lambda c: genUtils.stringToTime(c.StartObservability))
+
+    # Calculate start and end timestamps
+    xMin, xMax = beginDt.timestamp(), endDt.timestamp()
+    windowDuration = xMax - xMin
+
+    # Get the unique colors and calculate the number of bars per color
+    numCandidates = len(observabilityCandidates)
+    numColors = len(plt.cm.tab20.colors)
+
+    # Generate a list of colors using a loop
+    colors = []
+    for i in range(numCandidates):
+        colorIndex = i % numColors
+        color = plt.cm.tab20(colorIndex)
+        colors.append(color)
+
+    # Set up the plot
+    fig, ax = plt.subplots(figsize=(10, 7))
+    colorDict = {"GREEN": GREEN, "ORANGE": ORANGE, "RED": RED, "BLACK": BLACK, "PURPLE": PURPLE}
+
+    # if schedule is not None:
+    #     df = schedule.to_pandas()
+    #     print(df)
+
+    # Iterate over observability candidates and plot their windows
+    for i, candidate in enumerate(observabilityCandidates):
+        # TODO: take the time to actually figure out why the UTC stuff doesn't work instead of just applying this hardcoded offset:
+        startTime = genUtils.stringToTime(candidate.StartObservability)  # UTC conversion. this sucks
+        endTime = genUtils.stringToTime(candidate.EndObservability)
+
+        # Convert start time and end time to Unix timestamps
+        startUnix = startTime.timestamp()
+        endUnix = endTime.timestamp()
+
+        # Calculate the duration of the observability window
+        duration = endUnix - startUnix
+
+        # Plot a rectangle representing the observability window
+        ax.barh(i, duration, left=startUnix, height=0.6, color=np.array(colorDict[candidate.ApproachColor]) / 255)
+
+        # Place the label at the center of the bar
+        ax.text(max(startUnix + duration / 2, xMin + duration / 2), i, candidate.CandidateName, ha='center',
+                va='center', bbox={'facecolor': 'white', 'alpha': 0.75, 'pad': 5})
 
+    # Set the x-axis limits based on start and end timestamps
+    ax.set_xlim(xMin, xMax + windowDuration / 10)
 
+    # Format x-axis labels as human-readable datetime
     # @profile
-    def makeFocusBlock():
-        """!
-        Make and return a scheduler block for a focus loop
-        """
-        dummyTarget = FixedTarget(coord=SkyCoord(ra=0 * u.deg, dec=0 * u.deg), name="Focus")
-        return ObservingBlock(dummyTarget, focusLoopLenSeconds * u.second, 0,
-                            configuration={"object": "Focus", "type": "Focus",
-                                            "duration": focusLoopLenSeconds},
-                            constraints=None)
+    def formatFunc(value, tickNumber):
+        dt = datetime.fromtimestamp(value)
+        return dt.strftime("%H:%M\n%d-%b")
 
+    ax.xaxis.set_major_formatter(plt.FuncFormatter(formatFunc))
 
-    def plotScores(scoreArray, targetNames, times, title, savepath):
-        """!
-        Plot the scores of all targets over time
-        @param scoreArray: returned from scheduler
-        @param targetNames: list of names of targets, in order of rows, for graph labels.
-        @param times: list of friendly-formatted strings, corresponding to columns of array, for labeling times
-        """
-        targetNames = [t for t in targetNames if t != "Focus"]
+    # Set the x-axis label
+    ax.set_xlabel("Time (UTC)")
 
-        x = np.arange(scoreArray.shape[1])  # create x-axis values based on the number of columns
-        colors = plt.get_cmap('tab20', len(scoreArray))  # generate a colormap with enough colors
+    # Set the y-axis label
+    ax.set_ylabel("Candidates")
 
-        plt.figure()
+    # Adjust spacing
+    plt.subplots_adjust(left=0.1, right=0.95, bottom=0.1, top=0.9)
+    plt.suptitle("Candidates for Tonight")
+    plt.title(
+        beginDt.strftime("%b %d, %Y, %H:%M") + " to " + endDt.strftime(
+            "%b %d, %Y, %H:%M"))
 
-        # Plot each row as a line with a different color
-        for i in range(len(targetNames)):
-            plt.plot(x, scoreArray[i], color=colors(i % 20), label=targetNames[i])
+    # Show the plot
+    plt.savefig(join(savepath, title + ".png"))
+    plt.close(fig)
 
-        # Determine a reasonable number of datetime labels to display
-        numLabels = min(10, len(times))
-        indices = np.linspace(0, len(times) - 1, numLabels, dtype=int)
 
-        # Generate x-axis labels based on sampled times
-        xLabels = [times[i] for i in indices]
-        plt.xticks(indices, xLabels, rotation=45)
+class TMOScheduler(astroplan.scheduling.Scheduler):
+    # @profile
+    def __init__(self, candidateDict, configDict, temperature, transitioner_dict, *args, score_csv_path=None, score_plot_dir=None,
+                 score_cache=None, prior_observations=None, previous_block=None, last_focus_time=None, **kwargs):
+        """!
+        Create the scheduler object that will be used to make the schedule
+        @param candidateDict: {desig: candidate object} - technically could be constructed from list of blocks, but i think we need it in the function that initializes this object anyway
+        @param configDict: {type of candidate (block.configuration["type"]) : TypeConfiguration object}
+        @param temperature: float, 0-10. amount of randomness to apply to scoring. 0 = deterministic
+        @param transitioner_dict: {object type: Transitioner object}. This will be used for actually doing transitions. the transitioner argument to the parent constructor is not used!
+        @param score_csv_path: optional. if provided, the final score matrix is written here as a csv (rows: blocks, columns: times)
+        @param score_plot_dir: optional. if provided, a plot of the scores of all targets is saved to this directory as scorePlot.png
+        @param score_cache: optional. ScoreCache to take score rows from and to store new ones in. only blocks whose candidates aren't in the cache are scored
+        @param prior_observations: optional, for re-planning. {desig: [frozen ScheduledTasks]} of observations made before the start of the schedule
+        @param previous_block: optional, for re-planning. the block observed just before the start of the schedule, to transition from
+        @param last_focus_time: optional. astropy Time of the last focus loop before the start of the schedule. defaults to the start of the schedule
+        @param args: normal arguments passed to an astroplan.scheduling.Scheduler constructor
+        @param kwargs: normal keyword arguments passed to an astroplan.scheduling.Scheduler constructor
+        """
 
-        plt.xlabel('Timestamp')
-        plt.ylabel('Score')
+        self.candidateDict = candidateDict
+        self.configDict = configDict  #
+        self.temperature = temperature
+        self.transitioners = transitioner_dict # not to be confused with the transitioner argument to the parent constructor, which is not used!
+        self.score_csv_path = score_csv_path
+        self.score_plot_dir = score_plot_dir
+        self.score_matrix = None
+        self.block_rows = {}  # {id(block): row of score_matrix holding that block's scores}, filled in by _make_schedule
+        self.score_cache = score_cache
+        self.prior_observations = prior_observations or {}
+        self.previous_block = previous_block
+        self.last_focus_time = last_focus_time
+        super(TMOScheduler, self).__init__(*args, **kwargs)  # initialize rest of schedule with normal arguments
 
-        plt.title(title)
-        # add a legend with the target names
-        plt.legend()
+    # @profile
+    def __call__(self, blocks: dict, excludedTimeRanges, schedule: Schedule):
+        """!
+        initiate the schedule-making process
+        @param blocks: the dictionary of blocks - for format, see
+        @param excludedTimeRanges: list[(tuple(int(startSeconds),int(endSeconds))]
+        @param schedule: (presumably empty) schedule to populate
+        @return populated schedule
+        """
 
-        plt.tight_layout()
-        plt.savefig(os.sep.join([savepath, "scorePlot.png"]))
-        plt.close()
+        self.schedule = schedule
+        self.schedule.observer = self.observer
+        schedule = self._make_schedule(blocks, excludedTimeRanges)
+        return schedule
 
+    def _last_block(self):
+        """!
+        The block that the next block will follow: the last one in the schedule or, if the schedule is empty, the one observed before it started (if any)
+        """
+        if len(self.schedule.slots) != 1:
+            return self.schedule.observing_blocks[-1]
+        return self.previous_block
 
-    BLACK = [0, 0, 0]
-    RED = [255, 0, 0]
-    GREEN = [0, 255, 0]
-    BLUE = [0, 0, 255]
-    ORANGE = [255, 191, 0]
-    PURPLE = [221, 160, 221]
+    def _slot_position(self, t):
+        """!
+        Where t falls on the time grid, in slots since the start of the schedule. Rounded to a millionth of a slot, so that floating point error in the time arithmetic can't put a time on a slot boundary into the slot before it
+        """
+        return round(float((t - self.schedule.start_time) / self.time_resolution), 6)
 
+    def _score_blocks(self, blocks, timeGrid):
+        """!
+        Make the score array for the blocks, taking the rows of unchanged candidates from the score cache (if there is one) and only scoring the rest.
+        The cache holds rows without temperature, so the temperature is applied to every row afterwards, the same way for cached and new rows
+        @return: numpy array with dimensions (rows: blocks, columns: time slots). a zero means the block's object does not meet all of its constraints at that time
+        """
+        if self.score_cache is None:
+            scorer = ScorerSwitchboard(self.candidateDict, self.configDict, self.temperature, blocks, self.observer,
+                                       self.schedule, global_constraints=self.constraints)
+            return scorer.create_score_array(self.time_resolution, times=timeGrid)
+
+        cache = self.score_cache
+        cache.validate(self.time_resolution)
+        start = self.schedule.start_time
+        moduleFingerprints = {name: module_config_fingerprint(config) for name, config in self.configDict.items()}
+        keys = [candidate_fingerprint(b.configuration["candidate"], moduleFingerprints.get(b.configuration["type"], ""))
+                for b in blocks]
+        allScores = np.zeros((len(blocks), len(timeGrid)))
+        missing = []
+        for i, key in enumerate(keys):
+            row = cache.get(key, start, len(timeGrid))
+            if row is None:
+                missing.append(i)
+            else:
+                allScores[i] = row
+        if missing:
+            scorer = ScorerSwitchboard(self.candidateDict, self.configDict, None, [blocks[i] for i in missing],
+                                       self.observer, self.schedule, global_constraints=self.constraints)
+            allScores[missing] = scorer.create_score_array(self.time_resolution, times=timeGrid)
+            for i in missing:
+                cache.put(keys[i], start, allScores[i])
+        cache.retain(keys)
+        logger.info(f"Scored {len(missing)} of {len(blocks)} blocks, took the rest from the score cache")
+        # one factor per row, drawn in block order, so that a seeded run gets the same noise whichever of its rows came from the cache
+        factors = np.array([generateRandomRow(self.temperature) for _ in blocks])
+        return allScores * factors[:, np.newaxis]
 
     # @profile
-    def visualizeObservability(candidates: list, beginDt, endDt, savepath, title, schedule=None):
+    def _make_schedule(self, allBlocks: dict, excludedTimeRanges):
         """!
-        Visualize the observability windows of candidates as a stacked timeline.
-
-        @param candidates: list of Candidate objects
-        @param beginDt: time of beginning of observability window, datetime
-        @param endDt: time of end of observability windows, datetime
-        @param schedule: WIP: dataframe output by a scheduler. if passed, will be overlaid over the graphics. (not functional)
-        @type schedule: DataFrame
+        This is the actual function that makes the schedule.
         """
 
-        # Filter for candidates with observability windows
-        observabilityCandidates = [c for c in candidates if
-                                c.hasField("StartObservability") and c.hasField("EndObservability")]
-
-        # Sort candidates by their start times (earliest to latest)
-        observabilityCandidates.sort(key=lambda c: genUtils.stringToTime(c.StartObservability))
-
-        # Calculate start and end timestamps
-        xMin, xMax = beginDt.timestamp(), endDt.timestamp()
-        windowDuration = xMax - xMin
-
-        # Get the unique colors and calculate the number of bars per color
-        numCandidates = len(observabilityCandidates)
-        numColors = len(plt.cm.tab20.colors)
-
-        # Generate a list of colors using a loop
-        colors = []
-        for i in range(numCandidates):
-            colorIndex = i % numColors
-            color = plt.cm.tab20(colorIndex)
-            colors.append(color)
-
-        # Set up the plot
-        fig, ax = plt.subplots(figsize=(10, 7))
-        colorDict = {"GREEN": GREEN, "ORANGE": ORANGE, "RED": RED, "BLACK": BLACK, "PURPLE": PURPLE}
-
-        # if schedule is not None:
-        #     df = schedule.to_pandas()
-        #     print(df)
-
-        # Iterate over observability candidates and plot their windows
-        for i, candidate in enumerate(observabilityCandidates):
-            # TODO: take the time to actually figure out why the UTC stuff doesn't work instead of just applying this hardcoded offset:
-            startTime = genUtils.stringToTime(candidate.StartObservability)  # UTC conversion. this sucks
-            endTime = genUtils.stringToTime(candidate.EndObservability)
-
-            # Convert start time and end time to Unix timestamps
-            startUnix = startTime.timestamp()
-            endUnix = endTime.timestamp()
-
-            # Calculate the duration of the observability window
-            duration = endUnix - startUnix
-
-            # Plot a rectangle representing the observability window
-            ax.barh(i, duration, left=startUnix, height=0.6, color=np.array(colorDict[candidate.ApproachColor]) / 255)
-
-            # Place the label at the center of the bar
-            ax.text(max(startUnix + duration / 2, xMin + duration / 2), i, candidate.CandidateName, ha='center',
-                    va='center', bbox={'facecolor': 'white', 'alpha': 0.75, 'pad': 5})
-
-        # Set the x-axis limits based on start and end timestamps
-        ax.set_xlim(xMin, xMax + windowDuration / 10)
-
-        # Format x-axis labels as human-readable datetime
-        # @profile
-        def formatFunc(value, tickNumber):
-            dt = datetime.fromtimestamp(value)
-            return dt.strftime("%H:%M\n%d-%b")
-
-        ax.xaxis.set_major_formatter(plt.FuncFormatter(formatFunc))
-
-        # Set the x-axis label
-        ax.set_xlabel("Time (UTC)")
-
-        # Set the y-axis label
-        ax.set_ylabel("Candidates")
-
-        # Adjust spacing
-        plt.subplots_adjust(left=0.1, right=0.95, bottom=0.1, top=0.9)
-        plt.suptitle("Candidates for Tonight")
-        plt.title(
-            beginDt.strftime("%b %d, %Y, %H:%M") + " to " + endDt.strftime(
-                "%b %d, %Y, %H:%M"))
-
-        # Show the plot
-        plt.savefig(join(savepath, title + ".png"))
-        plt.close(fig)
-
-
-    class TMOScheduler(astroplan.scheduling.Scheduler):
-        # @profile
-        def __init__(self, candidateDict, configDict, temperature, transitioner_dict, *args, **kwargs):
-            """!
-            Create the scheduler object that will be used to make the schedule
-            @param candidateDict: {desig: candidate object} - technically could be constructed from list of blocks, but i think we need it in the function that initializes this object anyway
-            @param configDict: {type of candidate (block.configuration["type"]) : TypeConfiguration object}
-            @param temperature: float, 0-10. amount of randomness to apply to scoring. 0 = deterministic
-            @param transitioner_dict: {object type: Transitioner object}. This will be used for actually doing transitions. the transitioner argument to the parent constructor is not used!
-            @param args: normal arguments passed to an astroplan.scheduling.Scheduler constructor
-            @param kwargs: normal keyword arguments passed to an astroplan.scheduling.Scheduler constructor
-            """
-
-            self.candidateDict = candidateDict
-            self.configDict = configDict  #
-            self.temperature = temperature
-            self.transitioners = transitioner_dict # not to be confused with the transitioner argument to the parent constructor, which is not used!
-            super(TMOScheduler, self).__init__(*args, **kwargs)  # initialize rest of schedule with normal arguments
-
-        # @profile
-        def __call__(self, blocks: dict, excludedTimeRanges, schedule: Schedule):
-            """!
-            initiate the schedule-making process
-            @param blocks: the dictionary of blocks - for format, see
-            @param excludedTimeRanges: list[(tuple(int(startSeconds),int(endSeconds))]
-            @param schedule: (presumably empty) schedule to populate
-            @return populated schedule
-            """
-
-            self.schedule = schedule
-            self.schedule.observer = self.observer
-            schedule = self._make_schedule(blocks, excludedTimeRanges)
-            return schedule
-
-        # @profile
-        def _make_schedule(self, allBlocks: dict, excludedTimeRanges):
-            """!
-            This is the actual function that makes the schedule.
-            """
-
-            priorities = list(allBlocks.keys())
-            priorities.sort()
-            start = self.schedule.start_time
-            end = self.schedule.end_time
-            timeGrid = astroplan.time_grid_from_range((start, end), self.time_resolution)
-            times = [friendlyString(t.datetime) for t in timeGrid]
-            schedArr = np.zeros(len(times))  # 0 = slot empty, n = slot full, where n is the priority tier of the object
-            for r in excludedTimeRanges:
-                iStart, iEnd = max(int((r[0] - start.unix) / self.time_resolution.value), 0), min(
-                    int((r[1] - start.unix) / self.time_resolution.value), len(times))
-                schedArr[iStart:iEnd] = -1
-
-            # print(schedArr)
-            arrayDf = None
-            loops = 0
-            checks = 0
-            scoreSkips = 0
-            recordArray = None
-            print("Priorities:",priorities)
-            for p in priorities:  # go through this loop for each of the targets, in ascending order
+        priorities = list(allBlocks.keys())
+        priorities.sort()
+        start = self.schedule.start_time
+        end = self.schedule.end_time
+        timeGrid = astroplan.time_grid_from_range((start, end), self.time_resolution)
+        times = [friendlyString(t.datetime) for t in timeGrid]
+        schedArr = SlotOccupancy(len(times))  # 0 = slot empty, n = slot full, where n is the priority tier of the object
+        for r in excludedTimeRanges:
+            # round outward, so a slot that is only partly excluded is excluded
+            iStart, iEnd = max(math.floor((r[0] - start.unix) / self.time_resolution.value), 0), min(
+                math.ceil((r[1] - start.unix) / self.time_resolution.value), len(times))
+            schedArr.mark(iStart, iEnd, -1)
+        scheduledBlockIds = set()  # ids of the blocks already in the schedule, so we don't have to search observing_blocks
+
+        # print(schedArr)
+        loops = 0
+        checks = 0
+        scoreSkips = 0
+        print("Priorities:",priorities)
+
+        # gather all the constraints on each block into a single attribute:
+        orderedBlocks = [b for p in priorities for b in allBlocks[p]]
+        for b in orderedBlocks:
+            if b.constraints is None:
+                b._all_constraints = self.constraints
+            else:
+                b._all_constraints = self.constraints + b.constraints
+            b.observer = self.observer  # set the observer (location and timezone info stuff) (one of the arguments to the constructor that is passed to the parent constructor)
+
+        # each row is stored as just its nonzero span, so the dense scores only exist until they've been filed away
+        scoreMatrix = ScoreMatrix(len(times))
+        self.score_matrix = scoreMatrix
+        rowsByPriority = {}  # rowsByPriority[p][i] is the row of scoreMatrix that holds the scores for allBlocks[p][i]
+        if orderedBlocks:
+            # score every block, across all priorities, at once
+            with stage("scoring"):
+                allScores = self._score_blocks(orderedBlocks, timeGrid)
+                offset = 0
+                for p in priorities:
+                    blocks = allBlocks[p]
+                    for i, b in enumerate(blocks):
+                        if self.configDict[b.configuration["type"]].numObs > 1:
+                            prior = self.prior_observations.get(b.target.name, [])
+                            if prior:
+                                # observed before a re-plan: this block is really its next repeat observation
+                                c = self.candidateDict[b.target.name]
+                                allScores[offset + i] = self.configDict[c.CandidateType].scoreRepeatObs(
+                                    c, copy.copy(allScores[offset + i]), len(prior), Time(prior[-1].end))
+                            b.target.name += f"_{len(prior) + 1}"
+                            b.configuration["object"] += f"_{len(prior) + 1}"
+                    rowsByPriority[p] = scoreMatrix.add_rows(allScores[offset:offset + len(blocks)], group=p) if blocks else []
+                    offset += len(blocks)
+                    self.block_rows.update(zip(map(id, blocks), rowsByPriority[p]))
+                del allScores
+
+        for p in priorities:  # go through this loop for each of the targets, in ascending order
+            with stage(f"placement/priority {p}"):
                 blocks = allBlocks[p]
-                # gather all the constraints on each block into a single attribute:
-                for b in blocks:
-                    if b.constraints is None:
-                        b._all_constraints = self.constraints
-                    else:
-                        b._all_constraints = self.constraints + b.constraints
-                    b.observer = self.observer  # set the observer (location and timezone info stuff) (one of the arguments to the constructor that is passed to the parent constructor)
-
-                scorer = ScorerSwitchboard(self.candidateDict, self.configDict, self.temperature, blocks, self.observer,
-                                        self.schedule,
-                                        global_constraints=self.constraints)  # initialize our scorer object, which will calculate a score for each object at each time slot in the schedule
-                scoreArray = scorer.create_score_array(
-                    self.time_resolution, times=timeGrid)
-                bNames = [b.target.name for b in blocks]
-
-                newScores = pd.DataFrame(scoreArray, columns=times, index=bNames)
-                if arrayDf is None:
-                    arrayDf = newScores
-                else:
-                    arrayDf = pd.concat([arrayDf, newScores])
-                # print(arrayDf)
-                arrayDf.to_csv("arrayDf.csv")
-
-                # this calculates the scores for the blocks at each time, returning a numpy array with dimensions (rows: number of blocks, columns: schedule length/time_resolution (time slots) )
-                # if an element in the array is zero, it means the row's corresponding object does not meet all the constraints at the column's corresponding time
-
-                for b in blocks:
-                    if self.configDict[b.configuration["type"]].numObs > 1:
-                        b.target.name += "_1"
-                        b.configuration["object"] += "_1"
-
-                lastFocusTime = getLastFocusTime(start, None)
-                # ^ this is a placedholder right now, need to know how long before the beginning of our scheduling period the last SUCCESSFUL focus loop happened
+                # blockRows[i] is the row of scoreMatrix that holds the scores for blocks[i]
+                blockRows = rowsByPriority.get(p, [])
+
+                lastFocusTime = self.last_focus_time if self.last_focus_time is not None else getLastFocusTime(start, None)
+                # ^ getLastFocusTime is a placedholder right now, need to know how long before the beginning of our scheduling period the last SUCCESSFUL focus loop happened
                 currentTime = start
 
                 # scheduledDict = {b.target.name.split("_")[0]: b.start_time for b in self.schedule.observing_blocks}
                 # scheduledNames = [b.target.name.split("_")[0] for b in self.schedule.observing_blocks]
-                scheduledDict = {}
-                scheduledNames = []
+                scheduledDict = {d: Time(obs[-1].start) for d, obs in self.prior_observations.items()}
+                scheduledNames = [d for d, obs in self.prior_observations.items() for _ in obs]
 
                 while self.schedule.end_time - currentTime > self.time_resolution:
                     loops += 1
@@ -422,20 +514,20 @@ def main():
                     # print("scheduled names:",scheduledNames)
                     # print([b.target.name for b in blocks])
                     # print([b.target.name for b in self.schedule.observing_blocks])
-                    currentIdx = int((currentTime - start) / self.time_resolution)
+                    currentIdx = math.floor(self._slot_position(currentTime))
                     # print(currentTime, currentIdx, self.schedule.end_time,self.schedule.end_time-currentTime,type(self.schedule.end_time-currentTime), type(currentTime), type(self.schedule.end_time))
                     if schedArr[currentIdx]:  # higher-priority object already here
                         currentTime += self.gap_time
                         continue
                     bestScore = 0
                     for i, block in enumerate(blocks):
-                        durationIdx = int(block.duration / self.time_resolution)
-                        if max(scoreArray[i][
-                            currentIdx:currentIdx + durationIdx]) < bestScore:  # there's no way this block could get a higher score
+                        # round up, so a block that ends partway through a slot still claims that slot
+                        durationSlots = round(float(block.duration / self.time_resolution), 6)
+                        durationIdx = math.ceil(durationSlots)
+                        if scoreMatrix[blockRows[i]].max(currentIdx, currentIdx + durationIdx) < bestScore:  # there's no way this block could get a higher score
                             scoreSkips += 1
                             continue
-                        if any(schedArr[
-                            currentIdx:currentIdx + durationIdx]) or block in self.schedule.observing_blocks:  # higher-priority object already here or already scheduled this object
+                        if not schedArr.is_free(currentIdx, currentIdx + durationIdx) or id(block) in scheduledBlockIds:  # higher-priority object already here or already scheduled this object
                             continue
 
                         checks += 1
@@ -448,8 +540,8 @@ def main():
                                 minutes=config.maxMinutesWithoutFocus):  # focus loop needed
                             focusBlock = makeFocusBlock()  # ----- slow
                             T2 = None
-                            if len(self.schedule.slots) != 1:
-                                old_block = self.schedule.observing_blocks[-1]
+                            old_block = self._last_block()
+                            if old_block is not None:
                                 old_transitioner = self.transitioners[old_block.configuration["type"]]
                                 T2 = old_transitioner(old_block, focusBlock, runningTime,
                                                     self.observer)
@@ -463,14 +555,14 @@ def main():
                                 continue
                         else:  # no focus loop needed, but we may need a transition between the last obs and this one
                             T1 = None
-                            if len(self.schedule.slots) != 1:
-                                old_block = self.schedule.observing_blocks[-1]
+                            old_block = self._last_block()
+                            if old_block is not None:
                                 if old_block.configuration["type"] != "Focus":
                                     transitioner = self.transitioners[old_block.configuration["type"]]
                                 else:
                                     transitioner = self.transitioners[block.configuration["type"]]
-                                
-                                T1 = transitioner(self.schedule.observing_blocks[-1], block, currentTime,
+                            
+                                T1 = transitioner(old_block, block, currentTime,
                                                     self.observer)
                                 if T1 is not None:  # transition needed
                                     schedQueue.put(T1)
@@ -480,10 +572,12 @@ def main():
                                     continue
                         # if any score during the block's duration would be 0, if it takes us past the end, or if it intrudes on a previously-scheduled block, reject it
                         # this index calculation takes ~15% of runtime:
-                        runningIdx = int((runningTime - start) / self.time_resolution)
-                        if any(scoreArray[i][currentIdx:runningIdx + durationIdx] == 0) \
+                        runningPos = self._slot_position(runningTime)
+                        runningIdx = math.floor(runningPos)
+                        endIdx = math.ceil(round(runningPos + durationSlots, 6))
+                        if scoreMatrix.has_zero(blockRows[i], currentIdx, endIdx) \
                                 or runningTime + block.duration > self.schedule.end_time \
-                                or any(schedArr[currentIdx:runningIdx + durationIdx]):
+                                or not schedArr.is_free(currentIdx, endIdx):
                             continue
                         if re.sub('_\\d', '', block.target.name) in scheduledDict.keys():
                             if config.minMinutesBetweenObs:
@@ -491,7 +585,7 @@ def main():
                                         minutes=config.minMinutesBetweenObs):
                                     continue
                         schedQueue.put(block)
-                        score = scoreArray[i, runningIdx]
+                        score = scoreMatrix[blockRows[i]][runningIdx]
                         bestScore = bestScore if bestScore > score else score
                         # prospectiveDict[score * 0.8 if focused else score] = schedQueue
                         prospectiveDict[score] = schedQueue
@@ -515,9 +609,10 @@ def main():
                                 justInserted = b
                         # print("Inserting",b)
                         self.schedule.insert_slot(currentTime, b)
+                        scheduledBlockIds.add(id(b))
                         currentTime += b.duration
                     # block off the schedule where we just added something:
-                    schedArr[currentIdx:int((currentTime - start) / self.time_resolution)] = p  
+                    schedArr.mark(currentIdx, math.ceil(self._slot_position(currentTime)), p)
                     # 'currentIdx' is still the idx from the beginning of this pass
                     config = self.configDict[justInserted.configuration["type"]]
                     numPrev = len(
@@ -526,193 +621,281 @@ def main():
                         justIdx = blocks.index(justInserted)  # very efficient lol
                         c = self.candidateDict[re.sub('_\\d', '', justInserted.target.name)]
                         conf = self.configDict[c.CandidateType]
-                        newArr = copy.copy(scoreArray[justIdx, :])
+                        newArr = scoreMatrix[blockRows[justIdx]].dense()
                         newArr = conf.scoreRepeatObs(c, newArr, numPrev, currentTime)
-                        scoreArray = np.r_[scoreArray, [newArr]]
+                        blockRows.append(scoreMatrix.add_row(newArr, group=p))  # only this new row's span is stored
 
                         # --------- this copy might be slow:
                         blockCopy = copy.deepcopy(justInserted)
                         blockCopy.target.name = blockCopy.target.name[:-2] + "_" + str(numPrev + 1)
                         blockCopy.configuration["object"] = blockCopy.target.name[:-2] + "_" + str(numPrev + 1)
                         blocks.append(blockCopy)
+                        self.block_rows[id(blockCopy)] = blockRows[-1]
 
                     continue
 
-                recordArray = np.r_[recordArray, scoreArray] if recordArray is not None else scoreArray
-            # print("Loops:", loops)
-            # print("Checks:", checks)
-            # print("Skips:", scoreSkips)
-            allBlocksList = []
-            for l in allBlocks.values():
-                allBlocksList.extend(l)
-            # NOTE: this function call only "works" because the Astrophotography targets come last in the array - that's why we can cut them from the list
-            non_aphot_blocks = [b.target.name for b in allBlocksList if b.configuration["type"] != "Astrophotography"]
-            if len(non_aphot_blocks):
-                plotScores(recordArray, non_aphot_blocks, times, "All Targets", savepath)
-            return self.schedule
-
+        # print("Loops:", loops)
+        # print("Checks:", checks)
+        # print("Skips:", scoreSkips)
+        allBlocksList = []
+        for l in allBlocks.values():
+            allBlocksList.extend(l)
+        # NOTE: this function call only "works" because the Astrophotography targets come last in the array - that's why we can cut them from the list
+        non_aphot_blocks = [b.target.name for b in allBlocksList if b.configuration["type"] != "Astrophotography"]
+        if len(non_aphot_blocks) and self.score_plot_dir is not None:
+            plotScores(scoreMatrix, non_aphot_blocks, times, "All Targets", self.score_plot_dir)
+        if self.score_csv_path:
+            scoreMatrix.to_dataframe(index=[b.target.name for b in allBlocksList], columns=times).to_csv(self.score_csv_path)
+        return self.schedule
+
+
+@staged("plotting/schedule")
+def visualizeSchedule(scheduleDf: pd.DataFrame, plotSavepath, csvSavepath, startDt=None, endDt=None, addTitleText=None,
+                    save=True, show=False):
+    """!
+    Take a schedule dataframe and visualize it. optionally, save the schedule csv
+    @param scheduleDf: the schedule dataframe, cleaned
+    @param plotSavepath: where to save the generated plot
+    @param csvSavepath: where to save the schedule csv file
+    @param addTitleText: optional additional title text
+    @param save: bool. whether or not to save the image and csv
+    @param show: bool. whether or not to show the image when generated, pausing the program the plot is closed
+    @return None
+    """
+
+    schedule = scheduleDf.loc[(scheduleDf["Target"] != "TransitionBlock")]
+    if startDt is None:
+        startDt = stringToTime(schedule.iloc[0]["Start Time (UTC)"])
+    if endDt is None:
+        endDt = stringToTime(schedule.iloc[len(schedule.index) - 1]["End Time (UTC)"])
+
+    print("Start:", startDt, "End:", endDt)
+    print("Start tz:", startDt.tzinfo, "End tz:", endDt.tzinfo)
+    xMin, xMax = startDt.timestamp(), endDt.timestamp()
+    print("Min:", xMin, "Max:", xMax)
+
+    xTicks = []
+    val = xMax - xMax % 3600
+    while val > xMin:
+        xTicks.append(val)
+        val -= 3600
+
+    targetNames = schedule.loc[(schedule["Target"] != "Unused Time") & (schedule["Target"] != "TransitionBlock")][
+        "Target"].tolist()
+    targetNames = list(set([re.sub('_\\d', '', t) for t in targetNames]))
+    numTargets = len(targetNames)
+
+    sbPalette = sns.color_palette("hls", numTargets)
+    cmap = ListedColormap(sns.color_palette(sbPalette).as_hex())
+
+    colorDict = {}
+    for i in range(numTargets):
+        color = cmap(i)
+        colorDict[targetNames[i]] = color
+    colorDict["Unused Time"] = plt.cm.tab20(14)
+    colorDict["TransitionBlock"] = plt.cm.tab20(17)
+
+    fig, ax = plt.subplots(figsize=(4, 8))
+    for i in range(0, len(schedule.index)):
+        row = schedule.iloc[i]
+        startTime, endTime = stringToTime(row["Start Time (UTC)"]), stringToTime(row["End Time (UTC)"])
+        startTime, endTime = startTime.replace(tzinfo=pytz.utc), endTime.replace(tzinfo=pytz.utc)
+        name = row["Target"]
+
+        startUnix = startTime.timestamp()
+        endUnix = endTime.timestamp()
+
+        duration = endUnix - startUnix
+
+        ax.bar(0, duration, bottom=startUnix, width=0.6, color=colorDict[re.sub('_\\d', '', name)],
+            edgecolor="black")
+
+        if name != "Unused Time" and name != "Focus":
+            ax.text(0, max(startUnix + duration / 2, xMin + duration / 2), name, ha='center',
+                    va='center' if name != "Focus" else "top", bbox={'facecolor': 'white', 'alpha': 0.75,
+                                                                    'pad': 3})
+
+    ax.set_ylim(xMin, xMax)
 
     # @profile
-    def visualizeSchedule(scheduleDf: pd.DataFrame, plotSavepath, csvSavepath, startDt=None, endDt=None, addTitleText=None,
-                        save=True, show=False):
-        """!
-        Take a schedule dataframe and visualize it. optionally, save the schedule csv
-        @param scheduleDf: the schedule dataframe, cleaned
-        @param plotSavepath: where to save the generated plot
-        @param csvSavepath: where to save the schedule csv file
-        @param addTitleText: optional additional title text
-        @param save: bool. whether or not to save the image and csv
-        @param show: bool. whether or not to show the image when generated, pausing the program the plot is closed
-        @return None
-        """
-
-        schedule = scheduleDf.loc[(scheduleDf["Target"] != "TransitionBlock")]
-        if startDt is None:
-            startDt = stringToTime(schedule.iloc[0]["Start Time (UTC)"])
-        if endDt is None:
-            endDt = stringToTime(schedule.iloc[len(schedule.index) - 1]["End Time (UTC)"])
-
-        print("Start:", startDt, "End:", endDt)
-        print("Start tz:", startDt.tzinfo, "End tz:", endDt.tzinfo)
-        xMin, xMax = startDt.timestamp(), endDt.timestamp()
-        print("Min:", xMin, "Max:", xMax)
-
-        xTicks = []
-        val = xMax - xMax % 3600
-        while val > xMin:
-            xTicks.append(val)
-            val -= 3600
-
-        targetNames = schedule.loc[(schedule["Target"] != "Unused Time") & (schedule["Target"] != "TransitionBlock")][
-            "Target"].tolist()
-        targetNames = list(set([re.sub('_\\d', '', t) for t in targetNames]))
-        numTargets = len(targetNames)
-
-        sbPalette = sns.color_palette("hls", numTargets)
-        cmap = ListedColormap(sns.color_palette(sbPalette).as_hex())
-
-        colorDict = {}
-        for i in range(numTargets):
-            color = cmap(i)
-            colorDict[targetNames[i]] = color
-        colorDict["Unused Time"] = plt.cm.tab20(14)
-        colorDict["TransitionBlock"] = plt.cm.tab20(17)
-
-        fig, ax = plt.subplots(figsize=(4, 8))
-        for i in range(0, len(schedule.index)):
-            row = schedule.iloc[i]
-            startTime, endTime = stringToTime(row["Start Time (UTC)"]), stringToTime(row["End Time (UTC)"])
-            startTime, endTime = startTime.replace(tzinfo=pytz.utc), endTime.replace(tzinfo=pytz.utc)
-            name = row["Target"]
-
-            startUnix = startTime.timestamp()
-            endUnix = endTime.timestamp()
-
-            duration = endUnix - startUnix
-
-            ax.bar(0, duration, bottom=startUnix, width=0.6, color=colorDict[re.sub('_\\d', '', name)],
-                edgecolor="black")
-
-            if name != "Unused Time" and name != "Focus":
-                ax.text(0, max(startUnix + duration / 2, xMin + duration / 2), name, ha='center',
-                        va='center' if name != "Focus" else "top", bbox={'facecolor': 'white', 'alpha': 0.75,
-                                                                        'pad': 3})
-
-        ax.set_ylim(xMin, xMax)
-
-        # @profile
-        def formatFunc(value, tickNumber):
-            dt = datetime.fromtimestamp(value, tz=pytz.utc)
-            return dt.strftime("%H:%M\n%d-%b")
-
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(formatFunc))
-        ax.set_yticks(xTicks)
-        # ax.set_ylabel("Time (UTC)")
-
-        ax.set_xticks([])
-        ax.invert_yaxis()
-        plt.subplots_adjust(left=0.15, right=0.85, bottom=0.05, top=0.9)
-        title = startDt.strftime("%H:%M") + " to " + endDt.strftime(
-            "%H:%M") + " UTC\n"
-        if addTitleText:
-            title += addTitleText
-        plt.suptitle("Schedule for " + startDt.strftime("%b %d, %Y"))
-        plt.title(title)
-
-        if save:
-            plt.savefig(plotSavepath)
-            schedule.to_csv(csvSavepath, index=None)
-
-        if show:
-            plt.show()
-            plt.close()
-
-
-    # @profile
-
-    def cleanScheduleDf(df: pd.DataFrame):
-        """!
-        Clean and format a schedule dataframe
-        @param df: schedule dataframe, as prepared by createSchedule
-        """
-        df = df.set_axis(
-            ['Target', 'Start Time (UTC)', 'End Time (UTC)', 'Duration (Minutes)', 'RA', 'Dec', 'Tags'], axis=1)
-        df["Start Time (UTC)"] = df["Start Time (UTC)"].apply(lambda row: row[:-4])
-        df["End Time (UTC)"] = df["End Time (UTC)"].apply(lambda row: row[:-4])
-        df["Duration (Minutes)"] = df["Duration (Minutes)"].apply(lambda row: round(float(row), 1))
-        df["RA"] = df["RA"].apply(lambda row: round(float(row), 4) if row else row)
-        df["Dec"] = df["Dec"].apply(lambda row: round(float(row), 4) if row else row)
-
-        return df
-
+    def formatFunc(value, tickNumber):
+        dt = datetime.fromtimestamp(value, tz=pytz.utc)
+        return dt.strftime("%H:%M\n%d-%b")
+
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(formatFunc))
+    ax.set_yticks(xTicks)
+    # ax.set_ylabel("Time (UTC)")
+
+    ax.set_xticks([])
+    ax.invert_yaxis()
+    plt.subplots_adjust(left=0.15, right=0.85, bottom=0.05, top=0.9)
+    title = startDt.strftime("%H:%M") + " to " + endDt.strftime(
+        "%H:%M") + " UTC\n"
+    if addTitleText:
+        title += addTitleText
+    plt.suptitle("Schedule for " + startDt.strftime("%b %d, %Y"))
+    plt.title(title)
+
+    if save:
+        plt.savefig(plotSavepath)
+        schedule.to_csv(csvSavepath, index=None)
+
+    if show:
+        plt.show()
+        plt.close()
 
-    # @profile
-    def createSchedule(observer: Observer, startTime: datetime, endTime: datetime, blacklist, whitelist, excludedTimeRanges,
-                    candidateDbPath: str, temperature=0):
-        """!
-        Do the actual scheduling
-        @param observer: the Observer object representing the telescope's location
-        @param blacklist: list of designations of targets to ban from being scheduled
-        @param whitelist: list of designations of targets to give the highest priority
-        @param excludedTimeRanges: list of tuples of times, in integer seconds since epoch, to forbid observations from being scheduled between
-        @param temperature: 0-10. represents the randomness applied to scoring; 0 is deterministic
-        @return a dataframe representing the schedule, the list of blocks, the schedule object, the dictionary of candidates, and the dictionary of config objects
-        """
 
-        configDict = {}
-
-        modules = ModuleManager().load_active_modules()
-        for k, mod in modules.items():
-            configDict[mod.scheduling_config.name] = mod.scheduling_config
-
-        # turn the lists of candidates into one list
-        candidates = [candidate for candidateList in [c.selectCandidates(startTime, endTime, candidateDbPath) for c in configDict.values()]
-                        for candidate in candidateList if candidate.CandidateName not in blacklist]
-
-        if len(candidates) == 0:
-            logger.warning("No candidates provided - nothing to schedule. Exiting.")
-            sys.stdout.flush()
-            exit(0)
-
-        # blocks are what will be slotted into the schedule - blocks specify a target but not a set start or end time
-        blocks = {}  # blocks by priority
-        for i, c in enumerate(candidates):
-            c.Priority = c.Priority + 1 if c.CandidateName not in whitelist else 1  # ---- manage the whitelist -----
-            if c.Priority not in blocks.keys():
-                blocks[c.Priority] = []
-            # c.RA = genUtils.ensureAngle(str(c.RA) + "h")
-            # c.Dec = genUtils.ensureAngle(float(c.Dec))
-
-        designations = [candidate.CandidateName for candidate in candidates]
-        print("Considering the following targets for scheduling:", designations)
-        candidateDict = dict(zip(designations, candidates))
-
-        # WARNING - this can prevent any observations of targets whose observability duration = NumExposures * ExposureTime
-        # constraint on when the observation can *start*
-        # timeConstraintDict = {c.CandidateName: TimeConstraint(Time(stringToTime(c.StartObservability)),
-        #                                                     Time(stringToTime(c.EndObservability) - timedelta(
-        #                                                         seconds=float(c.NumExposures) * float(c.ExposureTime))))
-        #                     for c in candidates}
+# @profile
+
+def _roundDegrees(val):
+    # newer versions of astroplan put the target coordinates in the schedule table as Angles instead of floats
+    if isinstance(val, u.Quantity):
+        return round(val.to_value(u.deg), 4)
+    return round(float(val), 4) if val else val
+
+
+def cleanScheduleDf(df: pd.DataFrame):
+    """!
+    Clean and format a schedule dataframe
+    @param df: schedule dataframe, as prepared by createSchedule
+    """
+    df = df.set_axis(
+        ['Target', 'Start Time (UTC)', 'End Time (UTC)', 'Duration (Minutes)', 'RA', 'Dec', 'Tags'], axis=1)
+    df["Start Time (UTC)"] = df["Start Time (UTC)"].apply(lambda row: row[:-4])
+    df["End Time (UTC)"] = df["End Time (UTC)"].apply(lambda row: row[:-4])
+    df["Duration (Minutes)"] = df["Duration (Minutes)"].apply(lambda row: round(float(row), 1))
+    df["RA"] = df["RA"].apply(_roundDegrees)
+    df["Dec"] = df["Dec"].apply(_roundDegrees)
+
+    return df
+
+
+@staged("module loading")
+def loadSchedulingConfigs():
+    """!
+    Load the active modules and collect their scheduling configs
+    @return: {type of candidate : TypeConfiguration object}
+    """
+    configDict = {}
+    modules = ModuleManager().load_active_modules()
+    for k, mod in modules.items():
+        configDict[mod.scheduling_config.name] = mod.scheduling_config
+    return configDict
+
+
+def gatherCandidates(configDict, startTime: datetime, endTime: datetime, candidateDbPath: str, blacklist):
+    """!
+    Ask each config to select its candidates for the given time range
+    @param candidateDbPath: path to the candidate database, or a CandidateDatabase to select from. unless the schedulerCandidateSnapshot setting is off, a path is snapshotted first for the configs that set acceptsCandidateSnapshot, and the rest are given the path
+    @return: list of candidates, not including any whose designation is in the blacklist. each module's candidates are sorted by designation
+    """
+    snapshot = None
+    if genUtils.maestro_settings.get("schedulerCandidateSnapshot", True) and not isinstance(candidateDbPath, CandidateDatabase) \
+            and any(getattr(c, "acceptsCandidateSnapshot", False) for c in configDict.values()):
+        # the modules that can take one select from the same in-memory copy of the database instead of querying the file on their own
+        with stage("select candidates/snapshot"):
+            snapshot = CandidateSnapshot(candidateDbPath, "Scheduler", startTime)
+    # turn the lists of candidates into one list
+    candidates = []
+    for name, c in configDict.items():
+        db = snapshot if snapshot is not None and getattr(c, "acceptsCandidateSnapshot", False) else candidateDbPath
+        with stage(f"select candidates/{name}"):
+            # the database returns rows in ID order, and IDs are string hashes that change from one process to the next,
+            # so sort to make the order (and so the tie-breaking when blocks are placed) the same from run to run
+            candidates.extend(sorted(c.selectCandidates(startTime, endTime, db), key=lambda cand: cand.CandidateName))
+    return [candidate for candidate in candidates if candidate.CandidateName not in blacklist]
+
+
+def applyFrozenSchedule(replan, candidates, configDict, candidateDbPath):
+    """!
+    Account for the frozen part of a previous schedule when re-planning
+    @param replan: FrozenSchedule
+    @param candidates: the candidates selected for the rest of the night
+    @param candidateDbPath: path to the candidate database, to look up the last frozen candidate if it wasn't selected
+    @return: the candidates that still need observations, {desig: [frozen ScheduledTasks]} of their frozen observations, a stand-in block for the last frozen observation (to transition from, or None), and the astropy Time of the last frozen focus loop (or None)
+    """
+    byID = {c.ID: c for c in candidates if c.hasField("ID")}
+    priorObservations = {byID[cid].CandidateName: obs for cid, obs in replan.observations().items() if cid in byID}
+    # candidates that have had all the observations their module wants are done for the night
+    remaining = [c for c in candidates if
+                 len(priorObservations.get(c.CandidateName, [])) < max(configDict[c.CandidateType].numObs, 1)]
+    previousBlock = None
+    last = replan.last_observation
+    c = None
+    if last is not None:
+        # the last frozen observation may have used up the candidate's window, in which case it wasn't selected again
+        c = byID.get(last.candidateID) or CandidateDatabase(candidateDbPath, "Scheduler").getCandidateByID(last.candidateID)
+    if c is not None and c.CandidateType in configDict:
+        previousBlock = ObservingBlock(FixedTarget(coord=SkyCoord(ra=c.RA, dec=c.Dec), name=c.CandidateName),
+                                       (last.end - last.start).total_seconds() * u.second, 0,
+                                       configuration={"object": c.CandidateName, "type": c.CandidateType,
+                                                      "duration": (last.end - last.start).total_seconds()})
+    lastFocusTime = Time(replan.last_focus_time) if replan.last_focus_time is not None else None
+    return remaining, priorObservations, previousBlock, lastFocusTime
+
+
+@staged("createSchedule")
+def createSchedule(observer: Observer, startTime: datetime, endTime: datetime, blacklist, whitelist, excludedTimeRanges,
+                candidateDbPath: str, temperature=0, seed=None, savepath=None, annealSeconds=None, annealIterations=None,
+                configDict=None, replan=None, scoreCache=None, candidates=None):
+    """!
+    Do the actual scheduling
+    @param observer: the Observer object representing the telescope's location
+    @param blacklist: list of designations of targets to ban from being scheduled
+    @param whitelist: list of designations of targets to give the highest priority
+    @param excludedTimeRanges: list of tuples of times, in integer seconds since epoch, to forbid observations from being scheduled between
+    @param temperature: 0-10. represents the randomness applied to scoring; 0 is deterministic
+    @param seed: optional. seeds the random number generator used to apply the temperature, so that a run can be reproduced
+    @param savepath: optional. if provided, the plot of target scores is saved to this directory
+    @param annealSeconds: optional. if provided, the greedy schedule is refined by simulated annealing for this many seconds
+    @param annealIterations: optional. if provided, the greedy schedule is refined by this many simulated annealing moves
+    @param configDict: optional. already-loaded scheduling configs to use instead of loading the modules again
+    @param replan: optional. FrozenSchedule of the previous schedule. if provided, only the time after its frozen (executed and in-progress) tasks is scheduled, starting on the time grid of a schedule that starts at startTime. the frozen tasks count toward their candidates' observations
+    @param scoreCache: optional. ScoreCache to reuse the score rows of unchanged candidates from. it's updated with the rows computed by this run
+    @param candidates: optional. already-selected candidates to schedule instead of selecting them from candidateDbPath. their priorities are changed, so pass copies to schedule the same candidates more than once
+    @return a dataframe representing the schedule, the list of blocks, the schedule object, the dictionary of candidates, and the dictionary of config objects
+    """
+    if seed is not None:
+        random.seed(seed)
+
+    if configDict is None:
+        configDict = loadSchedulingConfigs()
+    if replan is not None:
+        startTime = replan.resume_time(startTime)
+        logger.info(f"Re-planning from {startTime}: {len(replan.frozen)} tasks of the previous schedule are frozen")
+    if candidates is None:
+        candidates = gatherCandidates(configDict, startTime, endTime, candidateDbPath, blacklist)
+
+    priorObservations, previousBlock, lastFocusTime = {}, None, None
+    if replan is not None:
+        candidates, priorObservations, previousBlock, lastFocusTime = applyFrozenSchedule(replan, candidates, configDict,
+                                                                                          candidateDbPath)
+
+    if len(candidates) == 0:
+        logger.warning("No candidates provided - nothing to schedule. Exiting.")
+        sys.stdout.flush()
+        exit(0)
+
+    # blocks are what will be slotted into the schedule - blocks specify a target but not a set start or end time
+    blocks = {}  # blocks by priority
+    for i, c in enumerate(candidates):
+        c.Priority = c.Priority + 1 if c.CandidateName not in whitelist else 1  # ---- manage the whitelist -----
+        if c.Priority not in blocks.keys():
+            blocks[c.Priority] = []
+        # c.RA = genUtils.ensureAngle(str(c.RA) + "h")
+        # c.Dec = genUtils.ensureAngle(float(c.Dec))
+
+    designations = [candidate.CandidateName for candidate in candidates]
+    print("Considering the following targets for scheduling:", designations)
+    candidateDict = dict(zip(designations, candidates))
+
+    # WARNING - this can prevent any observations of targets whose observability duration = NumExposures * ExposureTime
+    # constraint on when the observation can *start*
+    # timeConstraintDict = {c.CandidateName: TimeConstraint(Time(stringToTime(c.StartObservability)),
+    #                                                     Time(stringToTime(c.EndObservability) - timedelta(
+    #                                                         seconds=float(c.NumExposures) * float(c.ExposureTime))))
+    #                     for c in candidates}
+    with stage("block construction"):
         timeConstraintDict = {c.CandidateName: TimeConstraint(Time(c.StartObservability),
                                                             Time(c.EndObservability))
                             for c in candidates}
@@ -744,105 +927,297 @@ def main():
             else:
                 blocks[c.Priority] = [b]
 
-        # make transitioner objects that tell the schedule how to transition between different types of blocks
-        transitioners = {} # {configName: Transitioner}
-        for confname, conf in configDict.items():
-            transitioners[confname] = Transitioner(None, {'object': conf.generateTransitionDict()})
-        
-        dummy_transitioner = Transitioner(None, {'object': {"default": None}})
-        # the transitioner is an object that tells the schedule how long to wait between different combinations of types of blocks
-
-        # the scheduler is the object that is used to make the schedule
-        tmoScheduler = TMOScheduler(candidateDict, configDict, temperature, transitioner_dict=transitioners, constraints=[], observer=observer,
-                                    transitioner=dummy_transitioner,
-                                    time_resolution=60 * u.second, gap_time=1 * u.minute)
-        # create an empty schedule
-        schedule = Schedule(Time(startTime), Time(endTime))
-
-        # ----- do the scheduling (modifies schedule inplace) ------------------- ------
-        tmoScheduler(blocks, excludedTimeRanges, schedule)
-
-        # convert the schedule to a dataframe and clean it up
-        scheduleDf = cleanScheduleDf(schedule.to_table(show_unused=True).to_pandas())
-        return scheduleDf, blocks, schedule, candidateDict, configDict
-
-
-    # @profile
-    def lineConverter(row: pd.Series, configDict, candidateDict, runningList: list, spath):
-        """!
-        Using each line of the raw schedule dataframe, ask each config to generate schedule lines for its targets
-        @param configDict:
-        @param candidateDict:
-        @param runningList: list of strings that will be written to text file. persistent
-        @param spath: the path of the schedule output dir. will be used to output ephems
-        @return None
-        """
-        targetName = row.iloc[0]
-
-        if targetName in ["Unused Time", "TransitionBlock"]:
-            return
-        # runningList.append("\n")
-        if targetName == "Focus":
-            targetStart = stringToTime(row.iloc[1])
-            runningList.append(AutoFocus(targetStart).genLine())
-            runningList.append("\n")
-            return
-
-        lineOrLines = configDict[row["Tags"]["type"]].generateSchedulerLine(row, targetName, candidateDict, spath)
-        if isinstance(lineOrLines, str):
-            runningList.append(lineOrLines)
-        else:
-            runningList.extend(lineOrLines)
-            # raise ValueError("Object " + str(targetName) + " doesn't have a schedule line generator. " + str(row))
-
-
-    # @profile
-    def scheduleToTextFile(scheduleDf, configDict, candidateDict, prevSched=None, spath=None):
-        """!
-        Format a schedule to be text-file friendly
-        """
-        # each target type will need to have the machinery to turn an entry from the scheduleDf + the candidateDict into a
-        # scheduler line - maybe we'll make a default version later
-        linesList = [scheduleHeader()+"\n\n"]
-        scheduleDf.apply(lambda row: lineConverter(row, configDict, candidateDict, linesList, spath), axis=1)
-        # print(linesList)
-        linesList = [l+"\n" if not l.endswith("\n") else l for l in linesList]
-        return linesList
+    # make transitioner objects that tell the schedule how to transition between different types of blocks
+    transitioners = {} # {configName: Transitioner}
+    for confname, conf in configDict.items():
+        transitioners[confname] = Transitioner(None, {'object': conf.generateTransitionDict()})
+    
+    dummy_transitioner = Transitioner(None, {'object': {"default": None}})
+    # the transitioner is an object that tells the schedule how long to wait between different combinations of types of blocks
+
+    # the scheduler is the object that is used to make the schedule
+    tmoScheduler = TMOScheduler(candidateDict, configDict, temperature, transitioner_dict=transitioners, constraints=[], observer=observer,
+                                transitioner=dummy_transitioner,
+                                time_resolution=60 * u.second, gap_time=1 * u.minute, score_plot_dir=savepath,
+                                score_cache=scoreCache, prior_observations=priorObservations,
+                                previous_block=previousBlock, last_focus_time=lastFocusTime)
+    # create an empty schedule
+    schedule = Schedule(Time(startTime), Time(endTime))
+
+    # ----- do the scheduling (modifies schedule inplace) ------------------- ------
+    tmoScheduler(blocks, excludedTimeRanges, schedule)
+
+    if annealSeconds or annealIterations:
+        # use the greedy schedule as the starting point for simulated annealing. if it can't be loaded onto the annealer's time grid, keep it as it is
+        with stage("annealing"):
+            try:
+                annealer = ScheduleAnnealer.from_schedule(schedule, tmoScheduler, blocks, excludedTimeRanges, seed=seed)
+                annealer.run(max_iterations=annealIterations or None, max_seconds=annealSeconds or None)
+                schedule = annealer.to_schedule()
+                logger.info(f"Annealing: {annealer.stats}")
+            except ScheduleOperationError as e:
+                logger.warning(f"Couldn't anneal schedule, keeping the greedy one: {repr(e)}")
+
+    # convert the schedule to a dataframe and clean it up
+    scheduleDf = cleanScheduleDf(schedule.to_table(show_unused=True).to_pandas())
+    return scheduleDf, blocks, schedule, candidateDict, configDict
+
+
+# @profile
+def lineConverter(row: pd.Series, configDict, candidateDict, runningList: list, spath):
+    """!
+    Using each line of the raw schedule dataframe, ask each config to generate schedule lines for its targets
+    @param configDict:
+    @param candidateDict:
+    @param runningList: list of strings that will be written to text file. persistent
+    @param spath: the path of the schedule output dir. will be used to output ephems
+    @return None
+    """
+    targetName = row.iloc[0]
+
+    if targetName in ["Unused Time", "TransitionBlock"]:
+        return
+    # runningList.append("\n")
+    if targetName == "Focus":
+        targetStart = stringToTime(row.iloc[1])
+        runningList.append(AutoFocus(targetStart).genLine())
+        runningList.append("\n")
+        return
+
+    lineOrLines = configDict[row["Tags"]["type"]].generateSchedulerLine(row, targetName, candidateDict, spath)
+    if isinstance(lineOrLines, str):
+        runningList.append(lineOrLines)
+    else:
+        runningList.extend(lineOrLines)
+        # raise ValueError("Object " + str(targetName) + " doesn't have a schedule line generator. " + str(row))
+
+
+@staged("text schedule")
+def scheduleToTextFile(scheduleDf, configDict, candidateDict, prevSched=None, spath=None):
+    """!
+    Format a schedule to be text-file friendly
+    @param prevSched: optional. FrozenSchedule that scheduleDf re-plans. its frozen lines are copied in ahead of the new ones
+    """
+    # each target type will need to have the machinery to turn an entry from the scheduleDf + the candidateDict into a
+    # scheduler line - maybe we'll make a default version later
+    linesList = [scheduleHeader()+"\n\n"]
+    if prevSched is not None:
+        linesList.extend(prevSched.frozen_lines())
+    scheduleDf.apply(lambda row: lineConverter(row, configDict, candidateDict, linesList, spath), axis=1)
+    # print(linesList)
+    linesList = [l+"\n" if not l.endswith("\n") else l for l in linesList]
+    return linesList
+
+
+def retrieveExcludeList(lsStr):
+    """!
+    Take a convoluted string we pass in from Maestro and make it a list of tuples of ints
+    @param lsStr:
+    @return
+    """
+    if lsStr == '':
+        return []
+    ls = lsStr.split(',')
+    return [(int(i[0]), int(i[1])) for i in [a.split("/") for a in ls]]
+
+
+def toList(lsStr, dType=str):
+    """!
+    Turn a comma separated string into a list of objects of type dType
+    """
+    return [dType(i) for i in lsStr.split(",")]
+
+
+def scheduleMetrics(scheduleDf, candidateDict, configDict):
+    """!
+    Measure how good a schedule is
+    @return: fullness (fraction of the night used), repeat obs success (fraction of required repeat observations that were scheduled), and the list of scheduled designations (with the _1/_2 etc chopped off)
+    """
+    unused = scheduleDf.loc[scheduleDf["Target"] == "Unused Time"]["Duration (Minutes)"].sum()
+    total = scheduleDf["Duration (Minutes)"].sum()
+    fullness = round(1 - (unused / total), 3)
+    usedDesigsR = [re.sub('_\\d', '', t) for t in scheduleDf["Target"].tolist() if
+                t != "Unused Time" and t != "Focus" and t != "TransitionBlock"]
+    counts = Counter(usedDesigsR)
+    reqRepeatObs = 0
+    sucRepeatObs = 0
+    for desig in list(counts):
+        reqObs = configDict[candidateDict[desig].CandidateType].numObs
+        if reqObs > 1:
+            sucObs = counts[desig]
+            # if sucObs < reqObs:
+            #     print("{} only got {} out of its {} required observations.".format(desig, str(sucObs), str(reqObs)))
+            reqRepeatObs += reqObs
+            sucRepeatObs += sucObs
+    repeatObsSuccess = round(sucRepeatObs / reqRepeatObs, 5) if reqRepeatObs else 1
+    return fullness, repeatObsSuccess, usedDesigsR
+
+
+_searchState = {}  # the scheduling configs and candidates shared by the schedule search runs in a worker process
+
+
+def _initSearchWorker(configDict, candidates, selection):
+    """!
+    Set up a schedule search worker process. when the pool forks, the parent's configs and candidates are inherited as they are. otherwise they'd have to be pickled, which generated candidate classes can't be, so the worker loads the parent's modules and selects the candidates once, keeping only the ones the parent selected. if that fails, the runs in this worker fail with the error (a pool whose initializer raises replaces the worker forever)
+    @param configDict: the parent's scheduling configs, or None to load them in the worker
+    @param candidates: the parent's candidates, or None to select them in the worker
+    @param selection: (startTime, endTime, candidateDbPath, blacklist, names of the parent's configs, set of designations the parent selected). used if configDict is None
+    """
+    try:
+        if configDict is None:
+            startTime, endTime, candidateDbPath, blacklist, configNames, designations = selection
+            configDict = {k: v for k, v in loadSchedulingConfigs().items() if k in configNames}
+            candidates = [c for c in gatherCandidates(configDict, startTime, endTime, candidateDbPath, blacklist)
+                          if c.CandidateName in designations]
+    except Exception as e:
+        _searchState["error"] = e
+        return
+    _searchState["configDict"] = configDict
+    _searchState["candidates"] = candidates
+
+
+def _scheduleSearchWorker(job):
+    """!
+    Make and evaluate one seeded schedule for searchSchedules. module-level so that it can be run in a worker process
+    @param job: dictionary of createSchedule arguments, plus "seed" and "validate"
+    @return: dictionary describing the run. the candidate objects are stripped out of the schedule's Tags so that the result can be sent back to the parent process (generated candidate classes can't be pickled)
+    """
+    if "error" in _searchState:
+        raise RuntimeError(f"Couldn't set up schedule search worker: {repr(_searchState['error'])}")
+    start = time.time()
+    # every run in this worker schedules the candidates set up by _initSearchWorker. createSchedule changes their
+    # priorities, so each run gets its own copies
+    candidates = _searchState.get("candidates")
+    if candidates is not None:
+        candidates = [copy.copy(c) for c in candidates]
+    try:
+        scheduleDf, blocks, schedule, candidateDict, configDict = createSchedule(job["observer"], job["startTime"], job["endTime"],
+                                                                                job["blacklist"], job["whitelist"],
+                                                                                job["excludedTimeRanges"],
+                                                                                job["candidateDbPath"],
+                                                                                temperature=job["temperature"],
+                                                                                seed=job["seed"],
+                                                                                annealSeconds=job["annealSeconds"],
+                                                                                configDict=_searchState.get("configDict"),
+                                                                                candidates=candidates)
+    except SystemExit:
+        # createSchedule exits when there's nothing to schedule. a worker that exits never reports back, so turn it into an error
+        raise RuntimeError("createSchedule exited without making a schedule (no candidates?)")
+    runtime = time.time() - start
+    fullness, repeatObsSuccess, _ = scheduleMetrics(scheduleDf, candidateDict, configDict)
+
+    errors, score = None, None
+    if job["validate"]:
+        # write out the text schedule and run the checker and scorer on it
+        schedPath = None
+        try:
+            with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+                schedPath = f.name
+                f.writelines(scheduleToTextFile(scheduleDf, configDict, candidateDict))
+            checkerSched = ScheduleCls.read(schedPath)
+            errors = runTestingSuite(checkerSched, verbose=False)
+            score = calculateScore(checkerSched, errors=errors)
+        except Exception as e:
+            logger.warning(f"Couldn't validate schedule with seed {job['seed']}: {repr(e)}")
+            errors = math.inf
+        finally:
+            if schedPath is not None and os.path.exists(schedPath):
+                os.remove(schedPath)
+
+    scheduleDf["Tags"] = scheduleDf["Tags"].apply(
+        lambda tags: {k: v for k, v in tags.items() if k != "candidate"} if isinstance(tags, dict) else tags)
+    return {"seed": job["seed"], "temperature": job["temperature"], "runtime": runtime, "fullness": fullness,
+            "repeatObsSuccess": repeatObsSuccess, "errors": errors, "score": score, "scheduleDf": scheduleDf}
+
+
+def searchRank(result):
+    """!
+    Sort key for searchSchedules results: fewest checker errors first, then highest score, then fullest (weighted by repeat obs success)
+    """
+    errors = result["errors"] if result["errors"] is not None else 0
+    score = result["score"] if result["score"] is not None else 0
+    return errors, -score, -(result["fullness"] * result["repeatObsSuccess"]), -result["fullness"]
+
+
+@staged("schedule search")
+def searchSchedules(observer: Observer, startTime: datetime, endTime: datetime, blacklist, whitelist, excludedTimeRanges,
+                    candidateDbPath: str, temperatures, numRuns, budgetSeconds=None, maxWorkers=None, seed=None,
+                    validate=True, annealSeconds=None, configDict=None, candidates=None):
+    """!
+    Make many seeded schedules in parallel and rank them. Runs are spread over a process pool; when the wall-clock budget runs out, unfinished runs are abandoned and the best of the finished ones are returned
+    @param temperatures: list of temperatures. run i uses temperatures[i % len(temperatures)]
+    @param numRuns: number of schedules to try
+    @param budgetSeconds: optional. stop waiting for runs after this many seconds
+    @param maxWorkers: optional. number of worker processes. defaults to the number of cpus
+    @param seed: optional. run i is seeded with seed + i. if not provided, a random base seed is chosen (and recorded in the results)
+    @param validate: whether to write each schedule out and rank it with runTestingSuite and calculateScore. if False, schedules are ranked by fullness only
+    @param annealSeconds: optional. seconds of simulated annealing to refine each run's schedule with
+    @param configDict: optional. already-loaded scheduling configs to use instead of loading the modules again
+    @param candidates: optional. already-selected candidates to schedule. if not provided, they're selected here, once, and every run schedules the same ones
+    @return: list of result dictionaries (see _scheduleSearchWorker), best first
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 31)
+    if configDict is None:
+        configDict = loadSchedulingConfigs()
+    if candidates is None:
+        candidates = gatherCandidates(configDict, startTime, endTime, candidateDbPath, blacklist)
+    if multiprocessing.get_start_method() == "fork":
+        initargs = (configDict, candidates, None)
+    else:
+        initargs = (None, None, (startTime, endTime, candidateDbPath, blacklist, list(configDict),
+                                 {c.CandidateName for c in candidates}))
+    jobs = [{"observer": observer, "startTime": startTime, "endTime": endTime, "blacklist": blacklist,
+             "whitelist": whitelist, "excludedTimeRanges": excludedTimeRanges, "candidateDbPath": candidateDbPath,
+             "temperature": temperatures[i % len(temperatures)], "seed": seed + i, "validate": validate,
+             "annealSeconds": annealSeconds}
+            for i in range(numRuns)]
+
+    results = []
+    deadline = time.time() + budgetSeconds if budgetSeconds else None
+    pool = multiprocessing.Pool(processes=maxWorkers, initializer=_initSearchWorker, initargs=initargs)
+    try:
+        runs = pool.imap_unordered(_scheduleSearchWorker, jobs)
+        for _ in range(len(jobs)):
+            timeout = max(deadline - time.time(), 0) if deadline is not None else None
+            try:
+                results.append(runs.next(timeout=timeout))
+            except multiprocessing.TimeoutError:
+                logger.info(f"Schedule search budget of {budgetSeconds} s reached after {len(results)} of {len(jobs)} runs.")
+                break
+            except Exception as e:
+                logger.warning(f"Schedule search run failed: {repr(e)}")
+    finally:
+        pool.terminate()
+        pool.join()
 
+    results.sort(key=searchRank)
+    return results
 
-    def retrieveExcludeList(lsStr):
-        """!
-        Take a convoluted string we pass in from Maestro and make it a list of tuples of ints
-        @param lsStr:
-        @return
-        """
-        if lsStr == '':
-            return []
-        ls = lsStr.split(',')
-        return [(int(i[0]), int(i[1])) for i in [a.split("/") for a in ls]]
 
 
-    def toList(lsStr, dType=str):
-        """!
-        Turn a comma separated string into a list of objects of type dType
-        """
-        return [dType(i) for i in lsStr.split(",")]
+def makeObserver():
+    """!
+    Make the Observer object representing the telescope's location, from the observatory config
+    """
+    location = EarthLocation.from_geodetic(obs_cfg["LONGITUDE"], obs_cfg["LATITUDE"], 0)
+    return Observer(name=obs_cfg["NAME"],
+                location=location,
+                timezone=pytz.timezone(obs_cfg["TIMEZONE"]),
+                )
 
 
+def main():
     maestro_settings = Config(PATH_TO(join("files","configs","in_maestro_settings.toml")))
 
-
-    location = EarthLocation.from_geodetic(obs_cfg["LONGITUDE"], obs_cfg["LATITUDE"], 0)
-    obs = Observer(name=obs_cfg["NAME"],
-                location=location,
-                timezone=pytz.timezone(obs_cfg["TIMEZONE"]),
-                ) 
+    obs = makeObserver()
     blacklist = []
     saveEphems = False
     whitelist = []  # implement this
     excludedTimeRanges = []
     temperature = 0.1
     numRuns = 1
+    replanTime = None
 
     # set params
     if len(sys.argv) == 1:
@@ -862,6 +1237,8 @@ def main():
         blacklist = toList(sys.argv[1])
         whitelist = toList(sys.argv[2])
         excludedTimeRanges = retrieveExcludeList(sys.argv[3])
+        if len(sys.argv) > 4 and sys.argv[4] == "replan":  # keep what has already run of the last schedule and re-plan the rest of the night
+            replanTime = datetime.now(pytz.utc)
         # for r in excludedTimeRanges:
         numRuns = maestro_settings["schedulerRuns"]
         temperature = maestro_settings["temperature"] / 10
@@ -871,95 +1248,172 @@ def main():
         saveEphems = maestro_settings["schedulerSaveEphems"]
         overwrite = True
 
-    # prepare saveloc
-    if not os.path.exists(savepath):
-        os.mkdir(savepath)
-    elif overwrite:  # safety precaution lol
-        for out in ["schedule.txt", "schedule.csv", "schedule.png", "scorePlot.png", "visibilityAll.png"]:
+    runScheduler(obs, sunsetUTC, sunriseUTC, savepath, blacklist, whitelist, excludedTimeRanges, candidateDbPath,
+                 numRuns=numRuns, temperature=temperature, saveEphems=saveEphems, overwrite=overwrite,
+                 settings=maestro_settings, replanTime=replanTime)
+
+
+def runScheduler(obs: Observer, sunsetUTC: datetime, sunriseUTC: datetime, savepath, blacklist, whitelist,
+                 excludedTimeRanges, candidateDbPath, numRuns=1, temperature=0.1, saveEphems=False, overwrite=False,
+                 settings=None, configDict=None, replanTime=None, scoreCache=None):
+    """!
+    Make the schedule(s) and write all of the outputs (text schedule, csv, plots, observing log) to savepath
+    @param numRuns: number of schedules to make. if more than one, they're made in parallel by searchSchedules and the best is kept
+    @param temperature: 0-1, randomness applied to scoring
+    @param saveEphems: whether to save the ephemerides used in the schedule to savepath/ephems
+    @param overwrite: whether to clear out outputs from a previous run in savepath first
+    @param settings: optional. Config or dict of maestro settings, for the schedulerSearchBudgetSecs, schedulerWorkers and schedulerAnnealSecs options
+    @param configDict: optional. already-loaded scheduling configs (see loadSchedulingConfigs) to use instead of loading the modules again
+    @param replanTime: optional. timezone-aware datetime. if provided, re-plan the schedule in savepath instead of starting over: the tasks in it that start before replanTime are kept, the rest of the night is rescheduled, and a diff against the previous schedule is written to savepath/schedule.diff
+    @param scoreCache: optional. ScoreCache to reuse score rows from when re-planning. if not provided and the schedulerScoreCache setting is on, the cache is kept in savepath/scoreCache.npz between re-plans. ignored unless replanTime is provided
+    @return: the path to the text schedule
+    """
+    maestro_settings = settings if settings is not None else {}
+    with StageTimer(trace_memory=maestro_settings.get("schedulerProfileMemory", False)) as timer:
+        # the previous schedule has to be read before its outputs are cleared out
+        replan = None
+        if replanTime is not None:
+            if os.path.exists(join(savepath, "schedule.txt")):
+                replan = FrozenSchedule.read(join(savepath, "schedule.txt"), replanTime)
+                if numRuns > 1:
+                    logger.warning("Re-planning makes a single schedule, ignoring the number of runs.")
+                    numRuns = 1
+            else:
+                logger.warning(f"No previous schedule in {savepath} to re-plan, making a new schedule instead.")
+
+        scoreCachePath = None
+        if replanTime is None:
+            scoreCache = None  # a fresh schedule scores every candidate, the cache only pays off for re-plans
+        elif scoreCache is None and maestro_settings.get("schedulerScoreCache", True):
+            scoreCachePath = join(savepath, "scoreCache.npz")
+            scoreCache = ScoreCache()
+            if os.path.exists(scoreCachePath):
+                try:
+                    scoreCache = ScoreCache.load(scoreCachePath)
+                except Exception as e:
+                    logger.warning(f"Couldn't load score cache from {scoreCachePath}, starting a new one: {repr(e)}")
+
+        # prepare saveloc
+        if not os.path.exists(savepath):
+            os.mkdir(savepath)
+        elif overwrite:  # safety precaution lol
+            for out in ["schedule.txt", "schedule.csv", "schedule.png", "scorePlot.png", "visibilityAll.png", "schedule.diff"]:
+                try:
+                    os.remove(join(savepath, out))
+                except:
+                    pass
+            try:
+                shutil.rmtree(join(savepath,"ephems"), ignore_errors=True)
+                os.mkdir(join(savepath,"ephems"))
+            except:
+                pass
+
+        logDf = pd.DataFrame(columns=["Temperature", "Fullness", "Runtime", "RepeatObsSuccess"])
+        bestSchedRep = None
+        bestSchedFull = None
+        bestSchedBoth = None
+        times = []
+
+        ephemSpath = None
+        if saveEphems:
+            ephemSpath = join(savepath, "ephems")
             try:
-                os.remove(join(savepath, out))
+                os.mkdir(ephemSpath)
             except:
                 pass
-        try:
-            shutil.rmtree(join(savepath,"ephems"), ignore_errors=True)
-            os.mkdir(join(savepath,"ephems"))
-        except:
-            pass
-
-    logDf = pd.DataFrame(columns=["Temperature", "Fullness", "Runtime", "RepeatObsSuccess"])
-    bestSchedRep = None
-    bestSchedFull = None
-    bestSchedBoth = None
-    bestRep = 0
-    bestFull = 0
-    bestBoth = 0
-    times = []
-
-    ephemSpath = None
-    if saveEphems:
-        ephemSpath = join(savepath, "ephems")
-        try:
-            os.mkdir(ephemSpath)
-        except:
-            pass
-
-    # make schedule(s)
-    for i in range(numRuns):
-        start = time.time()
-        scheduleDf, blocks, schedule, candidateDict, configDict = createSchedule(obs, sunsetUTC, sunriseUTC,
-                                                                                blacklist, whitelist,
-                                                                                excludedTimeRanges,
-                                                                                candidateDbPath,
-                                                                                temperature=temperature)
-        duration = time.time() - start
-        times.append(duration)
-        unused = scheduleDf.loc[scheduleDf["Target"] == "Unused Time"]["Duration (Minutes)"].sum()
-        total = scheduleDf["Duration (Minutes)"].sum()
-        fullness = round(1 - (unused / total), 3)
+
+        # make schedule(s)
+        results = []
+        if numRuns > 1:
+            # select the candidates once, so that the runs and the outputs made from the best of them agree on what was selected
+            configDict = configDict if configDict is not None else loadSchedulingConfigs()
+            candidates = gatherCandidates(configDict, sunsetUTC, sunriseUTC, candidateDbPath, blacklist)
+            candidateDict = {c.CandidateName: c for c in candidates}
+            # fan the runs out over a process pool and keep the best
+            results = searchSchedules(obs, sunsetUTC, sunriseUTC, blacklist, whitelist, excludedTimeRanges, candidateDbPath,
+                                      [temperature], numRuns,
+                                      budgetSeconds=maestro_settings.get("schedulerSearchBudgetSecs") or None,
+                                      maxWorkers=maestro_settings.get("schedulerWorkers") or None,
+                                      annealSeconds=maestro_settings.get("schedulerAnnealSecs") or None,
+                                      configDict=configDict, candidates=candidates)
+            if not results:
+                logger.warning("No schedule search runs finished, making a single schedule instead.")
+                numRuns = 1
+        if numRuns > 1:
+            for r in results:
+                times.append(r["runtime"])
+                logDf.loc[len(logDf.index)] = [r["temperature"], r["fullness"], r["runtime"], r["repeatObsSuccess"]]
+                print(f"Schedule with seed {r['seed']}: {round(r['fullness'] * 100)}% full, with {r['repeatObsSuccess'] * 100}% repeat obs success, {r['errors']} errors, score {r['score']}.")
+            bestRun = max(results, key=lambda r: r["repeatObsSuccess"])
+            bestSchedRep = (bestRun["scheduleDf"], bestRun["repeatObsSuccess"], bestRun["fullness"], "bestRepeatSchedule")
+            bestRun = max(results, key=lambda r: r["fullness"])
+            bestSchedFull = (bestRun["scheduleDf"], bestRun["repeatObsSuccess"], bestRun["fullness"], "bestFullSchedule")
+            bestRun = max(results, key=lambda r: r["fullness"] * r["repeatObsSuccess"])
+            bestSchedBoth = (bestRun["scheduleDf"], bestRun["repeatObsSuccess"], bestRun["fullness"], "bestBothSchedule")
+
+            # the overall best, as ranked by the search
+            scheduleDf, fullness = results[0]["scheduleDf"], results[0]["fullness"]
+            scheduleDesc = f"Best of {len(results)} schedules (seed {results[0]['seed']})"
+            _, _, usedDesigsR = scheduleMetrics(scheduleDf, candidateDict, configDict)
+        else:
+            start = time.time()
+            scheduleDf, blocks, schedule, candidateDict, configDict = createSchedule(obs, sunsetUTC, sunriseUTC,
+                                                                                    blacklist, whitelist,
+                                                                                    excludedTimeRanges,
+                                                                                    candidateDbPath,
+                                                                                    temperature=temperature,
+                                                                                    savepath=savepath,
+                                                                                    configDict=configDict,
+                                                                                    annealSeconds=maestro_settings.get("schedulerAnnealSecs") or None,
+                                                                                    replan=replan, scoreCache=scoreCache)
+            duration = time.time() - start
+            if scoreCachePath is not None:
+                scoreCache.save(scoreCachePath)
+            times.append(duration)
+            fullness, repeatObsSuccess, usedDesigsR = scheduleMetrics(scheduleDf, candidateDict, configDict)
+            logDf.loc[len(logDf.index)] = [temperature, fullness, duration, repeatObsSuccess]
+            scheduleDesc = repr(schedule)
+            print(scheduleDesc + ",", str(round(fullness * 100)) + "% full, with {}% repeat obs success.".format(
+                str(repeatObsSuccess * 100)))
+
+        if numRuns > 1:
+            for sched, name in [(bestSchedFull, "BestFullness"),
+                                (bestSchedBoth, "BestCombined"), (bestSchedRep, "BestRepeatSuccess")]:
+                visualizeSchedule(sched[0], join(savepath, f"{sched[3]}.png"),
+                                join(savepath, f"{sched[3]}.csv"), sunsetUTC, sunriseUTC,
+                                addTitleText="{}% full, with {}% repeat obs success.".format(
+                                    str(round(sched[2] * 100, 3)),
+                                    str(sched[1] * 100)), save=True,
+                                show=False)
+                schedLines = scheduleToTextFile(sched[0], configDict, candidateDict, spath=ephemSpath)
+                with open(join(savepath, f'{name}.txt'), "w") as f:
+                    f.writelines(schedLines)
+            usedDesigs = []
+            for d in usedDesigsR:  # filter for unique candidate names after chopping off the _1/_2 etc. this used to be done with a set but that didn't preserve order
+                if d not in usedDesigs:
+                    usedDesigs.append(d)
+            candidatesInSchedule = [candidateDict[d] for d in usedDesigs if d in candidateDict]
+
+            # do the observing log
+            if candidatesInSchedule:
+                try:
+                    df = Candidate.candidatesToDf(candidatesInSchedule)
+                    df = genUtils.prettyFormat(df)
+                    df.to_csv(join(savepath,"observingLog.csv"), index=False)
+                    visualizeObservability(candidatesInSchedule, sunsetUTC, sunriseUTC, savepath, "visibilityAll")
+                except Exception as e:
+                    sys.stderr.write("Writing obs log failed with exception " + repr(e))
+
+            logDf.to_csv(join(savepath,"LogOut.csv"))
+
+        print(scheduleDesc + ",", str(round(fullness * 100)) + "% full")
+        usedDesigs = []
         usedDesigsR = [re.sub('_\\d', '', t) for t in scheduleDf["Target"].tolist() if
                     t != "Unused Time" and t != "Focus" and t != "TransitionBlock"]
-        counts = Counter(usedDesigsR)
-        reqRepeatObs = 0
-        sucRepeatObs = 0
-        for desig in list(counts):
-            reqObs = configDict[candidateDict[desig].CandidateType].numObs
-            if reqObs > 1:
-                sucObs = counts[desig]
-                # if sucObs < reqObs:
-                #     print("{} only got {} out of its {} required observations.".format(desig, str(sucObs), str(reqObs)))
-                reqRepeatObs += reqObs
-                sucRepeatObs += sucObs
-        repeatObsSuccess = round(sucRepeatObs / reqRepeatObs, 5) if reqRepeatObs else 1
-        logDf.loc[len(logDf.index)] = [temperature, fullness, duration, repeatObsSuccess]
-        print(repr(schedule) + ",", str(round(fullness * 100)) + "% full, with {}% repeat obs success.".format(
-            str(repeatObsSuccess * 100)))
-        if repeatObsSuccess >= bestRep:
-            bestRep = repeatObsSuccess
-            bestSchedRep = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestRepeatSchedule")
-        if fullness >= bestFull:
-            bestFull = fullness
-            bestSchedFull = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestFullSchedule")
-        if fullness * repeatObsSuccess >= bestBoth:
-            bestBoth = fullness * repeatObsSuccess
-            bestSchedBoth = (scheduleDf.copy(), repeatObsSuccess, fullness, "bestBothSchedule")
-
-    if numRuns > 1:
-        for sched, name in [(bestSchedFull, "BestFullness"),
-                            (bestSchedBoth, "BestCombined"), (bestSchedRep, "BestRepeatSuccess")]:
-            visualizeSchedule(sched[0], join(savepath, f"{sched[3]}.png"),
-                            join(savepath, f"{sched[3]}.csv"), sunsetUTC, sunriseUTC,
-                            addTitleText="{}% full, with {}% repeat obs success.".format(
-                                str(round(sched[2] * 100, 3)),
-                                str(sched[1] * 100)), save=True,
-                            show=False)
-            schedLines = scheduleToTextFile(sched[0], configDict, candidateDict, spath=ephemSpath)
-            with open(join(savepath, f'{name}.txt'), "w") as f:
-                f.writelines(schedLines)
-        usedDesigs = []
         for d in usedDesigsR:  # filter for unique candidate names after chopping off the _1/_2 etc. this used to be done with a set but that didn't preserve order
             if d not in usedDesigs:
                 usedDesigs.append(d)
-        candidatesInSchedule = [candidateDict[d] for d in usedDesigs]
+        candidatesInSchedule = [candidateDict[d] for d in usedDesigs if d in candidateDict]
 
         # do the observing log
         if candidatesInSchedule:
@@ -971,44 +1425,34 @@ def main():
             except Exception as e:
                 sys.stderr.write("Writing obs log failed with exception " + repr(e))
 
-        logDf.to_csv(join(savepath,"LogOut.csv"))
-
-    print(repr(schedule) + ",", str(round(fullness * 100)) + "% full")
-    usedDesigs = []
-    usedDesigsR = [re.sub('_\\d', '', t) for t in scheduleDf["Target"].tolist() if
-                t != "Unused Time" and t != "Focus" and t != "TransitionBlock"]
-    for d in usedDesigsR:  # filter for unique candidate names after chopping off the _1/_2 etc. this used to be done with a set but that didn't preserve order
-        if d not in usedDesigs:
-            usedDesigs.append(d)
-    candidatesInSchedule = [candidateDict[d] for d in usedDesigs]
-
-    # do the observing log
-    if candidatesInSchedule:
+        # schedule png
+        visualizeSchedule(scheduleDf, join(savepath, "schedule.png"), join(savepath, "schedule.csv"),
+                        sunsetUTC, sunriseUTC)
+
+        logger.info("Status:Schedule visualized.")
+
+        schedLines = scheduleToTextFile(scheduleDf, configDict, candidateDict, prevSched=replan, spath=ephemSpath)
+        sched_outpath = join(savepath, "schedule.txt")
+        with open(sched_outpath, "w") as f:
+            f.writelines(schedLines)
+        print(f"Wrote schedule to {sched_outpath}")
+        if replan is not None:
+            diff = replan.diff(schedLines)
+            with open(join(savepath, "schedule.diff"), "w") as f:
+                f.writelines(diff)
+            print(f"Re-planned from {replanTime}, kept {len(replan.frozen)} tasks. Changes from the previous schedule:")
+            print("".join(diff) if diff else "(none)")
+        timer.meta.update({"start": sunsetUTC, "end": sunriseUTC, "numRuns": numRuns, "numCandidates": len(candidateDict),
+                           "fullness": fullness, "replanTime": replanTime,
+                           "scoreCache": {"hits": scoreCache.hits, "misses": scoreCache.misses} if scoreCache is not None else None})
+        timer.write(join(savepath, "scheduleProfile.json"))
         try:
-            df = Candidate.candidatesToDf(candidatesInSchedule)
-            df = genUtils.prettyFormat(df)
-            df.to_csv(join(savepath,"observingLog.csv"), index=False)
-            visualizeObservability(candidatesInSchedule, sunsetUTC, sunriseUTC, savepath, "visibilityAll")
+            checkerSched = ScheduleCls.read(join(savepath, "schedule.txt"))
+            checkerSched.check()
         except Exception as e:
-            sys.stderr.write("Writing obs log failed with exception " + repr(e))
-
-    # schedule png
-    visualizeSchedule(scheduleDf, join(savepath, "schedule.png"), join(savepath, "schedule.csv"),
-                    sunsetUTC, sunriseUTC)
-
-    logger.info("Status:Schedule visualized.")
-
-    schedLines = scheduleToTextFile(scheduleDf, configDict, candidateDict, spath=ephemSpath)
-    sched_outpath = join(savepath, "schedule.txt")
-    with open(sched_outpath, "w") as f:
-        f.writelines(schedLines)
-    print(f"Wrote schedule to {sched_outpath}")
-    try:
-        checkerSched = ScheduleCls.read(join(savepath, "schedule.txt"))
-        checkerSched.check()
-    except Exception as e:
-        sys.stderr.write("Got error trying to check schedule: " + repr(e) + "\n")
-        raise
+            sys.stderr.write("Got error trying to check schedule: " + repr(e) + "\n")
+            raise
+        return sched_outpath
 
 if __name__ == "__main__":
     run_with_crash_writing("scheduler",main)
\ No newline at end of file
@@ -116,6 +116,7 @@ async def runLogging(logger, lookback, candidateDbPath, mpcPriority):
     updated = []  # candidates that appear in both the list and the database and may need to be updated
     new = []  # candidates that appear in the list but not in the database
     removed = []  # candidates that appear in the database but not in the list
+    updates = []  # (ID, new values) for each updated candidate, written together at the end
     dbCandidates = dbConnection.table_query("Candidates", "*",
                                             "RemovedReason IS NULL AND CandidateType IS \"MPC NEO\"",
                                             [], returnAsCandidates=True)
@@ -136,7 +137,7 @@ async def runLogging(logger, lookback, candidateDbPath, mpcPriority):
                 # if needsUpdate(candidate, dbCandidates[desig]):
                 logger.info("Updating " + desig)
                 candidate.Filter = "CLEAR"
-                updateCandidate(dbCandidates[desig], candidate, dbConnection)
+                updates.append((dbCandidates[desig].ID, candidate.asDict()))
                 updated.append(candidate)
                 # else:
                 #     static.append(candidate)
@@ -157,9 +158,10 @@ async def runLogging(logger, lookback, candidateDbPath, mpcPriority):
             "No candidates added in the last " + str(lookback) + " hours. Adding all targets in list.")
         new = list(currentCandidates.values())
 
+    dbConnection.updateCandidates(updates)
     for candidate in new:  # add these
         candidate.Priority = mpcPriority
-        newID = dbConnection.insertCandidate(candidate)
+    for candidate, newID in zip(new, dbConnection.insertCandidates(new)):
         logger.debug(
             "Created " + candidate.CandidateName + " with ID " + str(newID) + ".")
 
@@ -20,6 +20,7 @@ from numpy import sqrt
 from photometrics.mpc_neo_confirm import MPCNeoConfirm as mpcObj
 
 from alora.config import observatory_location
+from alora.astroutils.obs_constraints import first_windows
 from alora.maestro.schedulerConfigs.MPC_NEO import mpcUtils
 
 # general fuckery
@@ -360,29 +361,19 @@ class TargetSelector:
                     need_more_ephems.remove(desig)
         self.logger.info(f"Done getting ephems.")
 
-        for desig in good_desigs:
-            obsStart = False
-            start = None
-            end = None
-            for ephem in ephems[desig]:
-                if self.isObservable(ephem):
-                    if not obsStart:  # window begins
-                        obsStart = True
-                        start = ephem.start_dt
-                elif obsStart:  # we've already started and we're no longer observable. window over
-                    end = ephem.start_dt
-                    windows[desig] = (start, end)
-                    break
-                end = ephem.start_dt  # this is the time of the last ephem we could get, so is the 'end' of our window (for now)
-            if start is None:  # we've run through all the ephemeris. End the window here, if one was started. otherwise, return None
+        # check every ephem line of every target at once, then find each target's window from the edges of its mask.
+        # the window starts at the first observable line and ends at the first unobservable line after that, or at the
+        # last line we have if it never becomes unobservable
+        lines = [ephem for desig in good_desigs for ephem in ephems[desig]]
+        times = [ephem.start_dt for ephem in lines]
+        viable = genUtils.observation_viable_many(times, [ephem.RA for ephem in lines], [ephem.Dec for ephem in lines])
+        has_window, starts, ends = first_windows(viable, [len(ephems[desig]) for desig in good_desigs])
+        for desig, observable, start, end in zip(good_desigs, has_window, starts, ends):
+            if not observable:
                 self.logger.info(f"{desig} is not observable at all during the times we have ephemerides for.")
-                # ha_start, ha_end = genUtils.getHourAngleLimits(ephems[desig][0].Dec)
-                # print(f"RA window: {self.siderealStart + ha_start} to {self.siderealStart + ha_end}")
-                # # print(f"current sidereal time: {self.siderealStart}")
-                # print(f"RA: {ephems[desig][0].RA}")
                 windows[desig] = None
                 continue
-            windows[desig] = (start, end)
+            windows[desig] = (times[start], times[end])
 
         for desig in windows.keys():
             if windows[desig] is not None:
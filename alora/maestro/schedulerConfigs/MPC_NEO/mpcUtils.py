@@ -5,6 +5,8 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
 from .constants import CACHE_PATH, CACHE_DB_PATH
 sys.path.remove(os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir)))
+import bisect
+import json
 import logging
 import sqlite3
 import time
@@ -32,6 +34,7 @@ try:
     from alora.maestro.scheduleLib import genUtils
     from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
     from alora.maestro.scheduleLib.genUtils import angleToHMSString, angleToDMSString
+    from alora.maestro.scheduleLib.lru import LRUCache
 
     sys.path.remove(grandparentDir)
     aConfig = genUtils.Config(os.path.join(grandparentDir, "files", "configs", "async_config.toml"))
@@ -41,6 +44,7 @@ except:
     from alora.maestro.scheduleLib import genUtils
     from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
     from alora.maestro.scheduleLib.genUtils import angleToHMSString, angleToDMSString
+    from alora.maestro.scheduleLib.lru import LRUCache
     aConfig = genUtils.Config(os.path.join("files", "configs", "async_config.toml"))
 
 
@@ -48,6 +52,9 @@ mConfig = genUtils.Config(join(dirname(__file__),"config.toml"))
 
 EPHEM_LIFETIME_MINUTES = mConfig["EPHEM_LIFETIME_MINUTES"]
 UNCERT_LIFETIME_MINUTES = mConfig["UNCERT_LIFETIME_MINUTES"]
+EPHEM_MEMORY_CACHE_ENTRIES = mConfig.get("EPHEM_MEMORY_CACHE_ENTRIES", 256)
+EPHEM_MEMORY_CACHE_MB = mConfig.get("EPHEM_MEMORY_CACHE_MB", 128)
+EPHEM_CACHE_FORMAT = mConfig.get("EPHEM_CACHE_FORMAT", "npy")
 
 mpcInst = mpc()
 mpcInst.int = 3
@@ -497,7 +504,36 @@ class UncertainEphemFriend:
             self.conn.commit()
         self.db.execute(f"CREATE TABLE IF NOT EXISTS ephems ({','.join([f'{k} {v}' for k,v in self._ephem_schema.items()])})")
         self.db.execute(f"CREATE TABLE IF NOT EXISTS uncertainties ({','.join([f'{k} {v}' for k,v in self._uncertain_schema.items()])})")
+        # find_cached_ephem_paths looks ephems up by designation and time range, newest first
+        self.db.execute('CREATE INDEX IF NOT EXISTS ephems_lookup ON ephems (desig, start, "end", generated)')
         self.conn.commit()
+        if EPHEM_CACHE_FORMAT == "npy":
+            self.convert_cache_to_npy()
+
+    def convert_cache_to_npy(self):
+        """Rewrite the text ephems in the cache as .npy files (see MpcEphem.write), so that they can be read without parsing. Returns the number of ephems converted"""
+        self.db.execute("SELECT desig, filepath FROM ephems WHERE filepath LIKE '%.txt'")
+        rows = self.db.fetchall()
+        converted = []
+        for desig, filepath in rows:
+            if not os.path.exists(filepath):
+                continue  # get_ephems will drop it from the cache database when it's asked for
+            try:
+                ephem = MpcEphem._parse_file(desig, filepath)
+                npy_path = filepath[:-len(".txt")] + ".npy"
+                np.save(npy_path, ephem.to_array())
+                if os.path.exists(filepath + ".f"):
+                    os.replace(filepath + ".f", npy_path + ".f")
+                os.remove(filepath)
+            except Exception as e:
+                self.logger.error(f"Couldn't convert cached ephem {filepath} to .npy: {repr(e)}")
+                continue
+            converted.append((npy_path, filepath))
+        if converted:
+            self.db.executemany("UPDATE ephems SET filepath=? WHERE filepath=?", converted)
+            self.conn.commit()
+            self.logger.info(f"Converted {len(converted)} cached ephems to .npy")
+        return len(converted)
     
     def cleanup_cache(self):
         """Remove old ephems and uncertainties from the cache"""
@@ -536,35 +572,49 @@ class UncertainEphemFriend:
             return filepath[0]
         return None
     
+    def find_cached_ephem_paths(self, desigs, ephem_time):
+        """Find the paths to the cached ephems for many designations at a given time, in one query. Like find_cached_ephem_path, but a designation with no ephem covering ephem_time also matches an ephem covering the next ten-minute mark after it (see get_ephems). Returns a dictionary of {desig: filepath} for the designations that have a cached ephem."""
+        self.db.execute("""SELECT desig, filepath FROM (
+                               SELECT e.desig, e.filepath,
+                                      ROW_NUMBER() OVER (PARTITION BY e.desig ORDER BY t.fallback, e.generated DESC) AS newness
+                               FROM (SELECT 0 AS fallback, :t AS t UNION ALL SELECT 1, :fallback_t) AS t
+                               JOIN ephems AS e ON e.start <= t.t AND e."end" >= t.t
+                               WHERE e.desig IN (SELECT value FROM json_each(:desigs)) AND e.generated - :now <= :lifetime)
+                           WHERE newness = 1""",
+                        {"t": ephem_time.timestamp(),
+                         "fallback_t": genUtils.roundToTenMinutes(ephem_time + timedelta(minutes=5)).timestamp(),
+                         "desigs": json.dumps(list(desigs)), "now": datetime.now(tz=pytz.UTC).timestamp(),
+                         "lifetime": self.ephem_lifetime_s})
+        return dict(self.db.fetchall())
+
     async def get_ephems(self, desigs, ephem_time,mpc_inst=mpcInst, obsCode=500):
         """Get ephemerides for a list of designations at a given time. Returns a dictionary of {desig: MpcEphem object}"""
         need_to_fetch = []
         ephems = {}
+        # an ephem that covers the next ten-minute mark after ephem_time also counts. this prevents us from constantly fetching ephems for an object when the time requested lies after the last ephem in a file but before an ephem ten minutes later (the time resolution) thats in another file. happens more often than you may expect
+        cached = self.find_cached_ephem_paths(desigs, ephem_time)
+        missing_files = []
         for desig in desigs:
-            filepath = self.find_cached_ephem_path(desig,ephem_time)
-            temp_eph_time = ephem_time
-            # this little bit prevents us from constantly fetching ephems for an object when the time requested lies after the last ephem in a file but before an ephem ten minutes later (the time resolution) thats in another file. happens more often than you may expect
-            if filepath is None:
-                temp_eph_time = genUtils.roundToTenMinutes(ephem_time + timedelta(minutes=5))
-                filepath = self.find_cached_ephem_path(desig,temp_eph_time)
+            filepath = cached.get(desig)
             if filepath is not None:
-                ephem_time = temp_eph_time
                 if os.path.exists(filepath):
                     self.logger.debug(f"Found cached ephem for {desig} at {os.sep.join(filepath.split(os.sep)[-3:])}")
                     # we have a cached ephem, let's read it
                     # TODO: should we just find the specific line here?????? or read in the whole file, make the MpcEphem object, and return it
                     ephems[desig] = MpcEphem.from_file(desig,filepath)
                     continue
-                
+
                 # uh oh! we found a filepath in the database but the file doesn't exist!
                 self.logger.error(f"Couldn't find file {filepath} for cached ephem for {desig} at {ephem_time}, despite it being in the cache database. Removing from cache database and will fetch.")
-                self.db.execute("DELETE FROM ephems WHERE filepath=?",(filepath[0],))
+                missing_files.append((filepath,))
             else:
                 # only log this message on the else clause. everything else should run if we reach this point, no else required
                 self.logger.info(f"No cached ephem for {desig} at {ephem_time}. Will fetch.")
             # we don't have a cached ephem, let's get it
             need_to_fetch.append(desig)
-        self.conn.commit()
+        if missing_files:
+            self.db.executemany("DELETE FROM ephems WHERE filepath=?", missing_files)
+            self.conn.commit()
 
         if len(need_to_fetch) > 0:
             eph = await asyncMultiEphem(need_to_fetch,ephem_time,0,mpc_inst,_asyncHelper,self.logger,obsCode=obsCode)
@@ -578,7 +628,7 @@ class UncertainEphemFriend:
                     continue
                 ephem = eph[desig]
                 eph_inst = MpcEphem(desig,ephem)
-                filepath = eph_inst.write(os.path.join(self.ephem_cache_dir,desig),self.logger)
+                filepath = eph_inst.write(os.path.join(self.ephem_cache_dir,desig),self.logger,binary=EPHEM_CACHE_FORMAT == "npy")
                 self.db.execute("INSERT INTO ephems (desig,start,end,generated,filepath) VALUES (?,?,?,?,?)",(desig,eph_inst.start_time.timestamp(),eph_inst.end_time.timestamp(),datetime.now(tz=pytz.UTC).timestamp(),filepath))
                 ephems[desig] = eph_inst
             self.conn.commit()
@@ -720,30 +770,80 @@ class UncertainEphemFriend:
             uncerts[desig] = MpcUncert(desig, round(rmsRA, 2), round(rmsDec, 2), highestColor, fpath)
         return uncerts
 
+# parsed ephem files, keyed by (path, modification time, desig) so that a file that has been rewritten is read again
+_ephem_memory_cache = LRUCache(maxEntries=EPHEM_MEMORY_CACHE_ENTRIES or None,
+                               maxBytes=EPHEM_MEMORY_CACHE_MB * 1024 ** 2 if EPHEM_MEMORY_CACHE_MB else None,
+                               sizeof=lambda ephem: ephem.nbytes)
+
+# what MpcEphem.write(binary=True) stores, one row per line: time as a unix timestamp, RA and Dec in degrees, and the rates in arcsec/min
+EPHEM_DTYPE = np.dtype([("time", "f8"), ("RA", "f8"), ("Dec", "f8"), ("Vmag", "f8"), ("dRA", "f8"), ("dDec", "f8")])
+
+def _to_microseconds(times):
+    """Internal. Integer microseconds since the epoch of each of a list of timezone-aware datetimes, as an int64 array"""
+    return np.array([round(t.timestamp() * 1e6) for t in times], dtype=np.int64)
+
+
+# roughly what one parsed line (an EphemLine with its Angles and Quantities, and its time) takes up in memory
+_EPHEM_LINE_BYTES = 4096
+
+
 class MpcEphem:
     """An object that represents a group of ephemeris for one object over some time period"""
     def __init__(self,desig, ephems, filepath=None, format_path=None):
         # ephems must be a list of objects that have attributes start_dt (datetime), RA (angle or degree float), Dec (Angle or degree float), Vmag (float), dRA (Quantity), dDec (Quantity)
         self.desig = desig
+        ephems = sorted(ephems, key=lambda eph: eph.start_dt)
         # ephem_dict is a dict of {start_dt: EphemLine named tuples}:
         self.times = [eph.start_dt for eph in ephems]
         self.ephem_dict = dict(zip(self.times,[EphemLine(eph.start_dt,genUtils.ensureAngle(eph.RA),genUtils.ensureAngle(eph.Dec),eph.Vmag,eph.dRA,eph.dDec) for eph in ephems]))
         self.start_time = self.times[0]
         self.end_time = self.times[-1]
+        # sorted integer microseconds since the epoch, one per line, for binary searches by time (bisect for one time, numpy for many)
+        self._us = _to_microseconds(self.times)
+        self._us_list = self._us.tolist()
         self.filepath=filepath # this just keeps track of where the ephem THINKS its data is for convenience
         self.format_path=format_path
 
+    def _nearest(self, times, tolerance=None):
+        """Internal. Indices of the lines that get() returns for each of times, or -1 where it returns None"""
+        t = _to_microseconds(times)
+        i = np.searchsorted(self._us, t)
+        before = np.clip(i - 1, 0, len(self._us) - 1)
+        after = np.clip(i, 0, len(self._us) - 1)
+        # the closest line, taking the earlier one on a tie
+        nearest = np.where(np.abs(self._us[after] - t) < np.abs(self._us[before] - t), after, before)
+        exact = self._us[after] == t
+        nearest[exact] = after[exact]
+        found = exact | ((t > self._us[0]) & (t < self._us[-1]))
+        if tolerance is not None:
+            found &= exact | (np.abs(self._us[nearest] - t) < tolerance // timedelta(microseconds=1))
+        return np.where(found, nearest, -1)
+
     def get(self,t, tolerance=None, scheduler_format=False):
         """Get the ephemeris for a given time. If the time is not in the ephemeris, return the closest time within tolerance, or None. If scheduler_format is True, return the scheduler-formatted string for the ephemeris."""
-        if t in self.ephem_dict.keys():
-            return self.ephem_dict[t] if not scheduler_format else _formatEphem([self.ephem_dict[t]],self.desig)[t]
+        us = round(t.timestamp() * 1e6)
+        i = bisect.bisect_left(self._us_list, us)
+        if i < len(self._us_list) and self._us_list[i] == us:
+            m = i
+        elif self._us_list[0] < us < self._us_list[-1]:
+            # the closest line, taking the earlier one on a tie
+            m = i if self._us_list[i] - us < us - self._us_list[i - 1] else i - 1
+            if tolerance is not None and not abs(self._us_list[m] - us) < tolerance // timedelta(microseconds=1):
+                return None
         else:
-            if t > self.start_time and t < self.end_time:
-                # return the closest time
-                m = min(self.times, key=lambda x: abs(x-t))
-                if tolerance is None or abs(m-t) < tolerance:
-                    return self.ephem_dict[m] if not scheduler_format else _formatEphem([self.ephem_dict[m]],self.desig)[m]
-        return None
+            return None
+        line = self.ephem_dict[self.times[m]]
+        return line if not scheduler_format else _formatEphem([line],self.desig)[line.start_dt]
+
+    def get_many(self, times, tolerance=None, scheduler_format=False):
+        """Get the ephemeris for each of a list of times, like get(). Returns a list with an EphemLine (or scheduler-formatted string, if scheduler_format is True) or None for each time."""
+        if not len(times):
+            return []
+        lines = [self.ephem_dict[self.times[i]] if i >= 0 else None for i in self._nearest(times, tolerance).tolist()]
+        if not scheduler_format:
+            return lines
+        formatted = _formatEphem([line for line in lines if line is not None],self.desig)
+        return [formatted[line.start_dt] if line is not None else None for line in lines]
     
     def __repr__(self) -> str:
         return f"MpcEphem for {self.desig} from {self.start_time} to {self.end_time}"
@@ -756,37 +856,88 @@ class MpcEphem:
         """Get the last (latest) ephemeris line in the ephemeris. If scheduler_format is True, return the scheduler-formatted string for the ephemeris."""
         return self.ephem_dict[self.end_time] if not scheduler_format else _formatEphem([self.ephem_dict[self.end_time]],self.desig)[self.end_time]
 
-    def write(self, save_dir, logger, filename=None, scheduler_format=True, format_only=False):
-        """Write the ephemeris to a file. Returns the path to the file. If scheduler_format is True, also write a scheduler-formatted file. If format_only is True, only write the scheduler-formatted file."""
+    def write(self, save_dir, logger, filename=None, scheduler_format=True, format_only=False, binary=False):
+        """Write the ephemeris to a file. Returns the path to the file. If scheduler_format is True, also write a scheduler-formatted file. If format_only is True, only write the scheduler-formatted file. If binary is True, the ephemeris is written as a .npy array of EPHEM_DTYPE (see to_array) instead of text, which from_file can read without parsing. The ephemeris itself isn't modified (its format_path is left alone), since from_file may share it between callers."""
         start = round(self.start_time.timestamp())
         end = round(self.end_time.timestamp())
         generated = round(datetime.now(tz=pytz.UTC).timestamp())
-        filename = filename if filename is not None else f"{generated}_{start}_{end}.txt"
+        filename = filename if filename is not None else f"{generated}_{start}_{end}.{'npy' if binary else 'txt'}"
         os.makedirs(save_dir,exist_ok=True)
         filepath = os.path.join(save_dir,filename)
         if format_only and not scheduler_format:
             logger.warning("Programmer error: MpcEphem.write called with format_only=True but scheduler_format=False. No formatted file will be written.")
-        if not format_only:
+        if not format_only and binary:
+            with open(filepath,"wb") as f:  # np.save would add .npy to a filename without it
+                np.save(f, self.to_array())
+        elif not format_only:
             with open(filepath,"w+") as f:
                 for v in self.ephem_dict.values():
                     f.write(f"{v.start_dt.timestamp()},{round(v.RA.to_value('degree'),5)},{round(v.Dec.to_value('degree'),5)},{v.Vmag},{round(v.dRA.to_value('arcsec/min'),2) },{round(v.dDec.to_value('arcsec/min'),2)}\n")
         if scheduler_format:
             fpath = filepath if format_only else f"{filepath}.f"
-            self.format_path = fpath
             formatted = _formatEphem(list(self.ephem_dict.values()),self.desig)
             with open(fpath,"w+") as f:
                 for v in formatted.values():
                     f.write(v+"\n")
         return filepath
 
+    def to_array(self):
+        """Return the ephemeris as a structured numpy array of EPHEM_DTYPE, one row per line, in time order."""
+        lines = list(self.ephem_dict.values())
+        arr = np.empty(len(lines), dtype=EPHEM_DTYPE)
+        arr["time"] = [v.start_dt.timestamp() for v in lines]
+        arr["RA"] = [v.RA.to_value("degree") for v in lines]
+        arr["Dec"] = [v.Dec.to_value("degree") for v in lines]
+        arr["Vmag"] = [v.Vmag for v in lines]
+        arr["dRA"] = [v.dRA.to_value("arcsec/min") for v in lines]
+        arr["dDec"] = [v.dDec.to_value("arcsec/min") for v in lines]
+        return arr
+
+    @classmethod
+    def from_array(cls, desig, arr, filepath=None):
+        """Create a MpcEphem object from a structured array of EPHEM_DTYPE, like the one returned by to_array."""
+        rate = u.arcsec / u.min
+        ephems = [EphemLine(datetime.fromtimestamp(t, tz=pytz.UTC), RA, Dec, Vmag, dRA * rate, dDec * rate)
+                  for t, RA, Dec, Vmag, dRA, dDec in zip(*[arr[name].tolist() for name in EPHEM_DTYPE.names])]
+        return cls(desig, ephems, filepath=filepath)
+
     @property
     def raw(self):
         """Return the raw ephemeris data as a list of EphemLine namedtuples."""
         return list(self.ephem_dict.values())
 
+    @property
+    def nbytes(self):
+        """Estimated size of the ephemeris in memory, in bytes"""
+        return len(self.times) * _EPHEM_LINE_BYTES
+
+    @staticmethod
+    def cache_stats():
+        """Hits, misses, evictions, entries and estimated bytes of the in-memory cache of ephems read by from_file"""
+        return _ephem_memory_cache.stats
+
+    @staticmethod
+    def clear_cache():
+        _ephem_memory_cache.clear()
+
     @classmethod
     def from_file(cls,desig, filepath):
-        """Create a MpcEphem object from a file. The file must be in the format generated by MpcEphem.write"""
+        """Create a MpcEphem object from a file. The file must be in the format generated by MpcEphem.write. Files that were already read (and haven't changed since) come from an in-memory cache (unless EPHEM_MEMORY_CACHE_ENTRIES is 0), so the returned object may be shared: don't modify it"""
+        if not EPHEM_MEMORY_CACHE_ENTRIES:
+            return cls._parse_file(desig, filepath)
+        key = (os.path.abspath(filepath), os.stat(filepath).st_mtime_ns, desig)
+        ephem = _ephem_memory_cache.get(key)
+        if ephem is None:
+            ephem = cls._parse_file(desig, filepath)
+            _ephem_memory_cache.put(key, ephem)
+        return ephem
+
+    @classmethod
+    def _parse_file(cls, desig, filepath):
+        """Internal. Read and parse an ephem file written by MpcEphem.write"""
+        if filepath.endswith(".npy"):
+            # memory-mapped: the columns are read straight out of the file, with nothing to parse
+            return cls.from_array(desig, np.load(filepath, mmap_mode="r"), filepath=filepath)
         with open(filepath,"r") as f:
             lines = f.readlines()
         
@@ -16,15 +16,17 @@ try:
     sys.path.append(
         grandparentDir)
     from alora.maestro.schedulerConfigs.MPC_NEO import mpcUtils
-    from alora.maestro.scheduleLib.candidateDatabase import CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import CandidateDatabase, open_candidate_database
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration, Config
+    from alora.maestro.scheduleLib.scoring import block_constraint_scores, observability_indices
     sys.path.remove(grandparentDir)
 
 
 except ImportError:
     from alora.maestro.schedulerConfigs.MPC_NEO import mpcUtils
-    from alora.maestro.scheduleLib.candidateDatabase import CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import CandidateDatabase, open_candidate_database
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration, Config
+    from alora.maestro.scheduleLib.scoring import block_constraint_scores, observability_indices
 
 mConfig = Config(join(dirname(__file__),"config.toml"))
 
@@ -44,6 +46,8 @@ def reverseNonzeroRunInplace(arr):
 
 
 class MpcConfig(TypeConfiguration):
+    acceptsCandidateSnapshot = True
+
     def __init__(self, scorer, priority, maxMinutesWithoutFocus=70, numObs=2, minMinutesBetweenObs=35, downtimeMinutesAfterObs:float=0):
         super().__init__(scorer,maxMinutesWithoutFocus, numObs, minMinutesBetweenObs, downtimeMinutesAfterObs)
         self.Priority = priority
@@ -54,7 +58,7 @@ class MpcConfig(TypeConfiguration):
         self.name = "MPC NEO"
 
     def selectCandidates(self, startTimeUTC: datetime, endTimeUTC: datetime, dbPath):
-        dbConnection = CandidateDatabase(dbPath, "Night Obs Tool")
+        dbConnection = open_candidate_database(dbPath, "Night Obs Tool")
         candidates = [c for c in mpcUtils.mpcCandidatesForTimeRange(startTimeUTC, endTimeUTC, 1, dbConnection)]
         # print("Candidates:",candidates)
         self.designations = [c.CandidateName for c in candidates]
@@ -85,6 +89,7 @@ class MpcConfig(TypeConfiguration):
 
 
 def linearDecrease(lenArr, x1, xIntercept):
+    # x1 and xIntercept can be column arrays, in which case this makes one row per pair
     return (np.arange(lenArr) - xIntercept) * -1 / (xIntercept - x1)
 
 
@@ -94,32 +99,31 @@ class MPCScorer(astroplan.Scorer):
         super(MPCScorer, self).__init__(*args, **kwargs)
 
     # this makes a score array over the entire schedule for all of the blocks and each Constraint in the .constraints of each block and in self.global_constraints.
+    # all of the blocks are scored at once: (targets x times) arrays instead of one row at a time
     def create_score_array(self, time_resolution=1 * u.minute):
         start = self.schedule.start_time
         end = self.schedule.end_time
         times = astroplan.time_grid_from_range((start, end), time_resolution)
-        scoreArray = numpy.ones(shape=(len(self.blocks), len(times)))
-        for i, block in enumerate(self.blocks):
-            desig = block.target.name
-            candidate = self.candidateDict[desig]
-
-            if block.constraints:
-                for constraint in block.constraints:  # apply the observability window constraint
-                    appliedScore = constraint(self.observer, block.target,
-                                              times=times)
-                    scoreArray[i] *= appliedScore  # scoreArray[i] is an array of len(times) items
-
-                startIdx = int((Time(stringToTime(candidate.StartObservability)) - start) / time_resolution)
-                endIdx = int((Time(stringToTime(candidate.EndObservability)) - start) / time_resolution)
-                scoreArray[i] *= linearDecrease(len(times), startIdx, endIdx)
-
-                # window = (stringToTime(candidate.EndObservability) - stringToTime(
-                #     candidate.StartObservability)).total_seconds()
-                # scoreArray[i] *= (round(block.duration.to_value(u.second) / window,
-                #                         4))  # favor targets with short windows so that they get observed
-                # scoreArray[i] *= (round(1 / block.duration.to_value(u.second),
-                #                         4))  # favor targets with long windows so it's more likely they get 2 obs in
-            scoreArray[i] *= 20/((float(candidate.Magnitude)*mConfig["mag_coeff"]))
+        blocks = list(self.blocks)
+        candidates = [self.candidateDict[block.target.name] for block in blocks]
+
+        # apply the observability window constraint (and any others on the blocks)
+        scoreArray = block_constraint_scores(self.observer, blocks, times)
+
+        # only the blocks that have constraints get the linear decrease across their observability window
+        rows = [i for i, block in enumerate(blocks) if block.constraints]
+        if rows:
+            startIdx, endIdx = observability_indices([candidates[i] for i in rows], start, time_resolution)
+            scoreArray[rows] *= linearDecrease(len(times), startIdx[:, np.newaxis], endIdx[:, np.newaxis])
+
+            # window = (stringToTime(candidate.EndObservability) - stringToTime(
+            #     candidate.StartObservability)).total_seconds()
+            # scoreArray[i] *= (round(block.duration.to_value(u.second) / window,
+            #                         4))  # favor targets with short windows so that they get observed
+            # scoreArray[i] *= (round(1 / block.duration.to_value(u.second),
+            #                         4))  # favor targets with long windows so it's more likely they get 2 obs in
+        magnitudes = np.array([float(c.Magnitude) for c in candidates])
+        scoreArray *= (20 / (magnitudes * mConfig["mag_coeff"]))[:, np.newaxis]
         for constraint in self.global_constraints:  # constraints applied to all targets
             scoreArray *= constraint(self.observer, self.targets, times, grid_times_targets=True)
         return scoreArray
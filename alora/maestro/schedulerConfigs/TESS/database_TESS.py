@@ -47,6 +47,12 @@ def updateCandidate(candidate: Candidate, dbConnection: CandidateDatabase):
     dbConnection.editCandidateByID(candidate.ID, candidate.asDict())
     dbConnection.clear_invalid_status(candidate.ID)
 
+def updateCandidates(candidates, dbConnection: CandidateDatabase):
+    """
+    updateCandidate for many candidates at once, in one transaction
+    """
+    dbConnection.updateCandidates([(c.ID, {**c.asDict(), "RemovedReason": None, "RejectedReason": None}) for c in candidates])
+
 # to deal with multiple of the same planet in different (or the same) CSVs (because of multiple transits),
 # we will need to load each csv into one big dataframe, then de-duplicate by choosing the next transit of each that
 # has not already occcurred. then, if the candidate is new we'll add it to the database, if it's already in the database
@@ -162,12 +168,17 @@ def update_and_insert(csv_candidates, dbConnection):
     """
 
     write_out("Checking against existing candidates in database...")
+    existing = {}
+    if csv_candidates:
+        for ec in dbConnection.getCandidatesByNames([c.CandidateName for c in csv_candidates]) or []:
+            existing.setdefault(ec.CandidateName, []).append(ec)
+    new, updates = [], []  # written at the end, each in a single transaction
     for c in csv_candidates:
-        ec = dbConnection.getCandidateByName(c.CandidateName)
+        ec = existing.get(c.CandidateName)
         if not ec:
             # c.StartObservability = genUtils.timeToString(c.StartObservability, shh=True)
             # c.EndObservability = genUtils.timeToString(c.EndObservability, shh=True)
-            dbConnection.insertCandidate(c)
+            new.append(c)
             write_out(f"New TESS Candidate: {c.CandidateName}")
             continue
         if len(ec) > 1:
@@ -178,7 +189,7 @@ def update_and_insert(csv_candidates, dbConnection):
             # c.StartObservability = genUtils.timeToString(c.StartObservability, shh=True)
             # c.EndObservability = genUtils.timeToString(c.EndObservability, shh=True)
             c.ID = ec.ID
-            updateCandidate(ec, dbConnection)
+            updates.append(ec)
             continue
 
         ec_start = stringToTime(ec.StartObservability).replace(tzinfo=pytz.UTC) 
@@ -195,7 +206,9 @@ def update_and_insert(csv_candidates, dbConnection):
             write_out(f"Existing candidate for {ec.CandidateName} had a sooner future transit (at {ec.StartObservability}) than any others found. Keeping that transit.")
         # we update the candidate either way, in case other fields have changed
         c.ID = ec.ID
-        updateCandidate(c, dbConnection)
+        updates.append(c)
+    dbConnection.insertCandidates(new)
+    updateCandidates(updates, dbConnection)
     write_out(f"Candidates from csvs successfully updated.")
 
 
@@ -11,7 +11,7 @@ try:
     grandparentDir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
     sys.path.append(grandparentDir)
     from alora.maestro.scheduleLib import genUtils, candidateDatabase
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, open_candidate_database
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration
     from alora.maestro.scheduleLib.schedule import generic_schedule_line
 
@@ -23,12 +23,14 @@ except ImportError:
     from alora.maestro.scheduleLib import genUtils
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration
     from alora.maestro.scheduleLib.schedule import generic_schedule_line
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, open_candidate_database
 
     tConfig = genUtils.Config(join(dirname(__file__), "config.toml"))
 
 
 class TESS_Config(TypeConfiguration):
+    acceptsCandidateSnapshot = True
+
     def __init__(self, scorer, maxMinutesWithoutFocus=10000, numObs=1, minMinutesBetweenObs=0,downtimeMinutesAfterObs=0):
         super().__init__(scorer,maxMinutesWithoutFocus, numObs, minMinutesBetweenObs, downtimeMinutesAfterObs)
         self.timeResolution = None
@@ -37,7 +39,7 @@ class TESS_Config(TypeConfiguration):
         self.name = "TESS"
 
     def selectCandidates(self, startTimeUTC: datetime, endTimeUTC: datetime, dbPath):
-        dbConnection = CandidateDatabase(dbPath, "Night Obs Tool - TESS Agent")
+        dbConnection = open_candidate_database(dbPath, "Night Obs Tool - TESS Agent")
         candidates = dbConnection.candidatesForTimeRange(startTimeUTC, endTimeUTC, 0.1, "TESS")
         for c in candidates:
             exptime = c.ExposureTime
@@ -10,7 +10,7 @@ try:
     grandparentDir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.path.pardir, os.path.pardir))
     sys.path.append(grandparentDir)
     from alora.maestro.scheduleLib import genUtils, candidateDatabase
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, open_candidate_database
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration
     from alora.maestro.scheduleLib.schedule import generic_schedule_line
 
@@ -20,13 +20,15 @@ except ImportError:
     from alora.maestro.scheduleLib import genUtils
     from alora.maestro.scheduleLib.genUtils import stringToTime, TypeConfiguration
     from alora.maestro.scheduleLib.schedule import generic_schedule_line
-    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase
+    from alora.maestro.scheduleLib.candidateDatabase import Candidate, CandidateDatabase, open_candidate_database
 
 
 uConfig = genUtils.Config(join(dirname(__file__), "config.toml"))
 
 
 class User_Fixed_Config(TypeConfiguration):
+    acceptsCandidateSnapshot = True
+
     def __init__(self, scorer, maxMinutesWithoutFocus=30, numObs=1, minMinutesBetweenObs=0, downtimeMinutesAfterObs=0):
         super().__init__(scorer,maxMinutesWithoutFocus, numObs, minMinutesBetweenObs, downtimeMinutesAfterObs)
         self.timeResolution = None
@@ -35,7 +37,7 @@ class User_Fixed_Config(TypeConfiguration):
         self.name="UserFixed"
 
     def selectCandidates(self, startTimeUTC: datetime, endTimeUTC: datetime, dbPath):
-        dbConnection = CandidateDatabase(dbPath, "Night Obs Tool - UserFixed Agent")
+        dbConnection = open_candidate_database(dbPath, "Night Obs Tool - UserFixed Agent")
         candidates = dbConnection.candidatesForTimeRange(startTimeUTC, endTimeUTC, 0.1, "UserFixed")
         self.designations = [c.CandidateName for c in candidates]
         return candidates
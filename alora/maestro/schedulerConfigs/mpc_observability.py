@@ -6,7 +6,7 @@ from alora.maestro.scheduleLib import genUtils
 from alora.maestro.schedulerConfigs.MPC_NEO.mpcUtils import MpcEphem, EphemLine
 from alora.maestro.scheduleLib.genUtils import timeToString as tts
 from alora.astroutils.observing_utils import get_current_sidereal_time, find_transit_time, get_hour_angle, current_dt_utc, dateToSidereal
-from alora.astroutils.obs_constraints import ObsConstraint
+from alora.astroutils.obs_constraints import ObsConstraint, first_windows
 from astropy.time import Time
 import matplotlib.pyplot as plt
 from argparse import ArgumentParser
@@ -36,22 +36,12 @@ def determine_observability(ephems:Union[MpcEphem,EphemLine]):
     else:
         raw_ephems = ephems
     raw_ephems.sort(key=lambda x: x.start_dt)
-    obsStart = False
-    start = None
-    end = None
-    for ephem in raw_ephems:
-        if isObservable(ephem):
-            if not obsStart:  # window begins
-                obsStart = True
-                start = ephem.start_dt
-        elif obsStart:  # we've already started and we're no longer observable. window over
-            end = ephem.start_dt
-            return (start, end)
-        end = ephem.start_dt  # this is the time of the last ephem we could get, so is the 'end' of our window (for now)
-    if start is None:  # we've run through all the ephemeris. End the window here, if one was started. otherwise, return None
+    times = [ephem.start_dt for ephem in raw_ephems]
+    viable = genUtils.observation_viable_many(times, [ephem.RA for ephem in raw_ephems], [ephem.Dec for ephem in raw_ephems])
+    has_window, start, end = first_windows(viable, [len(raw_ephems)])
+    if not has_window[0]:
         return None
-    
-    return (start, end)
+    return (times[start[0]], times[end[0]])
 
 col_width = 23
 label_width = 6
@@ -89,7 +79,7 @@ def main():
             print(f"Ephemeris directory not found: {ephem_dir}")
             continue
         
-        ephem_files = [f for f in os.listdir(ephem_dir) if f.endswith(".txt")]
+        ephem_files = [f for f in os.listdir(ephem_dir) if f.endswith((".txt", ".npy"))]
         if not len(ephem_files):
             print(f"No ephemeris files found in {ephem_dir}")
             continue
@@ -116,8 +106,7 @@ def main():
 
         local_tz = datetime.now(timezone.utc).astimezone().tzinfo
 
-        for t in window:
-            eph = joint_eph.get(t)
+        for t, eph in zip(window, joint_eph.get_many(window)):
             utcs.append(tts(t))
             local.append(tts(t.astimezone(local_tz)))
             lsts.append(ang_to_str(Time(t).sidereal_time(longitude=tmo.locationInfo.longitude,kind="apparent")))
@@ -0,0 +1,269 @@
+# Sage Santomenna 2025
+# synthetic-load benchmark for the scheduler: builds throwaway candidate databases of a given size, times createSchedule
+# on each (end to end and per stage) and compares the timings against a stored baseline
+# timings only compare between runs on the same machine, so record a baseline (--save-baseline) on each machine the
+# benchmark is run on before comparing against it. the baseline in files/benchmarks is only the one for the machine it
+# was recorded on, and only covers the candidate types listed in it
+
+import os, sys, json, argparse, platform, statistics, tempfile
+from os.path import join, dirname, abspath, exists
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+import astropy.units as u
+from astropy.coordinates import Angle
+
+MODULE_PATH = abspath(dirname(__file__))
+def PATH_TO(fname:str): return join(MODULE_PATH,fname)
+
+sys.path.append(MODULE_PATH)
+
+from alora.maestro.scheduleLib.genUtils import timeToString, configure_logger
+from alora.maestro.scheduleLib.candidateDatabase import BaseCandidate, CandidateDatabase
+from alora.maestro.scheduleLib.profiling import StageTimer
+from alora.maestro.scheduler import makeObserver, loadSchedulingConfigs, createSchedule
+
+logger = configure_logger("Scheduler Benchmark")
+
+BENCHMARK_TYPES = ("MPC NEO", "TESS", "UserFixed")
+DEFAULT_SIZES = (10, 100, 1000, 5000)
+BASELINE_PATH = PATH_TO(join("files", "benchmarks", "scheduler_baseline.json"))
+
+# a fixed winter night, so that runs on different days schedule the same sky
+NIGHT_START = datetime(2025, 1, 15, 2, 0, tzinfo=pytz.UTC)
+NIGHT_END = datetime(2025, 1, 15, 13, 0, tzinfo=pytz.UTC)
+
+
+def synthetic_candidate(candidateType, index, startTime, endTime, rng):
+    """!
+    Make a plausible candidate of the given type with an observability window inside [startTime, endTime]
+    The candidates only use the general candidate fields, so they're built as BaseCandidates: they serialize to the same
+    database row that the module's own candidate class would make, and the module doesn't have to be importable to build
+    the database
+    @param rng: numpy Generator
+    @return: BaseCandidate
+    """
+    nightMinutes = (endTime - startTime).total_seconds() / 60
+    windowMinutes = float(rng.uniform(45, min(360, nightMinutes)))
+    windowStart = startTime + timedelta(minutes=float(rng.uniform(0, nightMinutes - windowMinutes)))
+    windowEnd = windowStart + timedelta(minutes=windowMinutes)
+    fields = {"RA": Angle(float(rng.uniform(0, 360)), unit=u.deg), "Dec": Angle(float(rng.uniform(-20, 70)), unit=u.deg),
+              "Magnitude": round(float(rng.uniform(12, 21)), 1), "StartObservability": timeToString(windowStart),
+              "EndObservability": timeToString(windowEnd)}
+    if candidateType == "MPC NEO":
+        fields.update({"ExposureTime": float(rng.choice([30, 60, 90, 120])), "NumExposures": int(rng.integers(5, 30)),
+                       "Priority": int(rng.integers(1, 4)), "Updated": timeToString(startTime - timedelta(hours=2)),
+                       "dRA": float(rng.normal(0, 20)), "dDec": float(rng.normal(0, 20)),
+                       "TransitTime": timeToString(windowStart + (windowEnd - windowStart) / 2)})
+        name = f"BM{index:05d}"
+    elif candidateType == "TESS":
+        fields.update({"ExposureTime": 10.0, "NumExposures": int(windowMinutes * 6) - 1, "Priority": 1,
+                       "Filter": "CLEAR"})
+        name = f"TOI-{index}.01"
+    else:
+        fields.update({"ExposureTime": float(rng.choice([60, 120, 300])), "NumExposures": int(rng.integers(1, 15)),
+                       "Priority": int(rng.integers(1, 5)), "Filter": str(rng.choice(["CLEAR", "r", "g"]))})
+        name = f"Fixed {index}"
+    return BaseCandidate(name, candidateType, **fields)
+
+
+def make_synthetic_db(dbPath, numTargets, startTime=NIGHT_START, endTime=NIGHT_END, candidateTypes=BENCHMARK_TYPES,
+                      seed=0):
+    """!
+    Fill a new candidate database with numTargets synthetic candidates, split as evenly as possible between
+    candidateTypes. Inserts go through CandidateDatabase.insertCandidate, like the modules' own database updates do
+    @param dbPath: path of the database to create. must not already exist
+    @param seed: seeds the generator, so that a given (numTargets, candidateTypes, seed) always makes the same database
+    @return: dictionary of {candidate type : number of candidates inserted}
+    """
+    if exists(dbPath):
+        raise FileExistsError(f"Won't fill existing database {dbPath} with synthetic candidates")
+    rng = np.random.default_rng(seed)
+    db = CandidateDatabase(dbPath, "Scheduler Benchmark")
+    counts = {t: 0 for t in candidateTypes}
+    for i in range(numTargets):
+        candidateType = candidateTypes[i % len(candidateTypes)]
+        db.insertCandidate(synthetic_candidate(candidateType, i, startTime, endTime, rng))
+        counts[candidateType] += 1
+    del db  # close the connection so that the scheduler's selectors can open it
+    return counts
+
+
+def benchmark_case(observer, dbPath, configDict, startTime=NIGHT_START, endTime=NIGHT_END, seed=0, traceMemory=False):
+    """!
+    Make one schedule from the database at dbPath and time it
+    @param configDict: scheduling configs to select candidates with, as from loadSchedulingConfigs
+    @param traceMemory: whether to also record per-stage peak memory. slows the run down, so the timings are less useful
+    @return: StageTimer report of the run, with the number of scheduled blocks in its meta
+    """
+    with StageTimer(trace_memory=traceMemory) as timer:
+        try:
+            scheduleDf, _, _, candidateDict, _ = createSchedule(observer, startTime, endTime, [], [], [], dbPath,
+                                                                temperature=0, seed=seed, configDict=configDict)
+        except SystemExit:
+            # createSchedule exits when none of the candidates are selected
+            raise RuntimeError(f"No candidates were selected from {dbPath}. Are the benchmark modules active?")
+    timer.meta = {"candidates": len(candidateDict), "scheduledRows": len(scheduleDf.index)}
+    return timer.report()
+
+
+def summarize(reports):
+    """!
+    Collapse repeated runs of the same case into the median wall and cpu time of each stage
+    @param reports: list of StageTimer reports from the same case
+    @return: {"total_s": float, "stages": {stage name : {"wall_s", "cpu_s", "calls"}}, "meta": meta of the first run}
+    """
+    stages = {}
+    for name in reports[0]["stages"]:
+        runs = [r["stages"][name] for r in reports if name in r["stages"]]
+        stages[name] = {"wall_s": statistics.median([s["wall_s"] for s in runs]),
+                        "cpu_s": statistics.median([s["cpu_s"] for s in runs]),
+                        "calls": runs[0]["calls"]}
+        peaks = [s["peak_mb"] for s in runs if s["peak_mb"] is not None]
+        if peaks:
+            stages[name]["peak_mb"] = max(peaks)
+    total = stages.get("createSchedule", {}).get("wall_s")
+    return {"total_s": total, "stages": stages, "meta": reports[0]["meta"]}
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, candidateTypes=BENCHMARK_TYPES, repeats=3, seed=0, traceMemory=False):
+    """!
+    Benchmark createSchedule on synthetic databases of each size
+    @param sizes: numbers of candidates to benchmark with
+    @param candidateTypes: types of candidate to fill the databases with. their modules must be loadable and active
+    @param repeats: number of times to time each size. the median is reported
+    @return: dictionary of results, in the format of the baseline file
+    """
+    configDict = loadSchedulingConfigs()
+    missing = [t for t in candidateTypes if t not in configDict]
+    if missing:
+        logger.warning(f"Modules {missing} couldn't be loaded, so they won't be benchmarked")
+        candidateTypes = [t for t in candidateTypes if t in configDict]
+    if not candidateTypes:
+        raise RuntimeError("None of the benchmark modules could be loaded")
+    # only select from the benchmarked modules, so that other active modules don't change the load
+    configDict = {t: configDict[t] for t in candidateTypes}
+    observer = makeObserver()
+
+    results = {"created": datetime.now(pytz.UTC).isoformat(), "machine": platform.node(),
+               "python": platform.python_version(), "types": list(candidateTypes), "seed": seed, "sizes": {}}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for size in sizes:
+            dbPath = join(tmpdir, f"candidates_{size}.db")
+            counts = make_synthetic_db(dbPath, size, candidateTypes=candidateTypes, seed=seed)
+            logger.info(f"Benchmarking {size} candidates ({counts})")
+            reports = [benchmark_case(observer, dbPath, configDict, seed=seed, traceMemory=traceMemory)
+                       for _ in range(repeats)]
+            results["sizes"][str(size)] = summarize(reports)
+            results["sizes"][str(size)]["counts"] = counts
+            logger.info(f"{size} candidates: {round(results['sizes'][str(size)]['total_s'], 2)} s")
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, minSeconds=0.05):
+    """!
+    Find the stages that got slower than the baseline
+    @param tolerance: fractional slowdown allowed before a stage counts as a regression
+    @param minSeconds: slowdowns smaller than this many seconds are ignored as noise, whatever the fraction
+    @return: list of (size, stage name, baseline seconds, new seconds) for each regression
+    """
+    regressions = []
+    for size, result in results["sizes"].items():
+        base = baseline["sizes"].get(size)
+        if base is None:
+            continue
+        for name, s in result["stages"].items():
+            old = base["stages"].get(name)
+            if old is None:
+                continue
+            if s["wall_s"] > old["wall_s"] * (1 + tolerance) and s["wall_s"] - old["wall_s"] > minSeconds:
+                regressions.append((size, name, old["wall_s"], s["wall_s"]))
+    return regressions
+
+
+def types_missing_from_baseline(candidateTypes, baseline):
+    """!
+    @return: the candidate types in candidateTypes that the baseline has no timings for
+    """
+    return [t for t in candidateTypes if t not in baseline.get("types", [])]
+
+
+def comparison_table(results, baseline=None):
+    """!
+    @return: printable table of the end-to-end and per-stage times of each size, with the baseline's alongside
+    """
+    lines = []
+    for size, result in results["sizes"].items():
+        base = (baseline or {}).get("sizes", {}).get(size, {"stages": {}})
+        lines.append(f"{size} candidates ({result['meta']['candidates']} selected, {result['meta']['scheduledRows']} schedule rows):")
+        for name, s in result["stages"].items():
+            line = f"    {name:<60} {s['wall_s']:>9.3f} s"
+            old = base["stages"].get(name)
+            if old is not None and old["wall_s"] > 0:
+                line += f"  (baseline {old['wall_s']:.3f} s, {s['wall_s'] / old['wall_s']:.2f}x)"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time createSchedule on synthetic candidate databases and compare against a stored baseline")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="numbers of candidates to benchmark with")
+    parser.add_argument("--types", nargs="+", default=list(BENCHMARK_TYPES), help="candidate types to generate")
+    parser.add_argument("--repeats", type=int, default=3, help="runs per size. the median is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also record per-stage peak memory (slower)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="store these results as the new baseline. do this on each machine the benchmark is compared on")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="fractional slowdown to allow before failing")
+    parser.add_argument("--out", default=None, help="optional. also write the results to this json file")
+    args = parser.parse_args()
+
+    baseline = None
+    candidateTypes = args.types
+    if exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if not args.save_baseline:
+            # the candidates of each size are split between the types, so a run with other types isn't comparable at all
+            skipped = types_missing_from_baseline(candidateTypes, baseline)
+            if skipped:
+                print(f"Not benchmarking {skipped}: the baseline at {args.baseline} has no timings for them (it has "
+                      f"{baseline.get('types')}). Record a baseline on this machine with --save-baseline to include them.")
+                candidateTypes = [t for t in candidateTypes if t not in skipped]
+            if not candidateTypes:
+                print("None of the requested candidate types are in the baseline, so there is nothing to compare.")
+                return 1
+
+    results = run_benchmark(args.sizes, candidateTypes, repeats=args.repeats, seed=args.seed, traceMemory=args.memory)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline is not None and baseline.get("machine") != results["machine"]:
+        logger.warning(f"Baseline was recorded on {baseline.get('machine')}, not this machine - timings aren't comparable. "
+                       f"Record a baseline on this machine with --save-baseline first")
+    print(comparison_table(results, baseline))
+
+    if args.save_baseline:
+        os.makedirs(dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+    if baseline is None:
+        print(f"No baseline at {args.baseline}. Run with --save-baseline to store one.")
+        return 0
+    if sorted(results["types"]) != sorted(baseline.get("types", [])):
+        # a baseline type whose module couldn't be loaded here
+        print(f"Not comparing: the baseline has {baseline.get('types')}, but only {results['types']} could be "
+              f"benchmarked. Record a baseline on this machine with --save-baseline.")
+        return 1
+    regressions = compare_to_baseline(results, baseline, tolerance=args.tolerance)
+    for size, name, old, new in regressions:
+        print(f"REGRESSION: {size} candidates, {name}: {old:.3f} s -> {new:.3f} s")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# Sage Santomenna 2025
+# thin client for scheduler_server.py. takes the same arguments as scheduler.py and reports the same status lines, but
+# asks the running server to make the schedule instead of starting the scheduler from scratch
+
+import sys
+from os.path import join, dirname, abspath
+
+import requests
+
+SETTINGS_PATH = join(abspath(dirname(__file__)), "files", "configs", "in_maestro_settings.toml")
+
+
+def server_url(port):
+    return f"http://127.0.0.1:{port}"
+
+
+def server_available(port, timeout=0.5):
+    """!
+    Whether a scheduler server is listening on the given port and free to take a request
+    """
+    try:
+        resp = requests.get(f"{server_url(port)}/status", timeout=timeout)
+        return resp.ok and not resp.json()["result"]["busy"]
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return False
+
+
+def request_schedule(port, blacklist="", whitelist="", excludedTimeRanges="", tonight=False, replan=False, timeout=None):
+    """!
+    Ask the scheduler server to make a schedule
+    @return: the result dictionary returned by the server
+    @raise RuntimeError: if the server reports an error
+    """
+    resp = requests.post(f"{server_url(port)}/schedule",
+                         json={"blacklist": blacklist, "whitelist": whitelist,
+                               "excludedTimeRanges": excludedTimeRanges, "tonight": tonight, "replan": replan},
+                         timeout=timeout)
+    body = resp.json()
+    if body["error"]:
+        raise RuntimeError(body["error"])
+    return body["result"]
+
+
+def main():
+    from alora.config.utils import Config
+    port = Config(SETTINGS_PATH).get("schedulerServerPort", 5012)
+    if len(sys.argv) == 1:
+        result = request_schedule(port, tonight=True)
+    else:
+        result = request_schedule(port, sys.argv[1], sys.argv[2], sys.argv[3],
+                                  replan=len(sys.argv) > 4 and sys.argv[4] == "replan")
+    # the same lines scheduler.py prints, so that the GUI can treat this process like the scheduler itself
+    print("Status:Schedule visualized.", flush=True)
+    print(f"Wrote schedule to {result['schedule']}", flush=True)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        sys.stderr.write(f"Scheduler server request failed: {repr(e)}\n")
+        sys.exit(1)
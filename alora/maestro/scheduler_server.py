@@ -0,0 +1,199 @@
+# Sage Santomenna 2025
+# long-running scheduler service. keeps the scheduling modules, observer and sunrise/sunset times loaded between runs
+# so that a new schedule (e.g. a re-plan after a weather hold) doesn't pay for interpreter and module startup each time
+
+import os, sys, time, threading
+from glob import glob
+from os.path import join, dirname, abspath
+from datetime import datetime, timedelta
+
+import pytz
+from flask import Flask, request, jsonify
+
+MODULE_PATH = abspath(dirname(__file__))
+def PATH_TO(fname:str): return join(MODULE_PATH,fname)
+
+sys.path.append(MODULE_PATH)
+
+from alora.config.utils import Config
+from alora.maestro.scheduleLib import genUtils
+from alora.maestro.scheduleLib.genUtils import roundToTenMinutes, configure_logger
+from alora.maestro.scheduleLib.module_loader import ModuleManager
+from alora.maestro.scheduleLib.scoring import ScoreCache
+from alora.maestro.scheduler import makeObserver, loadSchedulingConfigs, runScheduler, toList, retrieveExcludeList
+
+logger = configure_logger("Scheduler Server")
+
+SETTINGS_PATH = PATH_TO(join("files", "configs", "in_maestro_settings.toml"))
+MODULES_DB_PATH = PATH_TO(join("files", "modules.db"))
+MODULES_PACKAGE = "alora.maestro.schedulerConfigs"
+
+
+def moduleConfigFingerprint():
+    """!
+    The modification times of the files that decide which scheduling modules are active and how they're configured: the
+    module registry and the toml and json files in each module's directory
+    @return: {path: mtime in ns}
+    """
+    paths = [MODULES_DB_PATH]
+    for info in ModuleManager().list_modules().values():
+        paths.extend(glob(join(info["dir"], "*.toml")) + glob(join(info["dir"], "*.json")))
+    fingerprint = {}
+    for path in paths:
+        try:
+            fingerprint[path] = os.stat(path).st_mtime_ns
+        except OSError:
+            pass  # deleted since it was listed
+    return fingerprint
+
+
+class SchedulerService:
+    def __init__(self):
+        """!
+        Holds everything that is expensive to set up and doesn't change between scheduling runs. Only one run happens at a
+        time; requests that arrive while a run is in progress are turned away rather than queued
+        """
+        self.observer = makeObserver()
+        self.configDict = None
+        self.configFingerprint = None
+        self.scoreCache = ScoreCache()  # kept in memory between runs so that re-plans only score new or changed candidates
+        self.sunTimes = {}  # date of the night : (sunriseUTC, sunsetUTC)
+        self.lock = threading.Lock()
+        self.runs = 0
+        self.lastRun = None
+        self.reload()
+
+    def reload(self):
+        """!
+        (Re)load the active scheduling modules, e.g. after a module is enabled or its config is changed. The modules read
+        their config files when they're imported, so they're imported again from scratch
+        """
+        start = time.time()
+        fingerprint = moduleConfigFingerprint()
+        for name in [n for n in sys.modules if n.startswith(MODULES_PACKAGE + ".")]:
+            del sys.modules[name]
+        self.configDict = loadSchedulingConfigs()
+        self.configFingerprint = fingerprint
+        self.scoreCache.clear()  # module configs may have changed how targets are scored
+        logger.info(f"Loaded scheduling modules {list(self.configDict.keys())} in {round(time.time() - start, 2)} s")
+
+    def reloadIfChanged(self):
+        """!
+        Reload the scheduling modules if a module has been enabled or disabled or a module's config file has changed
+        since they were loaded, so that edits made in Maestro apply to the next run without restarting the server
+        @return: whether the modules were reloaded
+        """
+        if moduleConfigFingerprint() == self.configFingerprint:
+            return False
+        logger.info("Scheduling module configuration changed on disk - reloading modules")
+        self.reload()
+        return True
+
+    def sunriseSunset(self):
+        """!
+        Tonight's sunrise and sunset, rounded like scheduler.main rounds them. Cached per night
+        """
+        now = datetime.now(pytz.utc)
+        night = (now - timedelta(hours=12)).date()
+        if night not in self.sunTimes:
+            sunriseUTC, sunsetUTC = genUtils.get_sunrise_sunset()
+            self.sunTimes[night] = roundToTenMinutes(sunriseUTC), roundToTenMinutes(sunsetUTC)
+        return self.sunTimes[night]
+
+    @property
+    def busy(self):
+        return self.lock.locked()
+
+    def schedule(self, blacklist="", whitelist="", excludedTimeRanges="", tonight=False, replan=False):
+        """!
+        Make a schedule with the current maestro settings, the same way `scheduler.py blacklist whitelist excluded` does
+        @param blacklist: comma-separated designations, as passed to scheduler.py
+        @param whitelist: comma-separated designations, as passed to scheduler.py
+        @param excludedTimeRanges: comma-separated start/end pairs in seconds since epoch, as passed to scheduler.py
+        @param tonight: if True, schedule from now (or sunset) until an hour before sunrise, like running scheduler.py with no arguments. otherwise, use the schedule start and end times from the settings
+        @param replan: if True, keep the tasks of the last schedule that have already started and re-plan the rest of the night
+        @return: dictionary describing the run
+        """
+        # settings are read fresh each time: the GUI may have changed them since the last run. so may the module configs
+        settings = Config(SETTINGS_PATH)
+        self.reloadIfChanged()
+        if tonight:
+            sunriseUTC, sunsetUTC = self.sunriseSunset()
+            sunriseUTC -= timedelta(hours=1)
+            sunsetUTC = max(sunsetUTC, datetime.now(pytz.utc))
+        else:
+            localtz = datetime.now().astimezone().tzinfo
+            sunsetUTC = datetime.fromtimestamp(settings["scheduleStartTimeSecs"], tz=localtz).astimezone(pytz.utc)
+            sunriseUTC = datetime.fromtimestamp(settings["scheduleEndTimeSecs"], tz=localtz).astimezone(pytz.utc)
+        logger.info(f"Making schedule from {sunsetUTC} to {sunriseUTC}")
+        start = time.time()
+        schedulePath = runScheduler(self.observer, sunsetUTC, sunriseUTC, settings["scheduleSaveDir"],
+                                    toList(blacklist), toList(whitelist), retrieveExcludeList(excludedTimeRanges),
+                                    settings["candidateDbPath"], numRuns=settings["schedulerRuns"],
+                                    temperature=settings["temperature"] / 10,
+                                    saveEphems=settings["schedulerSaveEphems"], overwrite=True, settings=settings,
+                                    configDict=self.configDict,
+                                    replanTime=datetime.now(pytz.utc) if replan else None,
+                                    scoreCache=self.scoreCache if replan and settings.get("schedulerScoreCache", True) else None)
+        self.runs += 1
+        self.lastRun = {"schedule": schedulePath, "runtime": time.time() - start,
+                        "finished": datetime.now(pytz.utc).isoformat()}
+        return self.lastRun
+
+
+app = Flask(__name__)
+service = None
+
+
+@app.route("/status", methods=["GET"])
+def status():
+    return jsonify({"result": {"busy": service.busy, "runs": service.runs, "lastRun": service.lastRun,
+                               "modules": list(service.configDict.keys())}, "error": ""})
+
+
+@app.route("/schedule", methods=["POST"])
+def schedule():
+    # request body: {"blacklist": str, "whitelist": str, "excludedTimeRanges": str, "tonight": bool, "replan": bool}. the first three are in the same format as the arguments to scheduler.py
+    try:
+        data = request.get_json() or {}
+    except Exception as e:
+        logger.error(f"Invalid JSON received: {repr(e)}")
+        return jsonify({"result": "", "error": "Invalid JSON received."}), 400
+    if not service.lock.acquire(blocking=False):
+        return jsonify({"result": "", "error": "The scheduler is already making a schedule."}), 409
+    try:
+        logger.info(f"Received schedule request: {data}")
+        result = service.schedule(data.get("blacklist", ""), data.get("whitelist", ""),
+                                  data.get("excludedTimeRanges", ""), tonight=data.get("tonight", False),
+                                  replan=data.get("replan", False))
+        logger.info(f"Schedule written to {result['schedule']} in {round(result['runtime'], 1)} s")
+        return jsonify({"result": result, "error": ""})
+    except SystemExit:
+        # createSchedule exits when there's nothing to schedule - don't let it take the server down with it
+        return jsonify({"result": "", "error": "No candidates provided - nothing to schedule."}), 500
+    except Exception as e:
+        logger.exception(f"Error raised while scheduling: {repr(e)}")
+        return jsonify({"result": "", "error": repr(e)}), 500
+    finally:
+        service.lock.release()
+
+
+@app.route("/reload", methods=["POST"])
+def reload():
+    if not service.lock.acquire(blocking=False):
+        return jsonify({"result": "", "error": "The scheduler is busy."}), 409
+    try:
+        service.reload()
+        return jsonify({"result": list(service.configDict.keys()), "error": ""})
+    except Exception as e:
+        logger.exception(f"Error raised while reloading modules: {repr(e)}")
+        return jsonify({"result": "", "error": repr(e)}), 500
+    finally:
+        service.lock.release()
+
+
+if __name__ == "__main__":
+    service = SchedulerService()
+    port = Config(SETTINGS_PATH).get("schedulerServerPort", 5012)
+    logger.info(f"Starting scheduler server on port {port}")
+    app.run(host="127.0.0.1", port=port, threaded=True)
@@ -0,0 +1,30 @@
+import importlib.util
+import sys
+import types
+
+
+def _stub_module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+
+class _Unavailable(Exception):
+    """Stands in for the classes of a package that isn't installed. Can be made, but does nothing"""
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args)
+
+
+# the MPC NEO module imports photometrics (which isn't public) and httpx when it's loaded. the tests only use its
+# offline parts (MpcEphem, EphemLine), so stand in for them when they aren't installed instead of skipping those tests
+if importlib.util.find_spec("photometrics") is None:
+    _stub_module("photometrics", __path__=[])
+    sys.modules["photometrics"].mpc_neo_confirm = _stub_module(
+        "photometrics.mpc_neo_confirm", MPCNeoConfirm=type("MPCNeoConfirm", (_Unavailable,), {}),
+        MPC_GET_URL="", MPC_POST_URL="", MPC_HOSTNAME="")
+
+if importlib.util.find_spec("httpx") is None:
+    _stub_module("httpx", **{name: type(name, (_Unavailable,), {}) for name in
+                             ["AsyncClient", "Client", "ConnectError", "HTTPError", "ReadTimeout", "RemoteProtocolError",
+                              "TimeoutException"]})
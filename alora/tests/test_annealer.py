@@ -0,0 +1,126 @@
+import re
+import unittest
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from astroplan import FixedTarget, ObservingBlock, TransitionBlock
+
+from alora.maestro.schedule import ModularSchedule, AddObservation
+from alora.maestro.annealer import ScheduleAnnealer, _Rejected
+from alora.maestro.scheduleLib.scoring import ScoreRow
+
+
+class _Config:
+    def __init__(self, maxMinutesWithoutFocus=10000, minMinutesBetweenObs=30):
+        self.maxMinutesWithoutFocus = maxMinutesWithoutFocus
+        self.minMinutesBetweenObs = minMinutesBetweenObs
+
+
+def slew(oldblock, newblock, start_time, observer):
+    # slew time depends on both targets, so a transition left over from a block's old neighbor has the wrong length
+    if not isinstance(oldblock, ObservingBlock) or not isinstance(newblock, ObservingBlock):
+        return None
+    minutes = 1 + int(abs(oldblock.target.ra.deg - newblock.target.ra.deg) // 60)
+    return TransitionBlock({"slew_time": minutes * u.minute}, start_time)
+
+
+class TestScheduleAnnealer(unittest.TestCase):
+
+    def make_annealer(self, seed):
+        start = Time("2025-03-05T03:00:00")
+        schedule = ModularSchedule(start, start + 6 * u.hour, 1 * u.minute)
+        rng = np.random.default_rng(3)
+        blocks, scoreRows = {1: [], 2: []}, {}
+        for i in range(24):
+            name = f"T{i // 2}_{i % 2 + 1}"  # pairs of repeat observations of the same target
+            target = FixedTarget(SkyCoord(ra=rng.uniform(0, 360) * u.deg, dec=20 * u.deg), name=name)
+            block = ObservingBlock(target, int(rng.integers(5, 20)) * u.minute, 1 + i % 2,
+                                   configuration={"type": "A" if i % 3 else "B"})
+            row = np.zeros(schedule.num_chunks)
+            lo = int(rng.integers(0, schedule.num_chunks - 120))
+            row[lo:lo + int(rng.integers(60, 200))] = rng.uniform(0.1, 1)
+            scoreRows[id(block)] = ScoreRow.from_dense(row)
+            blocks[1 + i % 2].append(block)
+        first = blocks[1][0]
+        AddObservation(first, schedule.time_of(scoreRows[id(first)].start), None, slew).add_to_schedule(schedule)
+        configDict = {"A": _Config(), "B": _Config()}
+        # keep the excluded range clear of the observation the schedule starts with
+        excludedStart = 4 * 3600 if first.start_time < start + 3 * u.hour else 3600
+        excluded = [(start.unix + excludedStart, start.unix + excludedStart + 600)]
+        return ScheduleAnnealer(schedule, blocks, scoreRows, configDict, slew, None, excluded, seed=seed)
+
+    def check_invariants(self, annealer):
+        schedule = annealer.schedule
+        scheduled = {id(b): b for b in schedule.blocks.values() if id(b) in annealer.scoreRows}
+        self.assertEqual(set(scheduled), set(annealer.placed))
+        for key, (block, t) in annealer.placed.items():
+            self.assertEqual(block.start_time, t)
+            idx = schedule.index_of(t)
+            n = int(block.duration.to(u.minute).value)
+            self.assertTrue(np.all(schedule.chunk_mask[idx:idx + n] == schedule.chunk_mask[idx]))
+            self.assertFalse(annealer.scoreRows[key].has_zero(idx, idx + n))
+            self.assertFalse(annealer.excluded[idx:idx + n].any())
+        # repeat observations of a target stay apart
+        byName = {}
+        for block, t in annealer.placed.values():
+            byName.setdefault(re.sub('_\\d', '', block.target.name), []).append(t)
+        for times in byName.values():
+            for a in times:
+                for b in times:
+                    if a is not b:
+                        self.assertGreaterEqual(abs((a - b).to(u.minute).value), 30 - 1e-6)
+        # every pair of neighboring observations is joined by the transition the transitioner gives for that pair
+        ordered = sorted(schedule.blocks.values(), key=lambda b: b.start_time)
+        observations = [b for b in ordered if isinstance(b, ObservingBlock)]
+        for previous, following in zip(observations, observations[1:]):
+            between = [b for b in ordered if previous.start_time < b.start_time < following.start_time]
+            self.assertEqual(len(between), 1)
+            self.assertIsInstance(between[0], TransitionBlock)
+            self.assertEqual(between[0].duration, slew(previous, following, None, None).duration)
+        # the energy kept up incrementally matches the energy of the final schedule
+        self.assertAlmostEqual(annealer.energy, -sum(annealer.reward(b, t) for b, t in annealer.placed.values()))
+        self.assertEqual(len(annealer._placedSet) + len(annealer._unplacedSet), len(annealer.candidates))
+
+    def test_invariants(self):
+        annealer = self.make_annealer(seed=0)
+        self.check_invariants(annealer)
+        annealer.run(max_iterations=3000)
+        self.assertGreater(annealer.stats["accepted"], 0)
+        self.assertLessEqual(annealer.energy, annealer.stats["initial_energy"])
+        self.assertGreater(len(annealer.placed), 1)
+        self.check_invariants(annealer)
+
+    def test_reproducible(self):
+        results = []
+        for _ in range(2):
+            annealer = self.make_annealer(seed=7)
+            annealer.run(max_iterations=1000)
+            results.append(sorted((b.target.name, t.isot) for b, t in annealer.placed.values()))
+        self.assertEqual(results[0], results[1])
+
+    def test_partial_slots(self):
+        # a block that ends partway through a slot needs that slot, like it does in TMOScheduler
+        start = Time("2025-03-05T03:00:00")
+        schedule = ModularSchedule(start, start + 1 * u.hour, 1 * u.minute)
+        block = ObservingBlock(FixedTarget(SkyCoord(ra=10 * u.deg, dec=20 * u.deg), name="T"), 320 * u.second, 1,
+                               configuration={"type": "A"})
+        row = np.zeros(schedule.num_chunks)
+        row[10:15] = 1
+        annealer = ScheduleAnnealer(schedule, {1: [block]}, {id(block): ScoreRow.from_dense(row)}, {"A": _Config()}, slew,
+                                    None, [(start.unix + 20 * 60, start.unix + 25 * 60 + 30)], seed=0)
+        with self.assertRaises(_Rejected):  # the last 20 seconds fall in slot 15, where the score is zero
+            annealer._check(block, schedule.time_of(10), {})
+        row[15:40] = 1
+        annealer.scoreRows[id(block)] = ScoreRow.from_dense(row)
+        annealer._check(block, schedule.time_of(10), {})
+        annealer._check(block, schedule.time_of(14), {})
+        for idx in [20, 25]:  # slot 25 is partly excluded
+            with self.assertRaises(_Rejected):
+                annealer._check(block, schedule.time_of(idx), {})
+        annealer._check(block, schedule.time_of(26), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from alora.maestro.scheduleLib.genUtils import timeToString, stringToTime
+from alora.maestro.scheduleLib.candidateDatabase import ArchivePolicy, BaseCandidate, CandidateDatabase, CandidateSnapshot, \
+    open_candidate_database
+from alora.maestro.scheduler import gatherCandidates
+
+NIGHT_START = datetime(2025, 1, 15, 2, 0)
+NIGHT_END = datetime(2025, 1, 15, 13, 0)
+
+
+def make_candidate(name, candidateType, windowStart, windowEnd, **kwargs):
+    return BaseCandidate(name, candidateType, RA=10.0, Dec=20.0, StartObservability=timeToString(windowStart),
+                         EndObservability=timeToString(windowEnd), Priority=1, **kwargs)
+
+
+class CandidateDatabaseTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.dbPath = os.path.join(self.dir.name, "candidates.db")
+        self.db = CandidateDatabase(self.dbPath, "Tests")
+
+    def tearDown(self):
+        del self.db
+        self.dir.cleanup()
+
+
+class _Selector:
+    def __init__(self, candidateType, opensSnapshot):
+        self.candidateType = candidateType
+        self.acceptsCandidateSnapshot = opensSnapshot
+        self.given = None
+
+    def selectCandidates(self, startTimeUTC, endTimeUTC, dbPath):
+        self.given = dbPath
+        if self.acceptsCandidateSnapshot:
+            db = open_candidate_database(dbPath, "Tests")
+        else:
+            db = CandidateDatabase(dbPath, "Tests")  # a module written before snapshots existed
+        return db.candidatesForTimeRange(startTimeUTC, endTimeUTC, 0.1, self.candidateType)
+
+
+class TestGatherCandidates(CandidateDatabaseTestCase):
+
+    def test_snapshot_is_opt_in(self):
+        for i, t in enumerate(["TESS", "UserFixed", "TESS", "UserFixed"]):
+            self.db.insertCandidate(make_candidate(f"{t} {i}", t, NIGHT_START + timedelta(hours=1), NIGHT_END))
+        old, new = _Selector("TESS", False), _Selector("UserFixed", True)
+        candidates = gatherCandidates({"TESS": old, "UserFixed": new}, NIGHT_START, NIGHT_END, self.dbPath, [])
+        self.assertEqual(old.given, self.dbPath)
+        self.assertIsInstance(new.given, CandidateSnapshot)
+        self.assertEqual([c.CandidateName for c in candidates], ["TESS 0", "TESS 2", "UserFixed 1", "UserFixed 3"])
+
+    def test_no_snapshot_without_opt_in(self):
+        self.db.insertCandidate(make_candidate("TESS 0", "TESS", NIGHT_START + timedelta(hours=1), NIGHT_END))
+        old = _Selector("TESS", False)
+        self.assertEqual(len(gatherCandidates({"TESS": old}, NIGHT_START, NIGHT_END, self.dbPath, [])), 1)
+        self.assertEqual(old.given, self.dbPath)
+
+
+class TestCandidateSnapshot(CandidateDatabaseTestCase):
+
+    def test_only_live_rows_are_copied(self):
+        archived = self.db.insertCandidate(make_candidate("Archived", "TESS", NIGHT_START, NIGHT_END))
+        self.db.removeCandidateByID(archived, "Gone")
+        self.db.archiveStale(ArchivePolicy(removedAfterDays=0, rejectedAfterDays=None, expiredAfterDays=None),
+                             now=datetime.utcnow() + timedelta(days=1))
+        removed = self.db.insertCandidate(make_candidate("Removed", "TESS", NIGHT_START, NIGHT_END))
+        self.db.removeCandidateByID(removed, "Gone")
+        ended = self.db.insertCandidate(make_candidate("Ended", "TESS", NIGHT_START - timedelta(hours=5),
+                                                       NIGHT_START - timedelta(hours=1)))
+        live = [self.db.insertCandidate(make_candidate(f"T{i}", "TESS", NIGHT_START, NIGHT_END)) for i in range(3)]
+
+        snapshot = CandidateSnapshot(self.dbPath, "Tests", NIGHT_START)
+        snapshot.db_cursor.execute("SELECT ID FROM Candidates")
+        self.assertEqual(sorted(row["ID"] for row in snapshot.db_cursor.fetchall()), sorted(live))
+        snapshot.db_cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        self.assertNotIn("CandidatesArchive", {row["name"] for row in snapshot.db_cursor.fetchall()})
+        self.assertEqual(snapshot.changeSequence, self.db.changeSequence)
+        self.assertEqual(len(snapshot.candidatesForTimeRange(NIGHT_START, NIGHT_END, 0.1, "TESS")), 3)
+
+        # the snapshot doesn't see later writes, and can't be written to
+        self.db.removeCandidateByID(live[0], "Gone")
+        self.assertEqual(len(snapshot.candidatesForTimeRange(NIGHT_START, NIGHT_END, 0.1, "TESS")), 3)
+        with self.assertRaises(sqlite3.OperationalError):
+            snapshot.db_cursor.execute("DELETE FROM Candidates")
+
+        # without obsStart, only the archive is left out
+        everything = CandidateSnapshot(self.dbPath, "Tests")
+        everything.db_cursor.execute("SELECT ID FROM Candidates")
+        self.assertEqual(sorted(row["ID"] for row in everything.db_cursor.fetchall()), sorted(live + [removed, ended]))
+
+def reference_time_range(db, start, end, duration, candidateType=None):
+    # what candidatesForTimeRange did before the observability test moved into the query: filter in python, then keep
+    # the most recently updated row of each name
+    condition = "RemovedReason IS NULL AND ((RejectedReason IS NULL) or (flags & 1)) AND NOT (flags & 2)"
+    if candidateType is not None:
+        condition += f" AND CandidateType = '{candidateType}'"
+    newest = {}
+    for c in db.table_query("Candidates", "*", condition, [], returnAsCandidates=True) or []:
+        if not c.isObservableBetween(start, end, duration):
+            continue
+        if c.CandidateName not in newest or stringToTime(newest[c.CandidateName].Updated) < stringToTime(c.Updated):
+            newest[c.CandidateName] = c
+    return sorted(c.ID for c in newest.values())
+
+
+class TestCandidatesForTimeRange(CandidateDatabaseTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(0)
+        other = CandidateDatabase(self.dbPath, "Other Tests")
+        edges = [NIGHT_START, NIGHT_END, NIGHT_START + timedelta(hours=1), NIGHT_END - timedelta(hours=1)]
+        for i in range(300):
+            # windows that start or end right on the edges of the night, or a second or half a second off them, with
+            # the rest spread out around the night
+            if i % 3 == 0:
+                windowStart = edges[rng.integers(len(edges))] + timedelta(seconds=float(rng.choice([-1, -0.5, 0, 0.5, 1])))
+            else:
+                windowStart = NIGHT_START + timedelta(minutes=float(rng.uniform(-180, 720)))
+            if i % 4 == 0:
+                windowEnd = edges[rng.integers(len(edges))] + timedelta(seconds=float(rng.choice([-1, -0.5, 0, 0.5, 1])))
+            else:
+                windowEnd = windowStart + timedelta(minutes=float(rng.choice([5, 6, 30, 60, 600])))
+            fields = {"StartObservability": windowStart.strftime("%Y-%m-%d %H:%M:%S.%f") if windowStart.microsecond else timeToString(windowStart),
+                      "EndObservability": windowEnd.strftime("%Y-%m-%d %H:%M:%S.%f") if windowEnd.microsecond else timeToString(windowEnd),
+                      "Updated": timeToString(NIGHT_START - timedelta(minutes=i)), "Priority": 1, "RA": 10.0, "Dec": 20.0}
+            if i % 17 == 0:
+                fields["RemovedReason"] = "Removed"
+            if i % 13 == 0:
+                fields["RejectedReason"] = "Rejected"
+                fields["flags"] = int(rng.integers(0, 2))  # flag 1 keeps a rejected candidate
+            if i % 19 == 0:
+                fields["flags"] = 2
+            # names repeat, so that some names have more than one row. IDs are made from the name, type and author, so
+            # the repeats come from another author
+            candidateType = ["TESS", "UserFixed"][i % 2]
+            (self.db if i < 200 else other).insertCandidate(BaseCandidate(f"T{i % 200}", candidateType, **fields))
+        # and windows exactly between two edges, which only the comparisons that include their endpoints catch
+        pairs = [(a, b) for a in edges for b in edges if a < b]
+        for j, (a, b) in enumerate(pairs):
+            self.db.insertCandidate(make_candidate(f"E{j}", "TESS", a, b, Updated=timeToString(NIGHT_START)))
+        del other
+
+    def test_matches_python_filter(self):
+        for start, end, duration in [(NIGHT_START, NIGHT_END, 0.1), (NIGHT_START, NIGHT_END, 1.0),
+                                     (NIGHT_START + timedelta(hours=1), NIGHT_END - timedelta(hours=1), 0.01),
+                                     (NIGHT_START + timedelta(seconds=0.5), NIGHT_START + timedelta(hours=2), 0.1)]:
+            for candidateType in [None, "TESS"]:
+                selected = self.db.candidatesForTimeRange(start, end, duration, candidateType)
+                expected = reference_time_range(self.db, start, end, duration, candidateType)
+                self.assertTrue(expected)
+                self.assertEqual(sorted(c.ID for c in selected), expected)
+
+
+class TestChangesSince(CandidateDatabaseTestCase):
+
+    def test_changes_since(self):
+        ids = [self.db.insertCandidate(make_candidate(f"T{i}", "TESS", NIGHT_START, NIGHT_END)) for i in range(4)]
+        changed, gone, seq = self.db.changesSince(0)
+        self.assertEqual([c.ID for c in changed], ids)
+        self.assertEqual(gone, [])
+        self.assertEqual(seq, self.db.changeSequence)
+
+        self.assertEqual(self.db.changesSince(seq), ([], [], seq))
+
+        self.db.editCandidateByID(ids[2], {"Magnitude": 18.5})
+        self.db.removeCandidateByID(ids[0], "Gone")
+        self.db.add_to_blacklist(ids[2])
+        changed, gone, newSeq = self.db.changesSince(seq)
+        # each candidate once, in the order it last changed
+        self.assertEqual([c.ID for c in changed], [ids[0], ids[2]])
+        self.assertEqual(changed[1].Magnitude, 18.5)
+        self.assertIn("Gone", changed[0].RemovedReason)
+        self.assertEqual(gone, [])
+        self.assertGreater(newSeq, seq)
+        self.assertEqual(self.db.changesSince(newSeq), ([], [], newSeq))
+
+    def test_archived_are_gone(self):
+        ids = [self.db.insertCandidate(make_candidate(f"T{i}", "TESS", NIGHT_START, NIGHT_END)) for i in range(3)]
+        self.db.removeCandidateByID(ids[1], "Gone")
+        _, _, seq = self.db.changesSince(0)
+        archived = self.db.archiveStale(ArchivePolicy(removedAfterDays=0, rejectedAfterDays=None, expiredAfterDays=None),
+                                        now=datetime.utcnow() + timedelta(days=1))
+        self.assertEqual(archived, [ids[1]])
+        changed, gone, newSeq = self.db.changesSince(seq)
+        self.assertEqual((changed, gone), ([], [ids[1]]))
+        self.assertGreater(newSeq, seq)
+        self.assertEqual(self.db.changesSince(newSeq), ([], [], newSeq))
+        # from the start, the archived candidate is only reported as gone
+        changed, gone, _ = self.db.changesSince(0)
+        self.assertEqual(sorted(c.ID for c in changed), sorted([ids[0], ids[2]]))
+        self.assertEqual(gone, [ids[1]])
+
+class TestQueryCache(CandidateDatabaseTestCase):
+
+    def select(self, db):
+        return sorted(c.CandidateName for c in db.candidatesForTimeRange(NIGHT_START, NIGHT_END, 0.1))
+
+    def test_cache_hits(self):
+        self.db.insertCandidate(make_candidate("T0", "TESS", NIGHT_START, NIGHT_END))
+        first = self.db.candidatesForTimeRange(NIGHT_START, NIGHT_END, 0.1)
+        hits = self.db.query_cache.hits
+        first[0].CandidateName = "changed by the caller"
+        self.assertEqual(self.select(self.db), ["T0"])
+        self.assertEqual(self.db.query_cache.hits, hits + 1)
+
+    def test_writes_invalidate(self):
+        other = CandidateDatabase(self.dbPath, "Other")  # shares the query cache
+        self.db.insertCandidate(make_candidate("T0", "TESS", NIGHT_START, NIGHT_END))
+        self.assertEqual(self.select(self.db), ["T0"])
+
+        other.insertCandidate(make_candidate("T1", "TESS", NIGHT_START, NIGHT_END))
+        self.assertEqual(self.select(self.db), ["T0", "T1"])
+
+        self.db.removeCandidateByName("T0", "Gone")
+        self.assertEqual(self.select(other), ["T1"])
+
+        # a write that doesn't go through a CandidateDatabase at all, like one from another process
+        conn = sqlite3.connect(self.dbPath)
+        conn.execute("UPDATE Candidates SET EndObservability = ? WHERE CandidateName = 'T1'",
+                     (timeToString(NIGHT_START + timedelta(minutes=1)),))
+        conn.commit()
+        conn.close()
+        self.assertEqual(self.select(self.db), [])
+        del other
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+import astropy.units as u
+
+try:
+    from alora.maestro.schedulerConfigs.MPC_NEO.mpcUtils import MpcEphem, EphemLine
+except ImportError:  # the MPC NEO module needs photometrics
+    MpcEphem = None
+
+
+def make_ephem(numLines=48, step=timedelta(minutes=15)):
+    start = datetime(2025, 1, 15, 2, 0, tzinfo=pytz.UTC)
+    lines = [EphemLine(start + i * step, 10 + i * 0.01, 20 - i * 0.01, 19.0, 1.5 * u.arcsec / u.min, -0.5 * u.arcsec / u.min)
+             for i in range(numLines)]
+    return MpcEphem("TEST01", lines)
+
+
+@unittest.skipIf(MpcEphem is None, "MPC NEO module can't be imported")
+class TestMpcEphemWrite(unittest.TestCase):
+
+    def test_write_leaves_ephem_alone(self):
+        # ephems from from_file are shared through its cache, so writing one out mustn't change it
+        ephem = make_ephem()
+        with tempfile.TemporaryDirectory() as d:
+            path = ephem.write(d, logging.getLogger(__name__), filename="TEST01.txt", scheduler_format=True, format_only=True)
+            self.assertTrue(os.path.isfile(path))
+            ephem.write(d, logging.getLogger(__name__), filename="TEST01_full.txt")
+        self.assertIsNone(ephem.format_path)
+
+
+def scan(ephem, t, tolerance=None):
+    # MpcEphem.get before it used a binary search: an exact match, or the closest time by a scan of every line
+    if t in ephem.ephem_dict:
+        return ephem.ephem_dict[t]
+    if ephem.start_time < t < ephem.end_time:
+        m = min(ephem.times, key=lambda x: abs(x - t))
+        if tolerance is None or abs(m - t) < tolerance:
+            return ephem.ephem_dict[m]
+    return None
+
+
+@unittest.skipIf(MpcEphem is None, "MPC NEO module can't be imported")
+class TestMpcEphemGet(unittest.TestCase):
+
+    def setUp(self):
+        self.ephem = make_ephem()
+        start, end = self.ephem.start_time, self.ephem.end_time
+        rng = np.random.default_rng(0)
+        self.times = [start + timedelta(seconds=float(s)) for s in rng.uniform(-3600, (end - start).total_seconds() + 3600, 300)]
+        # exact line times, the edges, and times exactly halfway between two lines, where the earlier line wins
+        self.times += self.ephem.times[::5] + [start, end, start - timedelta(microseconds=1), end + timedelta(microseconds=1)]
+        self.times += [t + timedelta(minutes=7.5) for t in self.ephem.times[:-1:7]]
+
+    def test_get(self):
+        for tolerance in [None, timedelta(minutes=5), timedelta(minutes=7.5)]:
+            for t in self.times:
+                self.assertIs(self.ephem.get(t, tolerance), scan(self.ephem, t, tolerance), (t, tolerance))
+
+    def test_get_many(self):
+        for tolerance in [None, timedelta(minutes=5)]:
+            many = self.ephem.get_many(self.times, tolerance)
+            self.assertEqual(len(many), len(self.times))
+            for t, line in zip(self.times, many):
+                self.assertIs(line, scan(self.ephem, t, tolerance))
+        formatted = self.ephem.get_many(self.times, scheduler_format=True)
+        self.assertEqual(formatted, [self.ephem.get(t, scheduler_format=True) for t in self.times])
+        self.assertEqual(self.ephem.get_many([]), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+import astropy.units as u
+from astropy.coordinates import Angle
+
+from alora.astroutils.obs_constraints import ObsConstraint
+
+try:
+    from alora.maestro.schedulerConfigs.MPC_NEO.mpcUtils import MpcEphem, EphemLine
+except ImportError:  # the MPC NEO module needs photometrics
+    MpcEphem = None
+
+
+class TestObservationViableMany(unittest.TestCase):
+
+    def setUp(self):
+        self.obs = ObsConstraint()
+        self.lst = self.obs.get_obs_lst()
+        rng = np.random.default_rng(0)
+        start = datetime(2025, 1, 15, 2, 0, tzinfo=pytz.UTC)
+        self.dts = [start + timedelta(minutes=float(m)) for m in rng.uniform(0, 11 * 60, 200)]
+        # well inside the RA and Dec ranges, so that no target sits on the edge of the box
+        self.ras = rng.uniform(0, 360, 200).round(1) + 0.05
+        self.decs = rng.uniform(-40, 80, 200).round(1) + 0.05
+
+    def serial(self, ras, decs, ignore_night=True):
+        return np.array([self.obs.observation_viable(dt, ra, dec, current_sidereal_time=self.lst, ignore_night=ignore_night)
+                         for dt, ra, dec in zip(self.dts, ras, decs)])
+
+    def test_degrees(self):
+        expected = self.serial(self.ras, self.decs)
+        self.assertTrue(expected.any() and not expected.all())
+        many = self.obs.observation_viable_many(self.dts, self.ras, self.decs, current_sidereal_time=self.lst, ignore_night=True)
+        np.testing.assert_array_equal(many, expected)
+
+    def test_angles(self):
+        ras = [Angle(ra, unit=u.deg) for ra in self.ras]
+        decs = [Angle(dec, unit=u.deg) for dec in self.decs]
+        expected = self.serial(ras, decs)
+        for r, d in [(ras, decs), (Angle(self.ras, unit=u.deg), Angle(self.decs, unit=u.deg)),
+                     (Angle(self.ras / 15, unit=u.hourangle), decs)]:
+            many = self.obs.observation_viable_many(self.dts, r, d, current_sidereal_time=self.lst, ignore_night=True)
+            np.testing.assert_array_equal(many, expected)
+
+    def test_night(self):
+        dts, ras, decs = self.dts[:20], self.ras[:20], self.decs[:20]
+        expected = self.serial(ras, decs, ignore_night=False)
+        np.testing.assert_array_equal(self.obs.observation_viable_many(dts, ras, decs, current_sidereal_time=self.lst), expected)
+
+    @unittest.skipIf(MpcEphem is None, "MPC NEO module can't be imported")
+    def test_mpc_ephem(self):
+        # MpcEphem stores its RA and Dec as Angles, which is how the MPC observability code passes them along
+        lines = [EphemLine(dt, ra, dec, 19.0, 1 * u.arcsec / u.min, 1 * u.arcsec / u.min)
+                 for dt, ra, dec in zip(sorted(self.dts), self.ras, self.decs)]
+        ephem = MpcEphem("TEST01", lines)
+        lines = list(ephem.ephem_dict.values())
+        times = [line.start_dt for line in lines]
+        many = self.obs.observation_viable_many(times, [line.RA for line in lines], [line.Dec for line in lines],
+                                                current_sidereal_time=self.lst, ignore_night=True)
+        expected = [self.obs.observation_viable(line.start_dt, line.RA, line.Dec, current_sidereal_time=self.lst,
+                                                ignore_night=True) for line in lines]
+        np.testing.assert_array_equal(many, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
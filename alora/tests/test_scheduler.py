@@ -0,0 +1,119 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord, EarthLocation
+from astropy.time import Time
+from astroplan import FixedTarget, ObservingBlock, Observer, Transitioner, time_grid_from_range
+from astroplan.scheduling import Schedule
+
+from alora.maestro import scheduler
+from alora.maestro.scheduler import TMOScheduler, _initSearchWorker, _scheduleSearchWorker
+
+
+class _Config:
+    numObs = 1
+    maxMinutesWithoutFocus = 10000
+    minMinutesBetweenObs = None
+
+
+class _FixedScoreScheduler(TMOScheduler):
+    """TMOScheduler that takes its scores from block.configuration["scores"] instead of scoring the blocks"""
+
+    def _score_blocks(self, blocks, timeGrid):
+        return np.array([b.configuration["scores"] for b in blocks], dtype=float)
+
+
+def no_transition(oldblock, newblock, start_time, observer):
+    return None
+
+
+class TestMakeSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.start = Time("2025-03-05T03:00:00")
+        self.end = self.start + 2 * u.hour
+        self.observer = Observer(EarthLocation.from_geodetic(-117.68 * u.deg, 34.38 * u.deg, 2286 * u.m))
+        self.numSlots = len(time_grid_from_range((self.start, self.end), 60 * u.second))
+
+    def make_block(self, name, scoreStart, seconds):
+        scores = np.zeros(self.numSlots)
+        scores[scoreStart:] = 1
+        return ObservingBlock(FixedTarget(SkyCoord(ra=10 * u.deg, dec=20 * u.deg), name=name), seconds * u.second, 0,
+                              configuration={"object": name, "type": "A", "scores": scores})
+
+    def minutes(self, t):
+        return (t - self.start).to(u.minute).value
+
+    def schedule(self, blocks, excludedTimeRanges=()):
+        scheduler = _FixedScoreScheduler({}, {"A": _Config()}, 0, transitioner_dict={"A": no_transition}, constraints=[],
+                                         observer=self.observer, transitioner=Transitioner(None, {'object': {"default": None}}),
+                                         time_resolution=60 * u.second, gap_time=1 * u.minute, last_focus_time=self.start)
+        schedule = Schedule(self.start, self.end)
+        scheduler(blocks, list(excludedTimeRanges), schedule)
+        return sorted(schedule.observing_blocks, key=lambda b: b.start_time)
+
+    def test_blocks_over_whole_slots_dont_overlap(self):
+        # the first block runs from the start of slot 10 to 20 seconds into slot 15. the second can't start until slot 15,
+        # where it would overlap the tail of the first block if that slot weren't counted as taken
+        first = self.make_block("first", 10, 5 * 60 + 20)
+        second = self.make_block("second", 15, 5 * 60 + 20)
+        placed = self.schedule({1: [first], 2: [second]})
+        self.assertEqual([b.target.name for b in placed], ["first", "second"])
+        self.assertLessEqual(placed[0].end_time, placed[1].start_time)
+        self.assertAlmostEqual(self.minutes(placed[1].start_time), 16)
+
+    def test_partly_excluded_slot(self):
+        # an excluded range that ends partway through slot 15 excludes that slot
+        block = self.make_block("block", 10, 60)
+        excluded = [(self.start.unix + 10 * 60, self.start.unix + 15 * 60 + 30)]
+        placed = self.schedule({1: [block]}, excluded)
+        self.assertAlmostEqual(self.minutes(placed[0].start_time), 16)
+
+
+class _Candidate:
+    def __init__(self, name):
+        self.CandidateName = name
+        self.Priority = 1
+
+
+class TestSearchWorker(unittest.TestCase):
+
+    def tearDown(self):
+        scheduler._searchState.clear()
+
+    def test_spawned_worker_selects_the_parents_candidates(self):
+        # a spawned worker can't be sent the parent's candidates, so it selects them itself, once, and drops any the parent
+        # didn't have
+        configDict = {"A": _Config()}
+        with mock.patch.object(scheduler, "loadSchedulingConfigs", return_value={"A": configDict["A"], "B": _Config()}), \
+                mock.patch.object(scheduler, "gatherCandidates", return_value=[_Candidate("a"), _Candidate("new")]) as gather:
+            _initSearchWorker(None, None, ("start", "end", "db", [], ["A"], {"a", "b"}))
+        gather.assert_called_once_with(configDict, "start", "end", "db", [])
+        self.assertEqual(scheduler._searchState["configDict"], configDict)
+        self.assertEqual([c.CandidateName for c in scheduler._searchState["candidates"]], ["a"])
+
+    def test_failed_setup_fails_the_runs(self):
+        with mock.patch.object(scheduler, "loadSchedulingConfigs", side_effect=FileNotFoundError("observable.csv")):
+            _initSearchWorker(None, None, ("start", "end", "db", [], ["A"], set()))
+        with self.assertRaisesRegex(RuntimeError, "observable.csv"):
+            _scheduleSearchWorker({"seed": 1})
+
+    def test_runs_schedule_copies_of_the_shared_candidates(self):
+        configDict, candidates = {"A": _Config()}, [_Candidate("a")]
+        _initSearchWorker(configDict, candidates, None)
+        job = {"observer": None, "startTime": None, "endTime": None, "blacklist": [], "whitelist": [],
+               "excludedTimeRanges": [], "candidateDbPath": "db", "temperature": 0, "seed": 1, "annealSeconds": None}
+        with mock.patch.object(scheduler, "createSchedule", side_effect=SystemExit) as createSchedule:
+            for _ in range(2):
+                with self.assertRaises(RuntimeError):
+                    _scheduleSearchWorker(job)
+        for call in createSchedule.call_args_list:
+            self.assertIs(call.kwargs["configDict"], configDict)
+            self.assertEqual([c.CandidateName for c in call.kwargs["candidates"]], ["a"])
+            self.assertIsNot(call.kwargs["candidates"][0], candidates[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import tempfile
+import types
+import unittest
+
+import numpy as np
+import astropy.units as u
+from astropy.coordinates import SkyCoord
+from astropy.time import Time
+from astropy.utils import iers
+from astroplan import Observer, FixedTarget, ObservingBlock, TimeConstraint, AltitudeConstraint, AirmassConstraint, \
+    time_grid_from_range
+
+from alora.maestro.scheduleLib.candidateDatabase import BaseCandidate
+from alora.maestro.scheduleLib.scoring import block_constraint_scores, candidate_fingerprint, module_config_fingerprint, \
+    ScoreCache
+
+iers.conf.auto_download = False
+
+
+class TestBlockConstraintScores(unittest.TestCase):
+
+    def setUp(self):
+        self.observer = Observer(longitude=-117.68 * u.deg, latitude=34.38 * u.deg, elevation=2286 * u.m)
+        start = Time("2025-03-05T03:00:00")
+        self.times = time_grid_from_range((start, start + 8 * u.hour), 5 * u.minute)
+        rng = np.random.default_rng(0)
+        altitude = AltitudeConstraint(min=20 * u.deg)  # shared between blocks, like the modules' constraints
+        airmass = AirmassConstraint(max=2.5, boolean_constraint=False)
+        self.blocks = []
+        for i in range(30):
+            target = FixedTarget(SkyCoord(ra=rng.uniform(0, 360) * u.deg, dec=rng.uniform(-30, 80) * u.deg), name=f"t{i}")
+            lo = start + rng.uniform(-1, 4) * u.hour
+            window = TimeConstraint(None if i % 5 == 0 else lo, None if i % 5 == 1 else lo + rng.uniform(0.5, 6) * u.hour)
+            constraints = [[window, altitude], [window, airmass, altitude], [altitude], None][i % 4]
+            self.blocks.append(ObservingBlock(target, 300 * u.second, 0, constraints=constraints))
+
+    def serial_scores(self):
+        # the per-block loop that block_constraint_scores replaces
+        scoreArray = np.ones((len(self.blocks), len(self.times)))
+        for i, block in enumerate(self.blocks):
+            if block.constraints:
+                for constraint in block.constraints:
+                    scoreArray[i] *= constraint(self.observer, block.target, times=self.times)
+        return scoreArray
+
+    def test_matches_serial(self):
+        vectorized = block_constraint_scores(self.observer, self.blocks, self.times)
+        np.testing.assert_array_equal(vectorized, self.serial_scores())
+
+    def test_no_blocks(self):
+        self.assertEqual(block_constraint_scores(self.observer, [], self.times).shape, (0, len(self.times)))
+
+
+class TestScoreCache(unittest.TestCase):
+
+    def setUp(self):
+        self.moduleDir = tempfile.TemporaryDirectory()
+        self.configPath = os.path.join(self.moduleDir.name, "config.toml")
+        with open(self.configPath, "w") as f:
+            f.write("downtime_after_obs = 1\n")
+        # stands in for a scheduling module: its config object's class lives in a module next to its config.toml
+        module = types.ModuleType("fake_schedule_module")
+        module.__file__ = os.path.join(self.moduleDir.name, "schedule_Fake.py")
+        sys.modules[module.__name__] = module
+        self.configType = type("FakeConfig", (), {"__module__": module.__name__})
+        self.candidate = BaseCandidate("Target", "Fake", RA=10.0, Dec=20.0)
+
+    def tearDown(self):
+        del sys.modules["fake_schedule_module"]
+        self.moduleDir.cleanup()
+
+    def test_key_changes_with_module_config(self):
+        before = candidate_fingerprint(self.candidate, module_config_fingerprint(self.configType()))
+        self.assertEqual(before, candidate_fingerprint(self.candidate, module_config_fingerprint(self.configType())))
+        with open(self.configPath, "w") as f:
+            f.write("downtime_after_obs = 5\n")
+        self.assertNotEqual(before, candidate_fingerprint(self.candidate, module_config_fingerprint(self.configType())))
+
+    def test_save_load(self):
+        cache = ScoreCache()
+        cache.validate(1 * u.minute)
+        start = Time("2025-03-05T03:00:00")
+        row = np.zeros(60)
+        row[10:30] = np.linspace(0.1, 1, 20)
+        cache.put("key", start, row)
+        path = os.path.join(self.moduleDir.name, "scoreCache.npz")
+        cache.save(path)
+        loaded = ScoreCache.load(path)
+        loaded.validate(1 * u.minute)
+        np.testing.assert_array_equal(loaded.get("key", start + 5 * u.minute, 50), row[5:55])
+        self.assertIsNone(loaded.get("key", start + 30 * u.second, 50))  # off the grid the row was computed on
+        loaded.validate(2 * u.minute)
+        self.assertEqual(len(loaded), 0)
+
+    def test_load_other_format(self):
+        # e.g. a cache from before rows were stored as spans
+        path = os.path.join(self.moduleDir.name, "scoreCache.npz")
+        np.savez_compressed(path, keys=np.array(["key"]), starts=np.array([0.0]), meta=np.array([60.0, 0.1]),
+                            row0=np.zeros(60))
+        with self.assertRaisesRegex(ValueError, "isn't a score cache"):
+            ScoreCache.load(path)
+
+
+if __name__ == '__main__':
+    unittest.main()